@@ -0,0 +1,106 @@
+"""
+    MP3Tool
+
+    bench_dsp.py: Compare the pydub and NumPy (DSP) processing chains,
+    and the speed changes
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import sys
+import timeit
+import numpy as np
+from pydub import AudioSegment
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common import DSP
+from common import Utils
+
+
+def makeSound(seconds=30, frame_rate=44100, channels=2, seed=0):
+    """Noise shaped like music, as a pydub sound object"""
+    rng = np.random.default_rng(seed)
+    samples = rng.normal(0, 4000, (seconds * frame_rate, channels))
+    return AudioSegment(data=np.clip(samples, -32768, 32767).astype(np.int16).tobytes(),
+                        sample_width=2, frame_rate=frame_rate, channels=channels)
+
+
+def pydubChain(sound, other, fade_time):
+    # The processing MP3Tool did with pydub: reverse, fades, level and mix
+    sound = sound.reverse().fade_in(fade_time).fade_out(fade_time)
+    sound = Utils.soundSetToTargetLevel(sound, -20)
+    other = Utils.soundSetToTargetLevel(other, -20)
+    return sound.overlay(other)
+
+
+def dspChain(sound, other, fade_time):
+    # The same processing on NumPy arrays, converted back to pydub once
+    mixed = DSP.Sound.fromSegment(sound).reverse().fadeIn(fade_time).fadeOut(
+        fade_time).setToTargetLevel(-20)
+    return mixed.overlay(DSP.Sound.fromSegment(other).setToTargetLevel(-20)).toSegment()
+
+
+def pydubSpeedChange(sound, speed):
+    # The speed change Utils.changeSongSpeed did, resampled by audioop.ratecv
+    return sound._spawn(sound.raw_data, overrides={
+        "frame_rate": int(sound.frame_rate * speed)}).set_frame_rate(sound.frame_rate)
+
+
+def dspSpeedChange(sound, speed):
+    # The same speed change with the DSP resampler
+    return DSP.Sound.fromSegment(sound).changeSpeed(speed).toSegment()
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    sound = makeSound(seed=1)
+    other = makeSound(seed=2)
+    fade_time = 2000
+
+    pydub_time = min(timeit.repeat(lambda: pydubChain(sound, other, fade_time),
+                                   number=1, repeat=repeat))
+    dsp_time = min(timeit.repeat(lambda: dspChain(sound, other, fade_time),
+                                 number=1, repeat=repeat))
+
+    # pydub's reverse swaps the channels of stereo sound, so compare with
+    # pydub run on the channel swapped sound. pydub fades step once per
+    # millisecond, DSP once per sample, so small differences are expected
+    swapped = sound._spawn(np.frombuffer(sound.raw_data, np.int16).reshape(
+        -1, 2)[:, ::-1].tobytes())
+    reference = np.frombuffer(pydubChain(swapped, other, fade_time).raw_data, np.int16)
+    result = np.frombuffer(dspChain(sound, other, fade_time).raw_data, np.int16)
+    difference = np.abs(reference.astype(np.int32) - result).max()
+
+    print("30s stereo 44.1k clip: reverse, fade in/out, set level, overlay")
+    print(f"pydub:\t\t{pydub_time * 1000:8.1f} ms")
+    print(f"DSP:\t\t{dsp_time * 1000:8.1f} ms")
+    print(f"Speedup:\t{pydub_time / dsp_time:8.1f}x")
+    print(f"Max sample difference: {difference}")
+
+    print("\n30s stereo 44.1k clip: speed change")
+    print("Speed\tratecv\t\tDSP\t\tSpeedup")
+    for speed in (0.5, 0.8, 1.25, 1.5, 2.0):
+        pydub_time = min(timeit.repeat(lambda: pydubSpeedChange(sound, speed),
+                                       number=1, repeat=repeat))
+        dsp_time = min(timeit.repeat(lambda: dspSpeedChange(sound, speed),
+                                     number=1, repeat=repeat))
+        print(f"{speed}\t{pydub_time * 1000:8.1f} ms\t{dsp_time * 1000:8.1f} ms\t"
+              f"{pydub_time / dsp_time:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
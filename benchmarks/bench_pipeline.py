@@ -0,0 +1,241 @@
+"""
+    MP3Tool
+
+    bench_pipeline.py: Time each stage of creating clips, on a synthetic corpus
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from common import AudioIO
+from common import DSP
+from common import Encoders
+from common import Probe
+from common import Utils
+import corpus
+
+# Tags written with each clip, as MP3Tool.mediaTags gives
+CLIP_TAGS = {'title': "Benchmark by MP3Tool: Clip - Intro", 'artist': "MP3Tool"}
+
+# Part of each file clips are taken from, in milliseconds
+CLIP_START_MS = 30000
+CLIP_END_MS = 60000
+FADE_MS = 2000
+
+
+class Pipeline:
+    """
+    The stages of creating clips, each run over the whole corpus
+
+    Each stage uses the output of the one before it, so stages are run in
+    order, but only the time of the stage itself is counted.
+    """
+
+    def __init__(self, folder, work_folder, encoder):
+        self.folder = folder
+        self.work_folder = work_folder
+        self.encoder = encoder
+        self.paths = []
+        self.sounds = []
+        self.clips = []
+        self.exported = []
+
+    def scan(self):
+        self.paths = sorted(path for path, size, mtime in Utils.scanFiles("*.mp3", self.folder))
+
+    def find(self):
+        Utils.findFiles("*.mp3", self.folder)
+
+    def probe(self):
+        for path in self.paths:
+            Probe.probeFile(path)
+
+    def decode(self):
+        self.sounds = [AudioIO.decodeWindow(path, CLIP_START_MS, CLIP_END_MS)
+                       for path in self.paths]
+
+    def process(self):
+        # Reverse, fades and level of each clip, mixed with the next one
+        clips = [DSP.Sound.fromSegment(sound).reverse().fadeIn(FADE_MS).fadeOut(
+            FADE_MS).setToTargetLevel(-20) for sound in self.sounds]
+        self.clips = [clip.copy().overlay(clips[(i + 1) % len(clips)]).toSegment()
+                      for i, clip in enumerate(clips)]
+
+    def speedChange(self):
+        for sound in self.sounds:
+            DSP.Sound.fromSegment(sound).changeSpeed(1.5).toSegment()
+
+    def timeStretch(self):
+        for sound in self.sounds:
+            DSP.Sound.fromSegment(sound).timeStretch(1.5).toSegment()
+
+    def export(self):
+        self.exported = []
+        for i, clip in enumerate(self.clips):
+            path = os.path.join(self.work_folder, f"clip{i}.mp3")
+            self.encoder.encode(clip, path, "192k", CLIP_TAGS)
+            self.exported.append(path)
+
+
+# Stages in the order they are run, and the Pipeline method running each
+STAGES = [
+    ("scan", "scan"),
+    ("find_files", "find"),
+    ("probe", "probe"),
+    ("decode", "decode"),
+    ("fades_reverse_overlay", "process"),
+    ("speed_change", "speedChange"),
+    ("time_stretch", "timeStretch"),
+    ("export", "export"),
+]
+
+
+def runStages(pipeline, repeat):
+    """
+    Time each stage
+
+    Arguments:
+    pipeline - Pipeline object
+    repeat - number of times each stage is run
+
+    Return:
+    Dictionary of stage name to times in milliseconds
+    """
+    times = {}
+    for name, method in STAGES:
+        times[name] = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            getattr(pipeline, method)()
+            times[name].append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def compare(results, baseline, tolerance, min_change_ms=5):
+    """
+    Print each stage's time against a baseline
+
+    Stages are compared by their quickest run, which varies least with
+    whatever else the machine is doing.
+
+    Arguments:
+    results - results of this run
+    baseline - results of an earlier run
+    tolerance - fraction a stage may be slower than the baseline by
+    min_change_ms - changes smaller than this are never flagged
+
+    Return:
+    List of names of stages slower than the tolerance allows
+    """
+    regressions = []
+    print(f"\n{'stage':24}{'baseline':>12}{'now':>12}{'change':>10}")
+    for name, stage in results['stages'].items():
+        if name not in baseline['stages']:
+            print(f"{name:24}{'-':>12}{stage['min_ms']:10.1f}ms")
+            continue
+        before = baseline['stages'][name]['min_ms']
+        now = stage['min_ms']
+        change = now / before - 1 if before > 0 else 0
+        flag = ""
+        if abs(now - before) >= min_change_ms:
+            if change > tolerance:
+                flag = "  SLOWER"
+                regressions.append(name)
+            elif change < -tolerance:
+                flag = "  faster"
+        print(f"{name:24}{before:10.1f}ms{now:10.1f}ms{change:+9.0%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each stage of creating clips")
+    parser.add_argument("--corpus", default=os.path.join("output", "bench", "corpus"),
+                        help="Folder of the synthetic corpus, created if needed")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Times each stage is run")
+    parser.add_argument("--output", default=os.path.join("output", "bench", "results.json"),
+                        help="File the results are written to")
+    parser.add_argument("--encoder", choices=Encoders.ENCODERS,
+                        help="MP3 encoder, lame when installed default")
+    parser.add_argument("--baseline", help="Results file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Fraction a stage may be slower than the baseline by")
+    args = parser.parse_args()
+
+    print("Corpus:\t" + args.corpus)
+    corpus.makeCorpus(args.corpus)
+    # Time decoding itself, not the decoded audio cache
+    AudioIO.setCache(None)
+
+    work_folder = os.path.join(os.path.dirname(args.output) or ".", "work")
+    os.makedirs(work_folder, exist_ok=True)
+    try:
+        encoder = Encoders.getEncoder(args.encoder)
+        times = runStages(Pipeline(args.corpus, work_folder, encoder), args.repeat)
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    results = {
+        'meta': {
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'cpus': os.cpu_count(),
+            'repeat': args.repeat,
+            'encoder': encoder.name,
+            'corpus_version': corpus.CORPUS_VERSION,
+        },
+        'stages': dict((name, {
+            'median_ms': statistics.median(runs),
+            'min_ms': min(runs),
+            'runs_ms': runs,
+        }) for name, runs in times.items()),
+    }
+
+    for name, stage in results['stages'].items():
+        print(f"{name:24}{stage['median_ms']:10.1f}ms  (min {stage['min_ms']:.1f}ms)")
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results:\t" + args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('corpus_version') != corpus.CORPUS_VERSION:
+            print("Baseline was run on another version of the corpus, times may differ.")
+        if baseline['meta'].get('encoder', encoder.name) != encoder.name:
+            print("Baseline was run with the " + baseline['meta']['encoder'] +
+                  " encoder, export times will differ.")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Slower than the baseline: " + ", ".join(regressions))
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
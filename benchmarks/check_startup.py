@@ -0,0 +1,85 @@
+"""
+    MP3Tool
+
+    check_startup.py: Check the command line starts without heavy imports
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import sys
+import argparse
+import subprocess
+
+MP3TOOL = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "mp3tool.py")
+
+# Packages only the tools themselves should import
+HEAVY_PACKAGES = ["pydub", "mutagen", "numpy", "sqlite3", "concurrent"]
+
+# Command lines that should return without running a tool
+COMMANDS = [
+    ["--help"],
+    ["-tl", "unknown_tool"],
+    ["-tl", "intro", "--duration", "not_a_number"],
+]
+
+
+def importTimes(arguments):
+    """
+    Run mp3tool.py with -X importtime
+
+    Arguments:
+    arguments - command line arguments for mp3tool.py
+
+    Return:
+    List of (cumulative microseconds, module) tuples of top level imports
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", MP3TOOL] + arguments,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        imports.append((int(cumulative_us), module.rstrip()))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check mp3tool.py startup imports")
+    parser.add_argument("--max_ms", type=float, default=150,
+                        help="Most import time allowed for each command, in ms")
+    args = parser.parse_args()
+
+    failed = False
+    for arguments in COMMANDS:
+        imports = importTimes(arguments)
+        # Top level imports are those not indented under another
+        total_us = sum(us for us, module in imports if not module.startswith("  "))
+        heavy = sorted(set(module.strip().split(".")[0] for us, module in imports
+                           if module.strip().split(".")[0] in HEAVY_PACKAGES))
+        ok = not heavy and total_us / 1000 <= args.max_ms
+        failed = failed or not ok
+        print(f"{'ok' if ok else 'FAIL':4}  {total_us / 1000:6.1f} ms  mp3tool.py {' '.join(arguments)}")
+        for module in heavy:
+            print(f"\timports {module}")
+
+    if failed:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+    MP3Tool
+
+    corpus.py: Synthetic MP3 corpus for the benchmarks
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import sys
+import json
+import subprocess
+
+# Files of the corpus: name, ffmpeg lavfi source, seconds, frame rate,
+# channels and encoding (CBR bitrate, or VBR quality as "q<n>"). Noise is
+# seeded, so the same corpus is made every time
+CORPUS = [
+    ("tone_cbr128", "sine=frequency=440:beep_factor=4", 180, 44100, 2, "128k"),
+    ("tone_cbr320", "sine=frequency=330", 60, 44100, 2, "320k"),
+    ("noise_vbr_q2", "anoisesrc=color=pink:seed=1:amplitude=0.3", 240, 44100, 2, "q2"),
+    ("noise_vbr_q6", "anoisesrc=color=brown:seed=2:amplitude=0.5", 120, 48000, 2, "q6"),
+    ("tone_mono_cbr64", "sine=frequency=220:beep_factor=2", 150, 22050, 1, "64k"),
+    ("noise_mono_vbr_q4", "anoisesrc=color=white:seed=3:amplitude=0.2", 90, 32000, 1, "q4"),
+]
+
+# Changing this makes existing corpora be created again
+CORPUS_VERSION = 1
+
+
+def encodeArguments(encoding):
+    """ffmpeg arguments for a CBR bitrate or a VBR "q<n>" quality"""
+    if encoding.startswith("q"):
+        return ["-q:a", encoding[1:]]
+    return ["-b:a", encoding]
+
+
+def makeCorpus(folder):
+    """
+    Create the corpus in a folder, unless already there
+
+    Arguments:
+    folder - folder to create the files in, subfolders are used so that
+             scanning has some depth to walk
+
+    Return:
+    List of paths to the MP3 files
+    """
+    manifest_path = os.path.join(folder, "corpus.json")
+    manifest = {'version': CORPUS_VERSION, 'files': CORPUS}
+    paths = [os.path.join(folder, ("cbr" if not spec[5].startswith("q") else "vbr"),
+                          spec[0] + ".mp3") for spec in CORPUS]
+    try:
+        with open(manifest_path) as f:
+            if json.load(f) == json.loads(json.dumps(manifest)) and \
+                    all(os.path.exists(path) for path in paths):
+                return paths
+    except (OSError, ValueError):
+        pass
+
+    for (name, source, seconds, frame_rate, channels, encoding), path in zip(CORPUS, paths):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        command = ["ffmpeg", "-nostdin", "-v", "error", "-y",
+                   "-f", "lavfi", "-i", f"{source}:sample_rate={frame_rate}:duration={seconds}",
+                   "-ac", str(channels), "-acodec", "libmp3lame"] + \
+            encodeArguments(encoding) + \
+            ["-id3v2_version", "3",
+             "-metadata", f"title={name.replace('_', ' ').title()}",
+             "-metadata", "artist=MP3Tool Benchmark",
+             "-metadata", "album=Synthetic Corpus",
+             path]
+        process = subprocess.run(command, stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            raise RuntimeError(f"Creating {path} failed: " +
+                               process.stderr.decode(errors="replace").strip())
+
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    return paths
+
+
+if __name__ == "__main__":
+    for path in makeCorpus(sys.argv[1] if len(sys.argv) > 1 else os.path.join("output", "bench", "corpus")):
+        print(path)
@@ -0,0 +1,319 @@
+"""
+    MP3Tool
+
+    AudioIO.py: Decoding and encoding of audio files through ffmpeg pipes
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import subprocess
+from pydub import AudioSegment
+from pydub.audio_segment import fix_wav_headers
+from pydub.exceptions import CouldntDecodeError
+from common import PCMCache
+from common import Trace
+
+
+# Windows closer together than this are decoded as a single span, as
+# decoding a short gap is cheaper than starting another ffmpeg process
+MERGE_GAP_MS = 10000
+
+# ffmpeg raw PCM format of each pydub sample width
+PCM_FORMATS = {
+    1: 's8',
+    2: 's16le',
+    4: 's32le',
+}
+
+# Cache of decoded windows consulted before decoding, None = no cache,
+# and the settings it was made with
+_cache = None
+_cache_settings = None
+
+# Decoded spans of files held while several clips are taken from them,
+# as absolute path: (start_ms, end_ms, frame_rate, channels, sound)
+_spans = {}
+
+
+def setCache(cache):
+    """
+    Set the cache of decoded windows
+
+    Arguments:
+    cache - PCMCache or MemoryCache object, None to decode every time
+    """
+    global _cache, _cache_settings
+    _cache = cache
+    _cache_settings = None
+
+
+def configureCache(folder, max_bytes, memory_bytes=0):
+    """
+    Set up the cache of decoded windows, keeping the current cache (and
+    its contents and statistics) if it has the same settings
+
+    Arguments:
+    folder - folder of the on-disk cache
+    max_bytes - size of the on-disk cache, 0 = no on-disk cache
+    memory_bytes - size of the in-memory cache, 0 = no in-memory cache
+    """
+    global _cache, _cache_settings
+    settings = (folder, max_bytes, memory_bytes)
+    if settings == _cache_settings:
+        return
+    cache = PCMCache.PCMCache(folder, max_bytes) if max_bytes > 0 else None
+    if memory_bytes > 0:
+        cache = PCMCache.MemoryCache(memory_bytes, cache)
+    _cache = cache
+    _cache_settings = settings
+
+
+def cacheStats():
+    """
+    Hit, miss and eviction counts of the decoded window cache
+
+    Return:
+    Dictionary as returned by the cache's stats, None if there is no cache
+    """
+    return _cache.stats() if _cache is not None else None
+
+
+def holdSpan(path, start_ms=0, end_ms=None, frame_rate=None, channels=None):
+    """
+    Decode a span of a file and keep it, so windows within it are sliced
+    from it rather than decoded, until released
+
+    Arguments:
+    path - path to audio file
+    start_ms - start of the span in milliseconds
+    end_ms - end of the span in milliseconds, None = end of file
+    frame_rate - frame rate to decode to, None = the file's
+    channels - number of channels to decode to, None = the file's
+    """
+    sound = decodeWindow(path, start_ms, end_ms, frame_rate, channels)
+    _spans[os.path.abspath(path)] = (start_ms, end_ms, frame_rate, channels, sound)
+
+
+def releaseSpan(path):
+    """
+    Stop holding the span of a file decoded by holdSpan
+
+    Arguments:
+    path - path to audio file
+    """
+    _spans.pop(os.path.abspath(path), None)
+
+
+def heldWindow(path, start_ms, end_ms, frame_rate=None, channels=None):
+    """
+    Slice a window from the span held for a file
+
+    Arguments:
+    path - path to audio file
+    start_ms - start of the window in milliseconds
+    end_ms - end of the window in milliseconds, None = end of file
+    frame_rate - frame rate decoded to, None = the file's
+    channels - number of channels decoded to, None = the file's
+
+    Return:
+    pydub sound object, None if no held span covers the window
+    """
+    span = _spans.get(os.path.abspath(path))
+    if span is None:
+        return None
+    span_start, span_end, span_rate, span_channels, sound = span
+    if start_ms < span_start or (span_rate, span_channels) != (frame_rate, channels):
+        return None
+    if end_ms is None:
+        return sound[start_ms - span_start:] if span_end is None else None
+    if span_end is not None and end_ms > span_end:
+        return None
+    return sound[start_ms - span_start:end_ms - span_start]
+
+
+def mergeWindows(windows, max_gap=MERGE_GAP_MS):
+    """
+    Merge time windows into the spans that need decoding
+
+    Arguments:
+    windows - list of (start_ms, end_ms) tuples, end_ms None = end of file
+    max_gap - windows separated by less than this are merged
+
+    Return:
+    Sorted list of (start_ms, end_ms) spans covering all windows
+    """
+    spans = []
+    for start, end in sorted(windows, key=lambda w: w[0]):
+        if spans:
+            last_start, last_end = spans[-1]
+            if last_end is None:
+                continue
+            if start <= last_end + max_gap:
+                if end is None or end > last_end:
+                    spans[-1] = (last_start, end)
+                continue
+        spans.append((start, end))
+    return spans
+
+
+@Trace.traced
+def decodeWindow(path, start_ms=0, end_ms=None, frame_rate=None, channels=None):
+    """
+    Decode a time window of an audio file
+
+    ffmpeg is asked to seek before decoding starts, so only the
+    requested window (plus at most one frame) is ever decoded. Windows
+    already in the decoded window cache, or within a span held by
+    holdSpan, are not decoded again.
+
+    Arguments:
+    path - path to audio file
+    start_ms - start of the window in milliseconds
+    end_ms - end of the window in milliseconds, None = end of file
+    frame_rate - frame rate to decode to, None = the file's
+    channels - number of channels to decode to, None = the file's
+
+    Return:
+    pydub sound object holding the window
+    """
+    if _spans:
+        sound = heldWindow(path, start_ms, end_ms, frame_rate, channels)
+        if sound is not None:
+            return sound
+
+    key = None
+    if _cache is not None:
+        key = _cache.key(path, start_ms, end_ms, frame_rate, channels)
+        sound = _cache.get(key)
+        if sound is not None:
+            return sound
+
+    conversion_command = [AudioSegment.converter, '-nostdin', '-v', 'error']
+    if start_ms > 0:
+        conversion_command += ['-ss', '%.3f' % (start_ms / 1000)]
+    if end_ms is not None:
+        conversion_command += ['-t', '%.3f' % ((end_ms - start_ms) / 1000)]
+    conversion_command += ['-i', path, '-vn', '-acodec', 'pcm_s16le']
+    if frame_rate is not None:
+        conversion_command += ['-ar', str(frame_rate)]
+    if channels is not None:
+        conversion_command += ['-ac', str(channels)]
+    conversion_command += ['-f', 'wav', '-']
+
+    p = subprocess.Popen(conversion_command, stdin=subprocess.DEVNULL,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    p_out, p_err = p.communicate()
+    if p.returncode != 0 or len(p_out) == 0:
+        raise CouldntDecodeError(
+            "Decoding failed. ffmpeg returned error code: {0}\n\n{1}".format(
+                p.returncode, p_err.decode(errors='ignore')))
+
+    p_out = bytearray(p_out)
+    fix_wav_headers(p_out)
+    sound = AudioSegment(bytes(p_out))
+    if key is not None:
+        _cache.put(key, sound)
+    return sound
+
+
+@Trace.traced
+def decodeWindows(path, windows, max_gap=MERGE_GAP_MS, frame_rate=None, channels=None):
+    """
+    Decode several time windows of an audio file
+
+    Overlapping or nearby windows are decoded once as their union, then
+    sliced, so each part of the file is decoded at most once.
+
+    Arguments:
+    path - path to audio file
+    windows - list of (start_ms, end_ms) tuples, end_ms None = end of file,
+              a window of None is not decoded
+    max_gap - windows separated by less than this are decoded together
+    frame_rate - frame rate to decode to, None = the file's
+    channels - number of channels to decode to, None = the file's
+
+    Return:
+    List of pydub sound objects (None for None windows), in window order
+    """
+    decoded = []
+    for span_start, span_end in mergeWindows(
+            [w for w in windows if w is not None], max_gap):
+        decoded.append((span_start, span_end,
+                        decodeWindow(path, span_start, span_end, frame_rate, channels)))
+
+    result = []
+    for window in windows:
+        if window is None:
+            result.append(None)
+            continue
+        start, end = window
+        for span_start, span_end, audio in decoded:
+            if start >= span_start and (span_end is None or
+                                        (end is not None and end <= span_end)):
+                if end is None:
+                    result.append(audio[start - span_start:])
+                else:
+                    result.append(audio[start - span_start:end - span_start])
+                break
+    return result
+
+
+@Trace.traced
+def encodeFile(sound, path, bitrate=None, tags=None, quality=None, vbr=None,
+               frame_rate=None, codec="libmp3lame", container="mp3"):
+    """
+    Encode a sound object to an MP3 file, or another format ffmpeg writes
+
+    The samples are piped to ffmpeg, which writes the output file
+    directly, so no temporary files are written. Tags are written by
+    ffmpeg with the audio, so the file is written only once.
+
+    Arguments:
+    sound - pydub sound object
+    path - path of the MP3 file to write
+    bitrate - bitrate in bps (int or str), None = ffmpeg's default
+    tags - dictionary of ID3 tags, e.g. {'title': ..., 'artist': ...}
+    quality - LAME algorithm quality, 0 = best to 9 = fastest, None = LAME's default
+    vbr - LAME VBR quality, 0 = best to 9 = smallest, None = constant bitrate
+    frame_rate - frame rate of the file, None = that of the sound
+    codec - ffmpeg audio encoder, e.g. "libopus"
+    container - ffmpeg output format, e.g. "ogg"
+    """
+    conversion_command = [AudioSegment.converter, '-nostdin', '-v', 'error', '-y',
+                          '-f', PCM_FORMATS[sound.sample_width],
+                          '-ar', str(sound.frame_rate),
+                          '-ac', str(sound.channels),
+                          '-i', 'pipe:0',
+                          '-acodec', codec]
+    if frame_rate is not None:
+        conversion_command += ['-ar', str(frame_rate)]
+    if vbr is not None:
+        conversion_command += ['-q:a', str(vbr)]
+    elif bitrate is not None:
+        conversion_command += ['-b:a', str(bitrate)]
+    if quality is not None:
+        conversion_command += ['-compression_level', str(quality)]
+    for key, value in (tags or {}).items():
+        conversion_command += ['-metadata', f"{key}={value}"]
+    conversion_command += ['-f', container, path]
+
+    p = subprocess.Popen(conversion_command, stdin=subprocess.PIPE,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    p_out, p_err = p.communicate(input=sound.raw_data)
+    if p.returncode != 0:
+        raise RuntimeError("Encoding failed. ffmpeg returned error code: {0}\n\n{1}".format(
+            p.returncode, p_err.decode(errors='ignore')))
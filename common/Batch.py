@@ -0,0 +1,193 @@
+"""
+    MP3Tool
+
+    Batch.py: Create many clips in parallel across a pool of processes
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from common import AudioIO
+from common import Errors
+from common import Trace
+from common.MP3Tool import MP3Tool
+from common.MP3ToolOptions import MP3ToolOptions
+from common.MP3ToolOptions import color
+
+
+# Tools that can be run in a batch, and the MP3Tool method running each
+TOOLS = {
+    "reverse": "songReverse",
+    "intro": "songIntro",
+    "speed_change": "songSpeedChange",
+    "mix": "songMix",
+}
+
+
+def optionValues(options):
+    """
+    Take a copy of the options that can be passed to another process
+
+    Arguments:
+    options - MP3ToolOptions class
+
+    Return:
+    Dictionary of option name to value
+    """
+    values = {}
+    for klass in reversed(options.__mro__):
+        for name, value in vars(klass).items():
+            if not name.startswith("_") and isinstance(value, (str, int, float, bool, type(None))):
+                values[name] = value
+    return values
+
+
+def runJob(tool, values):
+    """
+    Run one tool, in a worker process
+
+    The job gets its own subclass of MP3ToolOptions, so options set while
+    running it do not leak into the next job run by the same process.
+    What the tool reports is kept rather than printed, and a tool giving
+    up is recorded as a failure.
+
+    Arguments:
+    tool - name of the tool
+    values - option values, as returned by optionValues
+
+    Return:
+    Dictionary with tool, song, outputs, error, seconds, cache, log and
+    the job's trace events when tracing
+    """
+    options = type("MP3ToolOptions", (MP3ToolOptions,), dict(values))
+    result = {'tool': tool, 'song': values.get('song'),
+              'outputs': [], 'error': None}
+    log = []
+    if values.get('trace_json'):
+        Trace.enable()
+    start = time.perf_counter()
+    # The worker's cache outlives the job, so count the job's own lookups
+    stats = AudioIO.cacheStats()
+    try:
+        outputs = getattr(MP3Tool(options, aReport=log.append), TOOLS[tool])()
+        result['outputs'] = outputs or []
+    except Errors.ClipError as e:
+        result['error'] = e.message if e.details is None else f"{e.message} {e.details}"
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - start
+    result['cache'] = AudioIO.cacheStats()
+    if result['cache'] is not None and stats is not None:
+        result['cache'] = dict((name, result['cache'][name] - stats[name])
+                               for name in ('hits', 'misses', 'evictions'))
+    result['log'] = "".join(line + "\n" for line in log)
+    result['trace'] = Trace.take()
+    return result
+
+
+def planJobs(mp3Tool, options):
+    """
+    Work out the jobs of a batch
+
+    Arguments:
+    mp3Tool - MP3Tool object, for its catalog
+    options - MP3ToolOptions class
+
+    Return:
+    List of (tool, option values) tuples
+    """
+    tools = [tool.strip() for tool in options.batch_tools.split(",") if tool.strip()]
+    for tool in tools:
+        if tool not in TOOLS:
+            raise Errors.OptionError(
+                "Unknown batch tool: " + tool + ", must be one of: " + ", ".join(TOOLS))
+
+    if options.batch_songs:
+        songs = [(options.source_folder or "") + song for song in options.batch_songs]
+    else:
+        songs = mp3Tool.catalog.randomTracks(
+            options.source_folder, options.batch_count, options.rescan,
+            options.pick_max_files, options.pick_max_seconds)
+        if len(songs) < options.batch_count:
+            print(f"Only {len(songs)} MP3s found in source folder.")
+    if len(songs) == 0:
+        raise Errors.SongError("No MP3s to process, aborted.")
+
+    values = optionValues(options)
+    # Each job names its output after its own song
+    values['custom_output_file'] = None
+    jobs = []
+    for song in songs:
+        for tool in tools:
+            job_values = dict(values)
+            if tool != "mix":
+                job_values['song'] = song
+                job_values['source_folder'] = ""
+            jobs.append((tool, job_values))
+    return jobs
+
+
+def runBatch(mp3Tool, options):
+    """
+    Run a batch of tools over many songs, in parallel
+
+    Arguments:
+    mp3Tool - MP3Tool object
+    options - MP3ToolOptions class
+
+    Return:
+    List of job results, as returned by runJob
+    """
+    print(color.BOLD + color.GREEN +
+          "Create a batch of clips." + color.END + "\n")
+    jobs = planJobs(mp3Tool, options)
+    workers = options.workers or os.cpu_count()
+    print("Jobs:\t\t" + color.BOLD + f"{len(jobs)}" + color.END)
+    print("Workers:\t" + color.BOLD + f"{workers}" + color.END + "\n")
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(runJob, tool, values) for tool, values in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            Trace.extend(result['trace'])
+            song = os.path.basename(result['song'] or "random")
+            if result['error'] is None:
+                print(color.GREEN + "[ OK ] " + color.END +
+                      f"{result['tool']}\t{song}\t({result['seconds']:.1f}s)")
+                for output in result['outputs']:
+                    print("\t" + color.BOLD + output + color.END)
+            else:
+                print(color.RED + "[FAIL] " + color.END +
+                      f"{result['tool']}\t{song}\t{result['error']}")
+    elapsed = time.perf_counter() - start
+
+    clips = sum(len(result['outputs']) for result in results)
+    failed = sum(1 for result in results if result['error'] is not None)
+    print("\nJobs:\t\t" + color.BOLD + f"{len(results) - failed} done, {failed} failed" + color.END)
+    print("Clips:\t\t" + color.BOLD + f"{clips} in {elapsed:.1f} seconds" + color.END)
+    print("Throughput:\t" + color.BOLD +
+          f"{clips / elapsed if elapsed > 0 else 0:.2f} clips/sec" + color.END)
+    stats = [result['cache'] for result in results if result['cache'] is not None]
+    if stats:
+        print("Decode Cache:\t" + color.BOLD +
+              f"{sum(s['hits'] for s in stats)} hits, "
+              f"{sum(s['misses'] for s in stats)} misses" + color.END)
+    return results
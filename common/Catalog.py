@@ -0,0 +1,304 @@
+"""
+    MP3Tool
+
+    Catalog.py: Persistent catalog of the music library
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import time
+import random
+import sqlite3
+import threading
+import numpy as np
+from common import Loudness
+from common import Probe
+from common import Trace
+from common import Utils
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tracks (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    probed INTEGER NOT NULL DEFAULT 0,
+    duration REAL,
+    bit_rate INTEGER,
+    sample_rate INTEGER,
+    channels INTEGER,
+    tagged INTEGER,
+    title TEXT,
+    artist TEXT
+);
+CREATE TABLE IF NOT EXISTS loudness (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    block_ms INTEGER NOT NULL,
+    blocks BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scans (
+    folder TEXT PRIMARY KEY,
+    scanned REAL NOT NULL
+);
+'''
+
+INFO_COLUMNS = ('duration', 'bit_rate', 'sample_rate', 'channels',
+                'tagged', 'title', 'artist')
+
+
+class Catalog:
+    """
+    SQLite catalog of the MP3s in the source folders
+
+    Files are keyed by path, size and modification time. A folder is only
+    walked when it has not been scanned for max_age seconds, and a file is
+    only probed again when its size or modification time has changed.
+    Folder listings and file details are also kept in memory, so a long
+    running process only reads them from the database once. A catalog can
+    be shared between threads.
+    """
+
+    def __init__(self, path, max_age=86400, workers=Utils.SCAN_WORKERS):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        self.max_age = max_age
+        self.workers = workers
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.RLock()
+        # Folder prefix to list of paths, and path to (size, mtime, info)
+        # and to (size, mtime, loudness blocks)
+        self.tracks = {}
+        self.infos = {}
+        self.loudness = {}
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def _prefix(self, folder):
+        # Normalised folder path, ending with a separator
+        return os.path.join(os.path.abspath(folder), "")
+
+    def _bounds(self, prefix):
+        # Range of the paths starting with a prefix, as a range query can
+        # use the index on path where comparing a substring cannot
+        return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    @Trace.traced
+    def scan(self, folder, pattern='*.mp3'):
+        """
+        Walk a folder and record its files, keeping probe results of
+        files that are unchanged
+
+        Arguments:
+        folder - folder to scan
+        pattern - file pattern
+        """
+        prefix = self._prefix(folder)
+        with self.lock:
+            known = dict(((row[0], (row[1], row[2])) for row in self.db.execute(
+                "SELECT path, size, mtime FROM tracks WHERE path >= ? AND path < ?",
+                self._bounds(prefix))))
+
+            with self.db:
+                for path, size, mtime in Utils.scanFiles(pattern, prefix, self.workers):
+                    if known.pop(path, None) != (size, mtime):
+                        self.db.execute(
+                            "INSERT OR REPLACE INTO tracks (path, size, mtime) VALUES (?, ?, ?)",
+                            (path, size, mtime))
+                self.db.executemany("DELETE FROM tracks WHERE path = ?",
+                                    [(path,) for path in known])
+                self.db.execute("INSERT OR REPLACE INTO scans (folder, scanned) VALUES (?, ?)",
+                                (prefix, time.time()))
+            # Listings of this folder, or of folders in or above it, are stale
+            self.tracks.clear()
+
+    def needsScan(self, folder, rescan=False):
+        """
+        Tell whether a folder is due a scan: if forced, never scanned or
+        last scanned too long ago
+
+        Arguments:
+        folder - folder to check
+        rescan - force a scan
+
+        Return:
+        True if the folder should be scanned
+        """
+        prefix = self._prefix(folder)
+        with self.lock:
+            row = self.db.execute("SELECT scanned FROM scans WHERE folder = ?",
+                                  (prefix,)).fetchone()
+        return rescan or row is None or time.time() - row[0] > self.max_age
+
+    def ensureScanned(self, folder, rescan=False):
+        """
+        Scan a folder if it is due a scan, see needsScan
+
+        Arguments:
+        folder - folder to scan
+        rescan - force a scan
+        """
+        with self.lock:
+            if self.needsScan(folder, rescan):
+                self.scan(folder)
+
+    @Trace.traced
+    def listTracks(self, folder, rescan=False):
+        """
+        List the files catalogued under a folder
+
+        Arguments:
+        folder - folder to list
+        rescan - force a scan of the folder first
+
+        Return:
+        List of file paths
+        """
+        prefix = self._prefix(folder)
+        with self.lock:
+            self.ensureScanned(folder, rescan)
+            if prefix not in self.tracks:
+                self.tracks[prefix] = [row[0] for row in self.db.execute(
+                    "SELECT path FROM tracks WHERE path >= ? AND path < ?",
+                    self._bounds(prefix))]
+            return list(self.tracks[prefix])
+
+    @Trace.traced
+    def randomTracks(self, folder, count, rescan=False, max_files=None, max_seconds=None):
+        """
+        Pick random files from a folder, skipping files that have gone
+
+        Arguments:
+        folder - folder to pick from
+        count - number of files to pick
+        rescan - force a scan of the folder first
+        max_files, max_seconds - when the folder is due a scan, pick from
+                                 the files found within this budget instead,
+                                 leaving the catalog as it is
+
+        Return:
+        List of file paths, fewer than count if the folder has too few files
+        """
+        if (max_files or max_seconds) and self.needsScan(folder, rescan):
+            return Utils.sampleFiles('*.mp3', folder, count, max_files,
+                                     max_seconds, self.workers)
+        candidates = self.listTracks(folder, rescan)
+        picked = []
+        gone = []
+        while len(picked) < count and candidates:
+            # Swap the chosen file out of the remaining candidates
+            i = random.randrange(len(candidates))
+            candidates[i], candidates[-1] = candidates[-1], candidates[i]
+            path = candidates.pop()
+            if os.path.exists(path):
+                picked.append(path)
+            else:
+                gone.append(path)
+
+        if gone:
+            with self.lock:
+                with self.db:
+                    self.db.executemany("DELETE FROM tracks WHERE path = ?",
+                                        [(path,) for path in gone])
+                self.tracks.clear()
+        return picked
+
+    @Trace.traced
+    def getInfo(self, path):
+        """
+        Get the audio properties and tags of a file, probing it only if it
+        is new or has changed since it was last probed
+
+        Arguments:
+        path - path to audio file
+
+        Return:
+        Dictionary as returned by Probe.probeFile
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self.lock:
+            cached = self.infos.get(path)
+            if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+                return cached[2]
+            row = self.db.execute(
+                "SELECT size, mtime, probed, " + ", ".join(INFO_COLUMNS) +
+                " FROM tracks WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns and row[2]:
+            info = dict(zip(INFO_COLUMNS, row[3:]))
+            info['tagged'] = bool(info['tagged'])
+        else:
+            info = Probe.probeFile(path)
+            with self.lock:
+                with self.db:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO tracks (path, size, mtime, probed, " +
+                        ", ".join(INFO_COLUMNS) + ") VALUES (?, ?, ?, 1, " +
+                        ", ".join("?" * len(INFO_COLUMNS)) + ")",
+                        (path, st.st_size, st.st_mtime_ns) +
+                        tuple(info[column] for column in INFO_COLUMNS))
+
+        with self.lock:
+            self.infos[path] = (st.st_size, st.st_mtime_ns, info)
+        return info
+
+    @Trace.traced
+    def getLoudness(self, path, analyse=False):
+        """
+        Get the loudness of each block of a file, as stored when it was
+        last analysed
+
+        Arguments:
+        path - path to audio file
+        analyse - analyse the file if it has not been, or has changed since
+
+        Return:
+        Array as returned by Loudness.analyse, None if not analysed
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self.lock:
+            cached = self.loudness.get(path)
+            if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+                return cached[2]
+            row = self.db.execute(
+                "SELECT size, mtime, block_ms, blocks FROM loudness WHERE path = ?",
+                (path,)).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns \
+                and row[2] == Loudness.BLOCK_MS:
+            blocks = np.frombuffer(row[3], np.float32)
+        elif analyse:
+            info = self.getInfo(path)
+            blocks = Loudness.analyse(path, info['sample_rate'], info['channels'])
+            with self.lock:
+                with self.db:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO loudness (path, size, mtime, block_ms, blocks) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (path, st.st_size, st.st_mtime_ns, Loudness.BLOCK_MS, blocks.tobytes()))
+        else:
+            return None
+
+        with self.lock:
+            self.loudness[path] = (st.st_size, st.st_mtime_ns, blocks)
+        return blocks
@@ -0,0 +1,408 @@
+"""
+    MP3Tool
+
+    DSP.py: Sound processing on NumPy sample arrays
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import math
+from fractions import Fraction
+import numpy as np
+from pydub import AudioSegment
+from common import Trace
+
+
+# NumPy sample type of each supported pydub sample width
+SAMPLE_TYPES = {
+    2: np.int16,
+    4: np.int32,
+}
+
+# Resampling filter: zero crossings each side, most filter phases (the
+# rate change is rounded to a ratio needing no more) and Kaiser window beta
+RESAMPLE_TAPS = 8
+RESAMPLE_PHASES = 64
+RESAMPLE_BETA = 7.0
+
+# Frames worked on at a time by operations over a whole sound, so their
+# temporary arrays stay small however long the sound is
+CHUNK_FRAMES = 65536
+
+# Time-stretch: window length and how far from its nominal position a
+# window may be moved to line up with the previous one, in milliseconds
+STRETCH_WINDOW_MS = 50
+STRETCH_TOLERANCE_MS = 12
+
+
+def chunks(count):
+    """
+    Split frames into CHUNK_FRAMES sized parts
+
+    Arguments:
+    count - number of frames
+
+    Return:
+    Generator of slice objects, in order
+    """
+    for start in range(0, count, CHUNK_FRAMES):
+        yield slice(start, min(start + CHUNK_FRAMES, count))
+
+
+class Sound:
+    """
+    Samples of a sound as a float32 array of shape (frames, channels)
+
+    Samples keep the scale of the source sample width, so levels match
+    pydub's. Operations work on the array in place and return the Sound,
+    so they can be chained, and samples are only rounded and clipped back
+    to integers once, by toSegment.
+    """
+
+    def __init__(self, samples, frame_rate, sample_width=2):
+        self.samples = samples
+        self.frame_rate = frame_rate
+        self.sample_width = sample_width
+
+    @classmethod
+    @Trace.traced
+    def fromSegment(cls, sound):
+        """
+        Create a Sound from a pydub sound object
+
+        Arguments:
+        sound - pydub sound object
+
+        Return:
+        Sound object
+        """
+        if sound.sample_width not in SAMPLE_TYPES:
+            sound = sound.set_sample_width(2)
+        samples = np.frombuffer(sound.raw_data, dtype=SAMPLE_TYPES[sound.sample_width])
+        samples = samples.astype(np.float32).reshape(-1, sound.channels)
+        return cls(samples, sound.frame_rate, sound.sample_width)
+
+    @Trace.traced
+    def toSegment(self):
+        """
+        Convert back to a pydub sound object, saturating at full scale
+
+        Return:
+        pydub sound object
+        """
+        limit = self.maxAmplitude()
+        samples = np.empty(self.samples.shape, SAMPLE_TYPES[self.sample_width])
+        for part in chunks(len(self.samples)):
+            chunk = np.rint(self.samples[part])
+            np.clip(chunk, -limit, limit - 1, out=chunk)
+            samples[part] = chunk
+        return AudioSegment(
+            data=samples.tobytes(),
+            sample_width=self.sample_width,
+            frame_rate=self.frame_rate,
+            channels=self.channels)
+
+    def copy(self):
+        """Copy of the sound, to process it more than one way"""
+        return Sound(self.samples.copy(), self.frame_rate, self.sample_width)
+
+    @property
+    def channels(self):
+        return self.samples.shape[1]
+
+    def __len__(self):
+        """Length in milliseconds, as with pydub"""
+        return round(1000 * len(self.samples) / self.frame_rate)
+
+    def maxAmplitude(self):
+        """Full scale amplitude of the sample width"""
+        return float(1 << (8 * self.sample_width - 1))
+
+    def frames(self, ms):
+        """Number of frames in a duration in milliseconds"""
+        return int(ms * self.frame_rate / 1000)
+
+    def dBFS(self):
+        """
+        Loudness of the sound, as with pydub's dBFS
+
+        Return:
+        RMS level relative to full scale in dB, -inf when silent
+        """
+        if len(self.samples) == 0:
+            return -math.inf
+        flat = self.samples.reshape(-1)
+        rms = math.sqrt(float(np.vdot(flat, flat)) / len(flat))
+        if rms == 0:
+            return -math.inf
+        return 20 * math.log10(rms / self.maxAmplitude())
+
+    def applyGain(self, gain):
+        """
+        Change the volume
+
+        Arguments:
+        gain - gain in dB
+        """
+        self.samples *= np.float32(10 ** (gain / 20))
+        return self
+
+    @Trace.traced
+    def setToTargetLevel(self, target_level):
+        """
+        Set the volume to a target level, silence is left unchanged
+
+        Arguments:
+        target_level - target level in dBFS
+        """
+        level = self.dBFS()
+        if level != -math.inf:
+            self.applyGain(target_level - level)
+        return self
+
+    def fadeIn(self, duration):
+        """
+        Fade in, with a linear amplitude ramp as pydub's fade_in
+
+        Arguments:
+        duration - fade duration in milliseconds
+        """
+        count = min(self.frames(duration), len(self.samples))
+        for part in chunks(count):
+            ramp = np.arange(part.start, part.stop, dtype=np.float32) / np.float32(count)
+            self.samples[part] *= ramp[:, None]
+        return self
+
+    def fadeOut(self, duration):
+        """
+        Fade out, with a linear amplitude ramp as pydub's fade_out
+
+        Arguments:
+        duration - fade duration in milliseconds
+        """
+        count = min(self.frames(duration), len(self.samples))
+        start = len(self.samples) - count
+        for part in chunks(count):
+            ramp = 1 - np.arange(part.start, part.stop, dtype=np.float32) / np.float32(count)
+            self.samples[start + part.start:start + part.stop] *= ramp[:, None]
+        return self
+
+    @Trace.traced
+    def reverse(self):
+        """Reverse the sound, frame by frame so channels stay in place"""
+        # Copying whole frames as opaque items is much faster than copying
+        # a reversed 2D view. Chunks from each end are swapped in place,
+        # reading the end of the sound in reverse order, so only a chunk
+        # is copied at a time
+        frame = np.dtype((np.void, self.samples.itemsize * self.channels))
+        frames = np.ascontiguousarray(self.samples).view(frame).reshape(-1)
+        count = len(frames)
+        for part in chunks(count // 2):
+            head = frames[part][::-1].copy()
+            frames[part] = frames[count - part.stop:count - part.start][::-1]
+            frames[count - part.stop:count - part.start] = head
+        self.samples = frames.view(np.float32).reshape(-1, self.channels)
+        return self
+
+    def convert(self, frame_rate, channels):
+        """
+        Convert to another frame rate and number of channels, via pydub
+
+        Arguments:
+        frame_rate - new frame rate
+        channels - new number of channels
+        """
+        sound = self.toSegment().set_frame_rate(frame_rate).set_channels(channels)
+        self.samples = Sound.fromSegment(sound).samples
+        self.frame_rate = frame_rate
+        return self
+
+    @Trace.traced
+    def overlay(self, other):
+        """
+        Mix another sound into this one, keeping this sound's length
+
+        As with pydub, both sounds are first brought to the higher frame
+        rate and number of channels.
+
+        Arguments:
+        other - Sound to mix in
+        """
+        frame_rate = max(self.frame_rate, other.frame_rate)
+        channels = max(self.channels, other.channels)
+        if (self.frame_rate, self.channels) != (frame_rate, channels):
+            self.convert(frame_rate, channels)
+        if (other.frame_rate, other.channels) != (frame_rate, channels):
+            other = Sound(other.samples.copy(), other.frame_rate,
+                          other.sample_width).convert(frame_rate, channels)
+        count = min(len(self.samples), len(other.samples))
+        if other.sample_width != self.sample_width:
+            scale = np.float32(self.maxAmplitude() / other.maxAmplitude())
+            for part in chunks(count):
+                self.samples[part] += other.samples[part] * scale
+        else:
+            self.samples[:count] += other.samples[:count]
+        return self
+
+    @classmethod
+    @Trace.traced
+    def mix(cls, sounds, gains):
+        """
+        Mix sounds, applying each one's gain as it is added
+
+        The result is as overlaying the sounds in turn on the first after
+        applying their gains, without a separate pass over each sound to
+        change its volume.
+
+        Arguments:
+        sounds - list of Sounds, converted in place to the highest frame
+                 rate and number of channels among them
+        gains - gain of each sound in dB
+
+        Return:
+        Sound as long as the first
+        """
+        frame_rate = max(sound.frame_rate for sound in sounds)
+        channels = max(sound.channels for sound in sounds)
+        for sound in sounds:
+            if (sound.frame_rate, sound.channels) != (frame_rate, channels):
+                sound.convert(frame_rate, channels)
+        first = sounds[0]
+        samples = first.samples * np.float32(10 ** (gains[0] / 20))
+        for sound, gain in zip(sounds[1:], gains[1:]):
+            scale = np.float32(10 ** (gain / 20) * first.maxAmplitude() / sound.maxAmplitude())
+            for part in chunks(min(len(samples), len(sound.samples))):
+                samples[part] += sound.samples[part] * scale
+        return cls(samples, frame_rate, first.sample_width)
+
+    @Trace.traced
+    def resample(self, frame_rate):
+        """
+        Resample to another frame rate with a polyphase windowed sinc filter
+
+        The rate change is taken as a ratio up/down, so output frame
+        j * up + r is computed from input frames around j * down + r * down / up
+        with filter phase r. The input is viewed as rows of blocks of
+        down frames, enough of them that a block is longer than the filter,
+        and each block of output frames is then its input block and the
+        next times a matrix holding every phase, two matrix products for
+        the whole sound. When lowering the frame rate the filter cutoff is
+        lowered to match, to avoid aliasing.
+
+        Arguments:
+        frame_rate - new frame rate
+        """
+        ratio = Fraction(frame_rate / self.frame_rate).limit_denominator(RESAMPLE_PHASES)
+        if ratio.numerator > RESAMPLE_PHASES:
+            ratio = 1 / Fraction(self.frame_rate / frame_rate).limit_denominator(RESAMPLE_PHASES)
+        up, down = ratio.numerator, ratio.denominator
+        if up == down:
+            self.frame_rate = frame_rate
+            return self
+
+        cutoff = min(1.0, up / down)
+        width = int(math.ceil(RESAMPLE_TAPS / cutoff))
+        block_in = -(-2 * width // down) * down
+        block_out = block_in // down * up
+        count = len(self.samples) * up // down
+        blocks = -(-count // block_out)
+
+        # Filter matrix: column q holds the taps of output frame q of a
+        # block, at the rows of the input frames of the block and the next
+        q = np.arange(block_out)[:, None]
+        k = np.arange(2 * width)[None, :]
+        phase = q % up
+        x = k - (width - 1) - (phase * down % up) / up
+        h = cutoff * np.sinc(cutoff * x) * np.i0(
+            RESAMPLE_BETA * np.sqrt(np.clip(1 - (x / width) ** 2, 0, 1))) / np.i0(RESAMPLE_BETA)
+        matrix = np.zeros((2 * block_in, block_out), np.float32)
+        matrix[q // up * down + phase * down // up + k, np.broadcast_to(q, h.shape)] = h
+
+        # Channels as rows of blocks, with room for the filter either side
+        padded = np.zeros((self.channels, (blocks + 1) * block_in), np.float32)
+        padded[:, width - 1:width - 1 + len(self.samples)] = self.samples.T
+        padded = padded.reshape(self.channels, blocks + 1, block_in)
+        result = np.empty((blocks, block_out, self.channels), np.float32)
+        step = max(1, CHUNK_FRAMES // block_in)
+        for first in range(0, blocks, step):
+            last = min(first + step, blocks)
+            for channel in range(self.channels):
+                acc = padded[channel, first:last] @ matrix[:block_in]
+                acc += padded[channel, first + 1:last + 1] @ matrix[block_in:]
+                result[first:last, :, channel] = acc
+
+        self.samples = result.reshape(-1, self.channels)[:count]
+        self.frame_rate = frame_rate
+        return self
+
+    def changeSpeed(self, speed):
+        """
+        Change the speed, and with it the pitch, as if played faster or slower
+
+        Arguments:
+        speed - speed multiplier
+        """
+        frame_rate = self.frame_rate
+        self.frame_rate = frame_rate * speed
+        return self.resample(frame_rate)
+
+    @Trace.traced
+    def timeStretch(self, speed):
+        """
+        Change the speed keeping the pitch, by waveform similarity overlap-add
+
+        Windows of the input are taken at speed times the output spacing,
+        each moved by up to STRETCH_TOLERANCE_MS to where it best matches
+        the continuation of the previous window, then overlap-added.
+
+        Arguments:
+        speed - speed multiplier
+        """
+        length = self.frames(STRETCH_WINDOW_MS) // 2 * 2
+        hop = length // 2
+        tolerance = self.frames(STRETCH_TOLERANCE_MS)
+        count = int(len(self.samples) / speed)
+        if len(self.samples) < length + 2 * tolerance or count < length:
+            return self.changeSpeed(speed)
+
+        window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(length) / length)).astype(np.float32)
+        mono = self.samples.mean(axis=1)
+        size = 1 << int(math.ceil(math.log2(length + 2 * tolerance)))
+        last = len(self.samples) - length
+
+        result = np.zeros((count + length, self.channels), np.float32)
+        weight = np.zeros(count + length, np.float32)
+        previous = None
+        for position in range(0, count, hop):
+            nominal = min(int(position * speed), last)
+            start = nominal
+            if previous is not None and previous + hop + length <= len(self.samples):
+                low = max(0, nominal - tolerance)
+                high = min(last, nominal + tolerance)
+                # Cross-correlate the search region with the natural
+                # continuation of the previous window, via FFT
+                target = mono[previous + hop:previous + hop + length]
+                region = mono[low:high + length]
+                correlation = np.fft.irfft(
+                    np.fft.rfft(region, size) * np.conj(np.fft.rfft(target, size)), size)
+                start = low + int(np.argmax(correlation[:high - low + 1]))
+            result[position:position + length] += self.samples[start:start + length] * window[:, None]
+            weight[position:position + length] += window
+            previous = start
+
+        np.maximum(weight, 1e-3, out=weight)
+        self.samples = result[:count] / weight[:count, None]
+        return self
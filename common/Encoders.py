@@ -0,0 +1,361 @@
+"""
+    MP3Tool
+
+    Encoders.py: MP3 encoder backends, an ffmpeg process or LAME in-process,
+    and the renditions each clip is written in
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import io
+import os
+from mutagen.easyid3 import EasyID3
+from common import AudioIO
+from common import FrameIndex
+from common import Trace
+
+# The LAME binding is optional, without it MP3s are encoded by ffmpeg
+try:
+    import lameenc
+except ImportError:
+    lameenc = None
+
+
+# Names of the encoders, None picks lame when installed
+ENCODERS = ("ffmpeg", "lame")
+
+# Settings used when none are given, as ffmpeg's libmp3lame uses
+DEFAULT_BITRATE = 128000
+DEFAULT_QUALITY = 3
+
+# Empty ID3v2.4 tag, written when a file has no tags
+EMPTY_ID3 = b"ID3\x04\x00\x00\x00\x00\x00\x00"
+
+# Formats a clip can be written in, and the ffmpeg encoder, ffmpeg output
+# format and file extension of each. MP3s are written by the chosen encoder
+FORMATS = {
+    "mp3": ("libmp3lame", "mp3", ".mp3"),
+    "opus": ("libopus", "ogg", ".opus"),
+    "ogg": ("libvorbis", "ogg", ".ogg"),
+    "aac": ("aac", "ipod", ".m4a"),
+}
+
+# LAME's VBR mode numbers, for the binding and the Info frame
+LAME_VBR_MTRH = 4
+INFO_CBR = 1
+
+
+def id3Header(tags):
+    """
+    Build the ID3v2.4 tag written at the start of an MP3 file
+
+    Arguments:
+    tags - dictionary of ID3 tags, e.g. {'title': ..., 'artist': ...}
+
+    Return:
+    Bytes of the tag, without padding
+    """
+    if not tags:
+        return EMPTY_ID3
+    id3 = EasyID3()
+    for key, value in tags.items():
+        id3[key] = value
+    header = io.BytesIO()
+    id3.save(header, padding=lambda info: 0)
+    return header.getvalue()
+
+
+def crc16(data):
+    """CRC-16 (0x8005, reflected) of the bytes, as used by the LAME tag"""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for i in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def infoFrame(data, samples, vbr, quality, delay=FrameIndex.LAME_ENCODER_DELAY):
+    """
+    Build the Xing/Info frame heading LAME's frames, which the binding
+    does not write, so players know the length, can seek VBR files and
+    can drop the encoder delay and padding
+
+    Arguments:
+    data - MP3 frames written by LAME
+    samples - number of samples encoded, at the frames' sample rate
+    vbr - LAME VBR quality, None = constant bitrate
+    quality - LAME algorithm quality
+    delay - samples before the first sample encoded, besides the decoder
+            delay, LAME's encoder delay unless the frames were put together
+
+    Return:
+    Bytes of the frame, empty if there are no frames
+    """
+    frames = list(FrameIndex.scanFrames(data))
+    if not frames:
+        return b""
+    first_pos, first = frames[0]
+    mpeg1 = first['version'] == 3
+    slot = 144 if mpeg1 else 72
+    # Lowest bitrate with room for the Xing (120 bytes) and LAME (36 bytes) tags
+    needed = first['side_info'] + 120 + 36
+    for index, kbps in enumerate(FrameIndex.BITRATES[mpeg1]):
+        length = slot * kbps * 1000 // first['sample_rate']
+        if index > 0 and length >= needed:
+            break
+    header = bytes([0xFF, data[first_pos + 1] | 1,
+                    (index << 4) | (data[first_pos + 2] & 0x0C), data[first_pos + 3]])
+    side_info = FrameIndex.parseHeader(header + bytes(length), 0)['side_info']
+
+    # Table of contents, the byte position of each percent of the song
+    total = length + len(data) - first_pos
+    toc = bytes(min(255, (length + frames[len(frames) * i // 100][0] - first_pos) * 256 // total)
+                for i in range(100))
+    xing = (b"Xing" if vbr is not None else b"Info") + (15).to_bytes(4, "big") + \
+        len(frames).to_bytes(4, "big") + total.to_bytes(4, "big") + toc + \
+        (100 - 10 * (4 if vbr is None else vbr) - quality).to_bytes(4, "big")
+
+    padding = max(0, len(frames) * first['samples'] - delay - samples)
+    lame = b"LAME3.100" + bytes([INFO_CBR if vbr is None else LAME_VBR_MTRH]) + bytes(10) + \
+        bytes([min(255, first['bitrate'] // 1000) if vbr is None else 0]) + \
+        ((delay << 12) | min(padding, 0xFFF)).to_bytes(3, "big") + bytes(4) + \
+        total.to_bytes(4, "big") + bytes(2)
+    frame = header + bytes(side_info - 4) + xing + lame
+    frame += crc16(frame).to_bytes(2, "big")
+    return frame + bytes(length - len(frame))
+
+
+class FFmpegEncoder:
+    """
+    Encodes through an ffmpeg child process fed through a pipe
+
+    Arguments:
+    quality - LAME algorithm quality, 0 = best to 9 = fastest, None = default
+    vbr - LAME VBR quality, 0 = best to 9 = smallest, None = constant bitrate
+    """
+
+    name = "ffmpeg"
+
+    def __init__(self, quality=None, vbr=None):
+        self.quality = quality
+        self.vbr = vbr
+
+    @Trace.traced
+    def encode(self, sound, path, bitrate=None, tags=None, frame_rate=None):
+        """
+        Encode a sound object to an MP3 file
+
+        Arguments:
+        sound - pydub sound object
+        path - path of the MP3 file to write
+        bitrate - bitrate in bps (int or str), None = DEFAULT_BITRATE
+        tags - dictionary of ID3 tags, e.g. {'title': ..., 'artist': ...}
+        frame_rate - frame rate of the file, None = that of the sound
+        """
+        AudioIO.encodeFile(sound, path, bitrate, tags, self.quality, self.vbr, frame_rate)
+
+
+class LameEncoder:
+    """
+    Encodes in this process with the LAME binding (lameenc), straight from
+    the sound's samples, so no process is started for each file. LAME lets
+    go of the GIL while encoding, so files can be encoded in threads
+
+    Arguments:
+    quality - LAME algorithm quality, 0 = best to 9 = fastest, None = default
+    vbr - LAME VBR quality, 0 = best to 9 = smallest, None = constant bitrate
+    """
+
+    name = "lame"
+
+    def __init__(self, quality=None, vbr=None):
+        self.quality = DEFAULT_QUALITY if quality is None else quality
+        self.vbr = vbr
+
+    @Trace.traced
+    def encode(self, sound, path, bitrate=None, tags=None, frame_rate=None):
+        """
+        Encode a sound object to an MP3 file
+
+        Arguments:
+        sound - pydub sound object
+        path - path of the MP3 file to write
+        bitrate - bitrate in bps (int or str, e.g. "192k"), None = DEFAULT_BITRATE
+        tags - dictionary of ID3 tags, e.g. {'title': ..., 'artist': ...}
+        frame_rate - frame rate of the file, None = that of the sound
+        """
+        # LAME takes 16 bit mono or stereo samples
+        if sound.sample_width != 2:
+            sound = sound.set_sample_width(2)
+        if sound.channels > 2:
+            sound = sound.set_channels(2)
+
+        encoder = lameenc.Encoder()
+        encoder.set_in_sample_rate(sound.frame_rate)
+        encoder.set_channels(sound.channels)
+        encoder.set_quality(self.quality)
+        # Left to itself LAME lowers the rate of low bitrates, e.g. 24 kHz at 64k
+        encoder.set_out_sample_rate(frame_rate or sound.frame_rate)
+        if self.vbr is not None:
+            encoder.set_vbr(LAME_VBR_MTRH)
+            encoder.set_vbr_quality(self.vbr)
+        else:
+            encoder.set_bit_rate(bitrateKbps(bitrate))
+        data = bytes(encoder.encode(sound.raw_data) + encoder.flush())
+
+        # LAME may resample, the Info frame counts samples at the output rate
+        header = next(FrameIndex.scanFrames(data), (0, None))[1]
+        samples = int(sound.frame_count())
+        if header is not None and header['sample_rate'] != sound.frame_rate:
+            samples = samples * header['sample_rate'] // sound.frame_rate
+        with open(path, "wb") as f:
+            f.write(id3Header(tags))
+            f.write(infoFrame(data, samples, self.vbr, self.quality))
+            f.write(data)
+
+
+def bitrateKbps(bitrate):
+    """
+    Bitrate in kbps, LAME picking the nearest MP3 bitrate
+
+    Arguments:
+    bitrate - bitrate in bps, as an int or str such as "192000" or "192k"
+
+    Return:
+    Bitrate in kbps
+    """
+    if bitrate is None:
+        return DEFAULT_BITRATE // 1000
+    bitrate = str(bitrate).lower()
+    if bitrate.endswith("k"):
+        return int(float(bitrate[:-1]))
+    return int(float(bitrate)) // 1000
+
+
+def getEncoder(name=None, quality=None, vbr=None):
+    """
+    Make an encoder
+
+    Arguments:
+    name - "ffmpeg" or "lame", None = lame when installed, else ffmpeg
+    quality - LAME algorithm quality, 0 = best to 9 = fastest, None = default
+    vbr - LAME VBR quality, 0 = best to 9 = smallest, None = constant bitrate
+
+    Return:
+    FFmpegEncoder or LameEncoder object
+    """
+    if name is None:
+        name = "lame" if lameenc is not None else "ffmpeg"
+    if name == "lame":
+        if lameenc is None:
+            raise ValueError("The lame encoder needs lameenc, pip install lameenc")
+        return LameEncoder(quality, vbr)
+    if name == "ffmpeg":
+        return FFmpegEncoder(quality, vbr)
+    raise ValueError("Unknown encoder: " + name)
+
+
+class Rendition:
+    """
+    A version of each clip to write, e.g. a low bitrate MP3 for phones
+
+    Arguments:
+    format - one of FORMATS
+    bitrate - bitrate in bps (int or str, e.g. "64k"), None = the encoder's
+              default, or the song's for mixes
+    frame_rate - frame rate of the file, None = that of the clip
+    """
+
+    def __init__(self, format="mp3", bitrate=None, frame_rate=None):
+        self.format = format
+        self.bitrate = bitrate
+        self.frame_rate = frame_rate
+
+    def path(self, path):
+        """
+        Path of this rendition of a clip, the bitrate and frame rate added
+        to the clip's name, e.g. song_Clip.mp3 as song_Clip_64k_22050.mp3
+
+        Arguments:
+        path - path of the clip, as written without renditions
+
+        Return:
+        Path of the rendition
+        """
+        name = os.path.splitext(path)[0]
+        if self.bitrate is not None:
+            name += f"_{bitrateKbps(self.bitrate)}k"
+        if self.frame_rate is not None:
+            name += f"_{self.frame_rate}"
+        return name + FORMATS[self.format][2]
+
+    @Trace.traced
+    def encode(self, encoder, sound, path, bitrate=None, tags=None):
+        """
+        Encode a sound object as this rendition
+
+        Arguments:
+        encoder - FFmpegEncoder or LameEncoder object, writing MP3s
+        sound - pydub sound object
+        path - path of the file to write
+        bitrate - bitrate of MP3s when the rendition has none, None = default
+        tags - dictionary of tags, e.g. {'title': ..., 'artist': ...}
+        """
+        if self.format == "mp3":
+            encoder.encode(sound, path, self.bitrate or bitrate, tags, self.frame_rate)
+        else:
+            codec, container, extension = FORMATS[self.format]
+            AudioIO.encodeFile(sound, path, self.bitrate, tags,
+                               frame_rate=self.frame_rate, codec=codec, container=container)
+
+
+def parseRenditions(text):
+    """
+    Read a list of renditions, each format[:bitrate[:frame rate]], e.g.
+    "mp3:320k,mp3:64k:22050,opus:48k"
+
+    Arguments:
+    text - comma separated renditions, None = one MP3 as the encoder writes
+
+    Return:
+    List of Rendition objects
+    """
+    if not text:
+        return [Rendition()]
+    renditions = []
+    for item in text.split(","):
+        parts = [part.strip() for part in item.strip().split(":")]
+        if len(parts) > 3 or parts[0].lower() not in FORMATS:
+            raise ValueError(f"Unknown rendition: {item.strip()}, must be format[:bitrate[:frame rate]]"
+                             " with format one of: " + ", ".join(FORMATS))
+        bitrate = parts[1] if len(parts) > 1 and parts[1] else None
+        frame_rate = parts[2] if len(parts) > 2 and parts[2] else None
+        try:
+            if bitrate is not None and bitrateKbps(bitrate) <= 0:
+                raise ValueError
+            if frame_rate is not None:
+                frame_rate = int(frame_rate)
+                if frame_rate <= 0:
+                    raise ValueError
+        except ValueError:
+            raise ValueError(f"Rendition {item.strip()}: bitrate and frame rate must be positive numbers")
+        renditions.append(Rendition(parts[0].lower(), bitrate, frame_rate))
+
+    paths = [rendition.path("clip") for rendition in renditions]
+    if len(set(paths)) != len(paths):
+        raise ValueError("Renditions must differ in format, bitrate or frame rate")
+    return renditions
@@ -0,0 +1,61 @@
+"""
+    MP3Tool
+
+    Errors.py: Exceptions raised by the tools when they give up
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+class ClipError(Exception):
+    """
+    A tool gave up on a clip, e.g. the song has no ID3 tag. The command
+    line prints the message and details, and exits
+
+    Arguments:
+    message - why, e.g. "Input file has no ID3 tag, aborted."
+    details - what went wrong underneath, e.g. the decoder's error, None if nothing
+
+    Attributes set by Library.ClipMaker:
+    tool - name of the tool
+    log - everything the tool reported before giving up
+    """
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+        self.tool = None
+        self.log = ""
+
+
+class OptionError(ClipError):
+    """The options given can't be used, e.g. an unknown rendition format"""
+
+
+class SongError(ClipError):
+    """No songs, or not enough, to make the clips from"""
+
+
+class TagError(ClipError):
+    """The song's ID3 tag is missing, or lacks the title or artist"""
+
+
+class InputError(ClipError):
+    """The song could not be read or decoded"""
+
+
+class OutputError(ClipError):
+    """A clip could not be encoded or written"""
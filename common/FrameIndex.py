@@ -0,0 +1,382 @@
+"""
+    MP3Tool
+
+    FrameIndex.py: Index of the MPEG audio frames in an MP3 file
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import json
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+
+# Layer III bitrates in kbps, indexed by [MPEG-1][bitrate index]
+BITRATES = {
+    True: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    False: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# Sample rates in Hz, indexed by [version bits][sample rate index]
+SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG-1
+    2: [22050, 24000, 16000],  # MPEG-2
+    0: [11025, 12000, 8000],   # MPEG-2.5
+}
+
+# Decoder delay of the MP3 synthesis filterbank, in samples
+DECODER_DELAY = 529
+
+# Encoder delay of LAME, in samples. Files without a LAME tag have no
+# delay skipped by ffmpeg at all, not even the decoder delay
+LAME_ENCODER_DELAY = 576
+
+INDEX_VERSION = 2
+
+# Indexes kept loaded by this process, keyed by (path, size, mtime), the
+# least recently used dropped beyond LOADED_MAX
+LOADED_MAX = 64
+_loaded = OrderedDict()
+_lock = threading.Lock()
+
+
+def parseHeader(data, pos):
+    """
+    Parse the MPEG Layer III frame header at a position
+
+    Arguments:
+    data - bytes of the file
+    pos - offset of the candidate header
+
+    Return:
+    Dictionary describing the frame, None if there is no valid header
+    """
+    if pos + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[pos], data[pos + 1], data[pos + 2], data[pos + 3]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 3
+    layer = (b1 >> 1) & 3
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 3
+    # Only Layer III with a fixed bitrate is supported
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = BITRATES[mpeg1][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 1
+    channels = 1 if (b3 >> 6) == 3 else 2
+    crc = 2 if (b1 & 1) == 0 else 0
+
+    if mpeg1:
+        length = 144 * bitrate // sample_rate + padding
+        samples = 1152
+        side_info = 17 if channels == 1 else 32
+        main_data_begin = ((data[pos + 4 + crc] << 1) |
+                           (data[pos + 5 + crc] >> 7)) if pos + 6 + crc <= len(data) else 0
+    else:
+        length = 72 * bitrate // sample_rate + padding
+        samples = 576
+        side_info = 9 if channels == 1 else 17
+        main_data_begin = data[pos + 4 + crc] if pos + 5 + crc <= len(data) else 0
+
+    return {
+        'version': version,
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'length': length,
+        'samples': samples,
+        'side_info': 4 + crc + side_info,
+        'main_data_begin': main_data_begin,
+    }
+
+
+def skipID3v2(data):
+    """
+    Find where the audio starts, skipping a leading ID3v2 tag
+
+    Arguments:
+    data - bytes of the file
+
+    Return:
+    Offset of the first byte after the ID3v2 tag
+    """
+    pos = 0
+    while data[pos:pos + 3] == b"ID3" and pos + 10 <= len(data):
+        size = (data[pos + 6] << 21) | (data[pos + 7] << 14) | \
+            (data[pos + 8] << 7) | data[pos + 9]
+        footer = 10 if data[pos + 5] & 0x10 else 0
+        pos += 10 + size + footer
+    return pos
+
+
+def parseInfoFrame(data, pos, header):
+    """
+    Check whether a frame is a Xing/Info/VBRI header rather than audio
+
+    Arguments:
+    data - bytes of the file
+    pos - offset of the frame
+    header - parsed frame header
+
+    Return:
+    (is_info_frame, encoder_delay) tuple, encoder_delay None if unknown
+    """
+    xing = pos + header['side_info']
+    if data[xing:xing + 4] in (b"Xing", b"Info"):
+        flags = int.from_bytes(data[xing + 4:xing + 8], "big")
+        lame = xing + 8
+        lame += 4 if flags & 1 else 0
+        lame += 4 if flags & 2 else 0
+        lame += 100 if flags & 4 else 0
+        lame += 4 if flags & 8 else 0
+        encoder_delay = None
+        if data[lame:lame + 4] in (b"LAME", b"Lavf", b"Lavc"):
+            delay_bytes = data[lame + 21:lame + 24]
+            if len(delay_bytes) == 3:
+                encoder_delay = (delay_bytes[0] << 4) | (delay_bytes[1] >> 4)
+        return True, encoder_delay
+    if data[pos + 36:pos + 40] == b"VBRI":
+        # ffmpeg does not skip the delay a VBRI header gives
+        return True, None
+    return False, None
+
+
+def scanFrames(data, pos=0):
+    """
+    Walk the Layer III frames in a buffer
+
+    Arguments:
+    data - bytes holding MP3 frames
+    pos - offset to start from
+
+    Return:
+    Generator of (offset, header) tuples
+    """
+    size = len(data)
+    while pos + 4 <= size:
+        header = parseHeader(data, pos)
+        if header is not None:
+            # Confirm a sync found after lost sync with the following frame
+            following = pos + header['length']
+            if following + 4 > size or parseHeader(data, following) is not None:
+                if following > size:
+                    return
+                yield pos, header
+                pos = following
+                continue
+        if data[pos:pos + 3] == b"TAG" or data[pos:pos + 8] == b"APETAGEX":
+            return
+        pos += 1
+
+
+class FrameIndex:
+    """
+    Byte offset and timestamp of every audio frame in an MP3 file
+
+    Timestamps are in the time base of the decoded audio, i.e. after the
+    encoder and decoder delay given by a LAME tag has been skipped, so they
+    line up with the positions used to slice decoded pydub sound objects.
+    """
+
+    def __init__(self, sample_rate, channels, samples_per_frame, version,
+                 bitrate, delay, offsets, main_data_begin):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.samples_per_frame = samples_per_frame
+        self.version = version
+        self.bitrate = bitrate
+        self.delay = delay
+        # One more offset than frames, the last being the end of the audio
+        self.offsets = offsets
+        self.main_data_begin = main_data_begin
+
+    def __len__(self):
+        return len(self.main_data_begin)
+
+    def frameSample(self, frame):
+        """Decoded sample position at which a frame's audio starts"""
+        return frame * self.samples_per_frame - self.delay
+
+    def frameTime(self, frame):
+        """Time in milliseconds at which a frame's audio starts"""
+        return self.frameSample(frame) * 1000 / self.sample_rate
+
+    def frameAt(self, ms):
+        """First frame whose audio starts at or after a time in milliseconds"""
+        sample = ms * self.sample_rate / 1000
+        frame = int(-(-(sample + self.delay) // self.samples_per_frame))
+        return max(0, min(frame, len(self)))
+
+    def frameBytes(self, data, first, last):
+        """Bytes of frames first (inclusive) to last (exclusive)"""
+        return data[self.offsets[first]:self.offsets[last]]
+
+    @classmethod
+    def build(cls, data):
+        """
+        Build the index of an MP3 file's frames
+
+        Arguments:
+        data - bytes of the file
+
+        Return:
+        FrameIndex object
+        """
+        offsets = array('Q')
+        main_data_begin = array('H')
+        first = None
+        end = 0
+        total_bits = 0
+        encoder_delay = None
+        for pos, header in scanFrames(data, skipID3v2(data)):
+            if first is None:
+                first = header
+                is_info, encoder_delay = parseInfoFrame(data, pos, header)
+                if is_info:
+                    continue
+            if header['sample_rate'] != first['sample_rate']:
+                break
+            offsets.append(pos)
+            main_data_begin.append(header['main_data_begin'])
+            total_bits += header['bitrate']
+            end = pos + header['length']
+        if first is None or len(offsets) == 0:
+            raise ValueError("No MPEG Layer III frames found")
+        offsets.append(end)
+
+        delay = 0 if encoder_delay is None else encoder_delay + DECODER_DELAY
+        return cls(first['sample_rate'], first['channels'], first['samples'],
+                   first['version'], total_bits // len(main_data_begin),
+                   delay, offsets, main_data_begin)
+
+    def save(self, path, key):
+        """
+        Save the index to disk
+
+        Arguments:
+        path - index file to write
+        key - (path, size, mtime) of the indexed file
+        """
+        header = {
+            'version': INDEX_VERSION,
+            'key': list(key),
+            'sample_rate': self.sample_rate,
+            'channels': self.channels,
+            'samples_per_frame': self.samples_per_frame,
+            'mpeg_version': self.version,
+            'bitrate': self.bitrate,
+            'delay': self.delay,
+            'frames': len(self),
+        }
+        # Other processes and threads may be saving the same index
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json.dumps(header).encode() + b"\n")
+            self.offsets.tofile(f)
+            self.main_data_begin.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, key):
+        """
+        Load an index from disk
+
+        Arguments:
+        path - index file to read
+        key - (path, size, mtime) of the indexed file
+
+        Return:
+        FrameIndex object, None if missing or stale
+        """
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                if header['version'] != INDEX_VERSION or header['key'] != list(key):
+                    return None
+                offsets = array('Q')
+                offsets.fromfile(f, header['frames'] + 1)
+                main_data_begin = array('H')
+                main_data_begin.fromfile(f, header['frames'])
+        except (OSError, ValueError, KeyError, EOFError):
+            return None
+        return cls(header['sample_rate'], header['channels'],
+                   header['samples_per_frame'], header['mpeg_version'],
+                   header['bitrate'], header['delay'], offsets, main_data_begin)
+
+
+def fileKey(path):
+    """
+    Identify a version of a file by path, size and modification time
+
+    Arguments:
+    path - path to file
+
+    Return:
+    (path, size, mtime) tuple
+    """
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def getFrameIndex(path, cache_folder=None, data=None):
+    """
+    Get the frame index of an MP3 file, building and caching it if needed
+
+    Arguments:
+    path - path to MP3 file
+    cache_folder - folder holding cached indexes, None = memory only
+    data - bytes of the file if already read
+
+    Return:
+    FrameIndex object
+    """
+    key = fileKey(path)
+    with _lock:
+        if key in _loaded:
+            _loaded.move_to_end(key)
+            return _loaded[key]
+
+    index = None
+    index_path = None
+    if cache_folder is not None:
+        index_path = os.path.join(
+            cache_folder, "frameindex",
+            hashlib.sha1(key[0].encode()).hexdigest() + ".idx")
+        index = FrameIndex.load(index_path, key)
+
+    if index is None:
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        index = FrameIndex.build(data)
+        if index_path is not None:
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            index.save(index_path, key)
+
+    with _lock:
+        _loaded[key] = index
+        while len(_loaded) > LOADED_MAX:
+            _loaded.popitem(last=False)
+    return index
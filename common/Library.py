@@ -0,0 +1,167 @@
+"""
+    MP3Tool
+
+    Library.py: Clip making for other programs, raising exceptions instead
+    of printing and exiting, with asyncio variants
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import time
+import asyncio
+import functools
+import threading
+from common import Batch
+from common import Tools
+from common.Errors import ClipError
+from common.MP3Tool import MP3Tool
+from common.MP3ToolOptions import MP3ToolOptions
+
+
+# Tools that can be run, and the MP3Tool method running each
+TOOLS = dict(Batch.TOOLS, mix_selected="songMixSelected")
+
+# Defaults of the tools' command line arguments, some options only having
+# a default there
+ARGUMENT_DEFAULTS = dict((flags[-1].lstrip("-"), kwargs['default'])
+                         for tool in Tools.TOOLS.values()
+                         for flags, kwargs in tool.arguments if 'default' in kwargs)
+
+_lock = threading.Lock()
+
+
+class ClipResult:
+    """
+    The clips made by a tool
+
+    Attributes:
+    tool - name of the tool
+    song - path of the song, None for mixes
+    outputs - list of paths of the MP3 files written
+    seconds - time taken
+    title - title of the song, from its ID3 tag
+    artist - artist of the song, from its ID3 tag
+    info - dictionary of the song file's details, from the catalog
+    log - everything the tool reported
+    """
+
+    def __init__(self, tool, song, outputs, seconds, title=None, artist=None,
+                 info=None, log=""):
+        self.tool = tool
+        self.song = song
+        self.outputs = outputs
+        self.seconds = seconds
+        self.title = title
+        self.artist = artist
+        self.info = info
+        self.log = log
+
+    def __repr__(self):
+        return f"ClipResult(tool={self.tool!r}, song={self.song!r}, outputs={self.outputs!r})"
+
+
+def makeOptions(**values):
+    """
+    Make the options of one call, leaving MP3ToolOptions unchanged.
+    Options not given take the command line's defaults
+
+    Arguments:
+    values - option values, named as the attributes of MP3ToolOptions or
+             the long command line arguments, e.g. song="song.mp3", duration=20
+
+    Return:
+    Subclass of MP3ToolOptions
+    """
+    for name in values:
+        if name.startswith("_") or not (hasattr(MP3ToolOptions, name) or
+                                        name in ARGUMENT_DEFAULTS):
+            raise ValueError("Unknown option: " + name)
+    return type("MP3ToolOptions", (MP3ToolOptions,), dict(ARGUMENT_DEFAULTS, **values))
+
+
+class ClipMaker:
+    """
+    Makes clips for another program, e.g.
+
+        maker = ClipMaker(source_folder="C:\\music\\", output_folder="clips\\")
+        result = maker.create("intro", song="song.mp3", duration=20)
+        results = await asyncio.gather(maker.createAsync("intro"),
+                                       maker.createAsync("reverse"))
+
+    Nothing is printed and nothing exits, what a tool reports is kept in
+    the result, and a tool giving up raises a ClipError, as defined in
+    Errors, holding what it reported. Clips are written to each tool's
+    subfolder of the output folder, e.g. clips\\intro\\. The catalog is
+    shared by all the calls, and calls may be made from several threads
+    at once.
+
+    Arguments:
+    catalog - Catalog object to use, None = opened by the first call
+    defaults - option values of every call, named as for makeOptions
+    """
+
+    def __init__(self, catalog=None, **defaults):
+        makeOptions(**defaults)
+        self.catalog = catalog
+        self.defaults = defaults
+
+    def create(self, tool, **options):
+        """
+        Make the clips of a tool
+
+        Arguments:
+        tool - name of the tool, one of TOOLS
+        options - option values of this call, over the defaults
+
+        Return:
+        ClipResult object
+        """
+        if tool not in TOOLS:
+            raise ValueError(f"Unknown tool: {tool}, must be one of: " + ", ".join(TOOLS))
+        options = makeOptions(**dict(self.defaults, tool=tool, **options))
+
+        log = []
+        start = time.perf_counter()
+        try:
+            mp3Tool = MP3Tool(options, self.catalog, log.append)
+            with _lock:
+                if self.catalog is None:
+                    self.catalog = mp3Tool.catalog
+            outputs = getattr(mp3Tool, TOOLS[tool])()
+        except ClipError as e:
+            e.tool = tool
+            e.log = "".join(line + "\n" for line in log)
+            raise
+        return ClipResult(tool, options.song, outputs or [], time.perf_counter() - start,
+                          mp3Tool.tag_title, mp3Tool.tag_artist,
+                          getattr(options, 'song_mp3Info', None),
+                          "".join(line + "\n" for line in log))
+
+    async def createAsync(self, tool, **options):
+        """
+        Make the clips of a tool in a thread, so the event loop carries on
+        while songs are decoded and clips encoded
+
+        Arguments:
+        tool - name of the tool, one of TOOLS
+        options - option values of this call, over the defaults
+
+        Return:
+        ClipResult object
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.create, tool, **options))
@@ -0,0 +1,325 @@
+"""
+    MP3Tool
+
+    LosslessCut.py: Cut MP3 clips by copying frames, re-encoding only fades
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import subprocess
+from pydub import AudioSegment
+from common import AudioIO
+from common import Encoders
+from common import FrameIndex
+from common import Trace
+
+
+# Delay added by LAME when re-encoding the fade regions, in samples
+LAME_DELAY = FrameIndex.LAME_ENCODER_DELAY + FrameIndex.DECODER_DELAY
+
+# Largest bit reservoir reference back (main_data_begin), by MPEG-1
+MAX_MAIN_DATA_BEGIN = {True: 511, False: 255}
+
+# Frames of extra audio encoded on the copied side of each join, so the
+# overlap between re-encoded and copied frames matches the source
+OVERLAP_FRAMES = 2
+
+
+def sideInfoLength(header):
+    """
+    Length of a frame's side information
+
+    Arguments:
+    header - parsed frame header
+
+    Return:
+    Length in bytes
+    """
+    if header['version'] == 3:
+        return 17 if header['channels'] == 1 else 32
+    return 9 if header['channels'] == 1 else 17
+
+
+def mainDataUsed(frame, header):
+    """
+    Number of main data bytes a frame uses, from its side information
+
+    Arguments:
+    frame - bytes of the frame
+    header - parsed frame header
+
+    Return:
+    Bytes of main data (part2_3_length summed over granules and channels)
+    """
+    length = sideInfoLength(header)
+    bits = int.from_bytes(
+        frame[header['side_info'] - length:header['side_info']], "big")
+    channels = header['channels']
+    if header['version'] == 3:
+        start = 9 + (5 if channels == 1 else 3) + 4 * channels
+        entries = [start + 59 * i for i in range(2 * channels)]
+    else:
+        start = 8 + (1 if channels == 1 else 2)
+        entries = [start + 63 * i for i in range(channels)]
+    used = 0
+    for entry in entries:
+        used += (bits >> (length * 8 - entry - 12)) & 0xFFF
+    return (used + 7) // 8
+
+
+def mainData(data, index, frame):
+    """Main data area of a frame, the bytes after its side information"""
+    pos = index.offsets[frame]
+    header = FrameIndex.parseHeader(data, pos)
+    return data[pos + header['side_info']:index.offsets[frame + 1]]
+
+
+def reservoirBytes(data, index, frame):
+    """
+    Bit reservoir bytes the frames from a frame on read from the frames
+    before it
+
+    Not only the frame itself refers back, a later frame does too when
+    its main_data_begin reaches past the main data of the frames between,
+    so frames are checked until that main data is longer than any
+    reference back can be.
+
+    Arguments:
+    data - bytes of the source file
+    index - FrameIndex of the source file
+    frame - frame number
+
+    Return:
+    The main data bytes preceding the frame that it or later frames refer back to
+    """
+    limit = MAX_MAIN_DATA_BEGIN[index.version == 3]
+    wanted = 0
+    between = 0
+    following = frame
+    while between < limit and following < len(index):
+        wanted = max(wanted, index.main_data_begin[following] - between)
+        between += len(mainData(data, index, following))
+        following += 1
+
+    collected = b""
+    previous = frame - 1
+    while len(collected) < wanted and previous >= 0:
+        collected = mainData(data, index, previous) + collected
+        previous -= 1
+    return collected[len(collected) - wanted:]
+
+
+def encodeFrames(sound, bitrate):
+    """
+    Encode a sound object to MP3 frames without bit reservoir or headers
+
+    Arguments:
+    sound - pydub sound object
+    bitrate - bitrate in bps
+
+    Return:
+    List of (frame bytes, header) tuples
+    """
+    conversion_command = [AudioSegment.converter, '-nostdin', '-v', 'error',
+                          '-f', 's%dle' % (sound.sample_width * 8),
+                          '-ar', str(sound.frame_rate),
+                          '-ac', str(sound.channels),
+                          '-i', 'pipe:0',
+                          '-acodec', 'libmp3lame', '-b:a', str(bitrate),
+                          '-reservoir', '0', '-write_xing', '0',
+                          '-id3v2_version', '0', '-map_metadata', '-1',
+                          '-f', 'mp3', 'pipe:1']
+    p = subprocess.Popen(conversion_command, stdin=subprocess.PIPE,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    p_out, p_err = p.communicate(input=sound.raw_data)
+    if p.returncode != 0:
+        raise RuntimeError("Encoding failed. ffmpeg returned error code: {0}\n\n{1}".format(
+            p.returncode, p_err.decode(errors='ignore')))
+    return [(p_out[pos:pos + header['length']], header)
+            for pos, header in FrameIndex.scanFrames(p_out)]
+
+
+def carrierFrame(sound, count, header, reservoir):
+    """
+    Build the last frame of the fade-in so it can carry a bit reservoir
+
+    The frame is encoded at a lower bitrate, then relabelled with the
+    highest bitrate and zero padded. As the re-encoded frames do not use the
+    bit reservoir, the padding is free to hold the bytes the copied frames
+    refer back to.
+
+    Arguments:
+    sound - pydub sound object of the fade-in
+    count - number of frames in the fade-in
+    header - header of a fade-in frame at the highest bitrate
+    reservoir - bytes the copied frames need before them
+
+    Return:
+    Frame bytes, None if no bitrate leaves room for the reservoir
+    """
+    mpeg1 = header['version'] == 3
+    slot = 144 if mpeg1 else 72
+    length = slot * FrameIndex.BITRATES[mpeg1][-1] * 1000 // header['sample_rate']
+    room = length - header['side_info'] - len(reservoir)
+    carrier_bitrate = None
+    for kbps in FrameIndex.BITRATES[mpeg1][1:]:
+        if slot * kbps * 1000 // header['sample_rate'] + 1 <= room:
+            carrier_bitrate = kbps * 1000
+    if carrier_bitrate is None:
+        return None
+
+    frame, carrier_header = encodeFrames(sound, carrier_bitrate)[count - 1]
+    if mainDataUsed(frame, carrier_header) > room:
+        return None
+    # Highest bitrate index, no padding
+    frame = bytearray(frame)
+    frame[2] = (14 << 4) | (frame[2] & 0x0D)
+    frame = bytes(frame) + b"\0" * (length - len(frame))
+    return frame[:length - len(reservoir)] + reservoir
+
+
+def encodeHead(sound, count, reservoir):
+    """
+    Encode the fade-in that leads into the copied frames
+
+    Arguments:
+    sound - pydub sound object, running on past the first copied frame
+    count - number of frames to keep
+    reservoir - bytes the copied frames need before them
+
+    Return:
+    Encoded bytes, None if the reservoir could not be carried
+    """
+    mpeg1 = sound.frame_rate >= 32000
+    frames = encodeFrames(sound, FrameIndex.BITRATES[mpeg1][-1] * 1000)
+    frames = [frame for frame, header in frames[:count]]
+    if len(reservoir) > 0:
+        carrier = carrierFrame(sound, count, FrameIndex.parseHeader(frames[-1], 0),
+                               reservoir)
+        if carrier is None:
+            return None
+        frames[-1] = carrier
+    return b"".join(frames)
+
+
+@Trace.traced
+def cutClip(path, out_path, start_ms, end_ms, fade_in, fade_out, cache_folder=None,
+            tags=None):
+    """
+    Cut a clip from an MP3 file, copying the frames between the fades
+
+    Only the fade-in and fade-out regions are decoded and re-encoded, the
+    frames in between are copied from the source unchanged. An Info frame
+    gives the samples before the clip's start and after its end, so
+    decoders drop them and the clip is exactly the window asked for.
+
+    Arguments:
+    path - path to source MP3 file
+    out_path - path of the clip to write
+    start_ms - start of the clip in milliseconds
+    end_ms - end of the clip in milliseconds
+    fade_in - fade in duration in milliseconds
+    fade_out - fade out duration in milliseconds
+    cache_folder - folder holding cached frame indexes
+    tags - dictionary of ID3 tags written with the clip
+
+    Return:
+    True if the clip was written, False if it has to be re-encoded instead
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        index = FrameIndex.getFrameIndex(path, cache_folder, data)
+    except ValueError:
+        return False
+    sample_rate = index.sample_rate
+    spf = index.samples_per_frame
+    start = int(start_ms * sample_rate / 1000)
+    end = min(int(end_ms * sample_rate / 1000), index.frameSample(len(index)))
+    fade_in_samples = int(fade_in * sample_rate / 1000)
+    fade_out_samples = int(fade_out * sample_rate / 1000)
+
+    # Last copied frame ends where the fade-out region starts
+    last = (end - fade_out_samples + index.delay) // spf
+    last = min(last, len(index))
+    tail_drop = -(-LAME_DELAY // spf) + OVERLAP_FRAMES
+    tail_start = index.frameSample(last) - (tail_drop * spf - LAME_DELAY)
+
+    head = b""
+    if start == 0 and fade_in == 0 and index.delay >= FrameIndex.DECODER_DELAY:
+        first = 0
+        lead = index.delay
+    else:
+        # First copied frame starts after the fade-in, the fade-in is
+        # encoded to end exactly where it starts
+        first = index.frameAt((start + fade_in_samples) * 1000 / sample_rate)
+        if first + OVERLAP_FRAMES >= last:
+            return False
+        head_frames = -(-(index.frameSample(first) - start + LAME_DELAY) // spf)
+        head_start = index.frameSample(first) - (head_frames * spf - LAME_DELAY)
+        lead = start - head_start + LAME_DELAY
+        sound = _decodeSamples(path, index, start,
+                               index.frameSample(first + OVERLAP_FRAMES))
+        if sound is None:
+            return False
+        if fade_in > 0:
+            sound = sound.fade_in(fade_in)
+        silence = sound._spawn(b"\0" * ((start - head_start) * sound.frame_width))
+        head = encodeHead(silence + sound, head_frames,
+                          reservoirBytes(data, index, first))
+        if head is None:
+            return False
+    if last <= first:
+        return False
+
+    tail = _decodeSamples(path, index, tail_start, end)
+    if tail is None:
+        return False
+    if fade_out > 0:
+        tail = tail.fade_out(fade_out)
+    tail_frames = encodeFrames(tail, index.bitrate)[tail_drop:]
+
+    # Decoders skip the Info frame's delay and the decoder delay, which
+    # make up the samples decoded before the clip's start
+    audio = head + index.frameBytes(data, first, last) + b"".join(
+        frame for frame, header in tail_frames)
+    with open(out_path, "wb") as f:
+        f.write(Encoders.id3Header(tags))
+        f.write(Encoders.infoFrame(audio, end - start, None, Encoders.DEFAULT_QUALITY,
+                                   lead - FrameIndex.DECODER_DELAY))
+        f.write(audio)
+    return True
+
+
+def _decodeSamples(path, index, start, end):
+    """
+    Decode the samples from start to end, None if too short
+
+    Decoding starts early enough for the frames the bit reservoir reaches
+    back to, and one more for the filterbank overlap, as a decoder starting
+    at the first frame wanted gets its first samples wrong.
+    """
+    sample_rate = index.sample_rate
+    frame_bytes = index.bitrate * index.samples_per_frame // (8 * sample_rate)
+    preroll = (-(-MAX_MAIN_DATA_BEGIN[index.version == 3] // frame_bytes) + 2) * \
+        index.samples_per_frame
+    start_ms = max(0, ((start - preroll) * 1000) // sample_rate)
+    end_ms = -(-(end * 1000) // sample_rate) + 1
+    sound = AudioIO.decodeWindow(path, start_ms, end_ms)
+    offset = start - int(round(start_ms * sample_rate / 1000))
+    if int(sound.frame_count()) < offset + end - start:
+        return None
+    return sound.get_sample_slice(offset, offset + end - start)
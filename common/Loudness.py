@@ -0,0 +1,230 @@
+"""
+    MP3Tool
+
+    Loudness.py: Loudness analysis of whole songs, stored in the catalog
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import math
+import time
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from pydub import AudioSegment
+from common import Trace
+from common.MP3ToolOptions import color
+
+
+# Length of the blocks loudness is measured over, in milliseconds
+BLOCK_MS = 100
+
+# Blocks read from ffmpeg at a time
+READ_BLOCKS = 100
+
+# Blocks quieter than this are taken as silence, in dBFS
+SILENCE_DBFS = -50
+
+# Share of a window's blocks that may be silent before it is moved
+SILENT_SHARE = 0.05
+
+# How far a moved window may be shifted to begin on an onset, in blocks
+ONSET_SEARCH_BLOCKS = 10
+
+
+@Trace.traced
+def analyse(path, frame_rate, channels):
+    """
+    Measure the loudness of each block of a song
+
+    The song is decoded as a stream, so memory use does not depend on
+    its length. Loudness is measured as with DSP.Sound.dBFS, the mean
+    square of the samples of all channels, relative to full scale.
+
+    Arguments:
+    path - path to audio file
+    frame_rate - frame rate of the file
+    channels - number of channels of the file
+
+    Return:
+    float32 array with the mean square of each BLOCK_MS block
+    """
+    block = frame_rate * BLOCK_MS // 1000 * channels
+    full_scale = np.float32(1 / 32768 ** 2)
+    # Errors go to a file, a damaged file could fill a pipe and stall ffmpeg
+    errors = tempfile.TemporaryFile()
+    p = subprocess.Popen([AudioSegment.converter, '-nostdin', '-v', 'error', '-i', path,
+                          '-vn', '-acodec', 'pcm_s16le', '-ar', str(frame_rate),
+                          '-ac', str(channels), '-f', 's16le', '-'],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=errors)
+    blocks = []
+    pending = b""
+    while True:
+        data = p.stdout.read(block * 2 * READ_BLOCKS)
+        if not data:
+            break
+        data = pending + data
+        whole = len(data) // (block * 2) * block * 2
+        pending = data[whole:]
+        if whole:
+            samples = np.frombuffer(data[:whole], np.int16).astype(np.float32).reshape(-1, block)
+            blocks.append(np.einsum('ij,ij->i', samples, samples) * (full_scale / block))
+    # The last block is shorter
+    if len(pending) >= 2:
+        samples = np.frombuffer(pending[:len(pending) // 2 * 2], np.int16).astype(np.float32)
+        blocks.append(np.array([np.dot(samples, samples) * full_scale / len(samples)],
+                               np.float32))
+    p.stdout.close()
+    with errors:
+        if p.wait() != 0:
+            errors.seek(0)
+            raise RuntimeError("Analysing " + path + " failed: " +
+                               errors.read().decode(errors='ignore'))
+    return np.concatenate(blocks) if blocks else np.zeros(0, np.float32)
+
+
+def level(blocks, start_ms=0, end_ms=None):
+    """
+    Loudness of a part of a song, from its blocks
+
+    The part is widened to whole blocks, so may be up to BLOCK_MS longer
+    at each end.
+
+    Arguments:
+    blocks - as returned by analyse
+    start_ms - start of the part in milliseconds
+    end_ms - end of the part in milliseconds, None = end of song
+
+    Return:
+    RMS level relative to full scale in dB, as DSP.Sound.dBFS, -inf when
+    silent or past the end
+    """
+    first = int(start_ms // BLOCK_MS)
+    last = len(blocks) if end_ms is None else int(math.ceil(end_ms / BLOCK_MS))
+    part = blocks[first:last]
+    if len(part) == 0:
+        return -math.inf
+    mean_square = float(part.mean())
+    if mean_square <= 0:
+        return -math.inf
+    return 10 * math.log10(mean_square)
+
+
+def onsets(blocks):
+    """
+    Onset strength of each block, from the blocks' energy envelope
+
+    Arguments:
+    blocks - as returned by analyse
+
+    Return:
+    Array of the rise in log energy from the block before, 0 for falls
+    """
+    log_energy = np.log10(np.maximum(blocks, 1e-10))
+    return np.maximum(np.diff(log_energy, prepend=log_energy[:1]), 0)
+
+
+def chooseWindow(blocks, start_ms, end_ms):
+    """
+    Move a window of a song so it fits in the song and is not silent
+
+    A window that fits and has few silent blocks is kept. Otherwise the
+    nearest window that does, starting on a sound, is taken, then shifted
+    to begin on the strongest onset nearby. A song shorter than the window
+    is taken whole.
+
+    Arguments:
+    blocks - as returned by analyse
+    start_ms - start of the wanted window in milliseconds
+    end_ms - end of the wanted window in milliseconds
+
+    Return:
+    (start_ms, end_ms) tuple of the window to use
+    """
+    length = end_ms - start_ms
+    count = int(math.ceil(length / BLOCK_MS))
+    total = len(blocks)
+    if total == 0:
+        return start_ms, end_ms
+    if total <= count:
+        return 0, total * BLOCK_MS
+
+    # Silent blocks in the window starting at each block
+    silent = blocks < 10 ** (SILENCE_DBFS / 10)
+    runs = np.concatenate(([0], np.cumsum(silent)))
+    silent_count = runs[count:] - runs[:-count]
+    allowed = max(int(silent_count.min()), int(count * SILENT_SHARE))
+    preferred = min(int(start_ms // BLOCK_MS), total - count)
+    if end_ms <= total * BLOCK_MS and silent_count[preferred] <= allowed:
+        return start_ms, end_ms
+
+    acceptable = silent_count <= allowed
+    candidates = np.flatnonzero(acceptable & ~silent[:total - count + 1])
+    if len(candidates) == 0:
+        candidates = np.flatnonzero(acceptable)
+    first = int(candidates[np.argmin(np.abs(candidates - preferred))])
+
+    low = max(0, first - ONSET_SEARCH_BLOCKS)
+    high = min(total - count, first + ONSET_SEARCH_BLOCKS)
+    strength = onsets(blocks)[low:high + 1].copy()
+    strength[~acceptable[low:high + 1]] = 0
+    if strength.max() > 0:
+        first = low + int(np.argmax(strength))
+    return first * BLOCK_MS, first * BLOCK_MS + length
+
+
+def analyseLibrary(mp3Tool, options):
+    """
+    Analyse the loudness of every song in the source folder not yet
+    analysed, so mixes can set their levels without measuring the audio
+
+    Arguments:
+    mp3Tool - MP3Tool object, for its catalog
+    options - MP3ToolOptions class
+
+    Return:
+    List of paths analysed
+    """
+    print(color.BOLD + color.GREEN +
+          "Analyse the loudness of each song." + color.END + "\n")
+    catalog = mp3Tool.catalog
+    songs = [song for song in catalog.listTracks(options.source_folder, options.rescan)
+             if os.path.exists(song) and catalog.getLoudness(song) is None]
+    workers = options.workers or os.cpu_count()
+    print("Songs:\t\t" + color.BOLD + f"{len(songs)} to analyse" + color.END)
+    print("Workers:\t" + color.BOLD + f"{workers}" + color.END + "\n")
+
+    analysed = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = dict((executor.submit(catalog.getLoudness, song, True), song)
+                       for song in songs)
+        for future in as_completed(futures):
+            song = futures[future]
+            try:
+                song_level = level(future.result())
+            except Exception as e:
+                print(color.RED + "[FAIL] " + color.END + f"{os.path.basename(song)}\t{e}")
+                continue
+            analysed.append(song)
+            print(color.GREEN + "[ OK ] " + color.END +
+                  f"{os.path.basename(song)}\t{song_level:.1f} dBFS")
+
+    print("\nAnalysed:\t" + color.BOLD +
+          f"{len(analysed)} songs in {time.perf_counter() - start:.1f} seconds" + color.END)
+    return analysed
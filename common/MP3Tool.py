@@ -20,15 +20,33 @@
 
 
 import os
-import random
-from mutagen.easyid3 import EasyID3
-from mutagen.mp3 import MP3
-from pydub import AudioSegment
-from pydub.utils import mediainfo
+import math
+import contextlib
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from common import AudioIO
+from common import Catalog
+from common import DSP
+from common import Encoders
+from common import Errors
+from common import LosslessCut
+from common import Loudness
+from common import OutputCache
+from common import Trace
 from common import Utils
 from common.MP3ToolOptions import color
 
 
+def holdsOutputs(method):
+    # Tool method keeping the lock on its clips taken by findOutputs until
+    # it returns
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with contextlib.ExitStack() as self.held_outputs:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class MP3Tool:
 
     MP3ToolOptions = None
@@ -37,68 +55,91 @@ class MP3Tool:
     song_base_name = None
     tag_title = None
     tag_artist = None
+    catalog = None
+    report = None
+    output_root = None
+    held_outputs = None
 
-    def __init__(self, aMP3ToolOptions):
+    def __init__(self, aMP3ToolOptions, aCatalog=None, aReport=None):
         self.MP3ToolOptions = aMP3ToolOptions
-        if not os.path.exists(self.MP3ToolOptions.output_folder):
-            os.makedirs(self.MP3ToolOptions.output_folder)
-            os.makedirs(self.MP3ToolOptions.output_folder+"backwards\\")
-            os.makedirs(self.MP3ToolOptions.output_folder+"intro\\")
-            os.makedirs(self.MP3ToolOptions.output_folder+"speedchange\\")
-            os.makedirs(self.MP3ToolOptions.output_folder+"mix\\")
-
+        # What the tools report is printed, unless a function is given to
+        # take each line instead, e.g. by a batch job keeping it for later.
+        # A tool giving up raises an Errors.ClipError
+        self.report = aReport if aReport is not None else print
+        # Each tool writes to its own subfolder of the output folder
+        self.output_root = self.MP3ToolOptions.output_folder
+        # Every folder is checked, another MP3Tool in this process may be
+        # creating them at the same time
+        for folder in ("", "backwards\\", "intro\\", "speedchange\\", "mix\\"):
+            os.makedirs(self.output_root + folder, exist_ok=True)
+        # A catalog may be shared, e.g. by the requests of the clip server
+        if aCatalog is not None:
+            self.catalog = aCatalog
+        else:
+            self.catalog = Catalog.Catalog(
+                os.path.join(self.MP3ToolOptions.cache_folder, "catalog.sqlite"),
+                self.MP3ToolOptions.catalog_max_age,
+                self.MP3ToolOptions.scan_workers)
+        AudioIO.configureCache(self.MP3ToolOptions.pcm_cache_folder,
+                               self.MP3ToolOptions.pcm_cache_mb * 1024 * 1024,
+                               (self.MP3ToolOptions.memory_cache_mb or 0) * 1024 * 1024)
+        try:
+            self.encoder = Encoders.getEncoder(self.MP3ToolOptions.encoder,
+                                               self.MP3ToolOptions.encode_quality,
+                                               self.MP3ToolOptions.encode_vbr)
+            self.renditions = Encoders.parseRenditions(self.MP3ToolOptions.renditions)
+        except ValueError as e:
+            raise Errors.OptionError(str(e)) from e
+
+    @Trace.traced
     def determineSong(self):
         if self.MP3ToolOptions.song is None:
-            print("Input file:\t\t" + color.BOLD + "Random!!!" + color.END)
-            allMp3s = Utils.findFiles(
-                '*.mp3', self.MP3ToolOptions.source_folder)
-            allMp3s_sample = random.sample(allMp3s, 1)
+            self.report("Input file:\t\t" + color.BOLD + "Random!!!" + color.END)
+            allMp3s_sample = self.catalog.randomTracks(
+                self.MP3ToolOptions.source_folder, 1, self.MP3ToolOptions.rescan,
+                self.MP3ToolOptions.pick_max_files, self.MP3ToolOptions.pick_max_seconds)
+            if len(allMp3s_sample) == 0:
+                raise Errors.SongError("No MP3s found in source folder, aborted.")
             self.MP3ToolOptions.song = allMp3s_sample[0]
         else:
-            print("Input file:\t\t" + color.BOLD +
-                  f"{self.MP3ToolOptions.song}" + color.END)
+            self.report("Input file:\t\t" + color.BOLD +
+                        f"{self.MP3ToolOptions.song}" + color.END)
 
             self.MP3ToolOptions.song = self.MP3ToolOptions.source_folder+self.MP3ToolOptions.song
 
-        print("File Selected:\t\t" + color.BOLD +
-              f"{self.MP3ToolOptions.song}" + color.END)
+        self.report("File Selected:\t\t" + color.BOLD +
+                    f"{self.MP3ToolOptions.song}" + color.END)
 
+    @Trace.traced
     def determineMediaInfo(self):
-        # Read song file
+        # Read song file details, from the catalog unless the file has changed
         try:
-            mp3Info = mediainfo(self.MP3ToolOptions.song)
+            mp3Info = self.catalog.getInfo(self.MP3ToolOptions.song)
             self.MP3ToolOptions.song_mp3Info = mp3Info
-            self.MP3ToolOptions.song_ID3_tags = EasyID3(
-                self.MP3ToolOptions.song)
         except Exception as e:
-            print("Problem with input file, aborted.")
-            print(e)
-            exit(1)
+            raise Errors.InputError("Problem with input file, aborted.", str(e)) from e
 
         # Check for we have an ID3 tag and the required elements
-        if len(self.MP3ToolOptions.song_ID3_tags) == 0:
-            print("Input file has no ID3 tag, aborted.")
-            exit(1)
+        if not mp3Info['tagged']:
+            raise Errors.TagError("Input file has no ID3 tag, aborted.")
 
         tags_found = True
         tags_missing = ''
-        if 'title' not in self.MP3ToolOptions.song_ID3_tags:
+        if mp3Info['title'] is None:
             tags_found = False
-            self.tags_missing += " 'title' "
+            tags_missing += " 'title' "
         else:
-            self.tag_title = self.MP3ToolOptions.song_ID3_tags.get('title', [])[
-                0]
+            self.tag_title = mp3Info['title']
 
-        if 'artist' not in self.MP3ToolOptions.song_ID3_tags:
+        if mp3Info['artist'] is None:
             tags_found = False
             tags_missing += " 'artist' "
         else:
-            self.tag_artist = self.MP3ToolOptions.song_ID3_tags.get('artist', [])[
-                0]
+            self.tag_artist = mp3Info['artist']
 
         if tags_found == False:
-            print("ID3 tag has missing required items, aborted. Missing: ", tags_missing)
-            exit(1)
+            raise Errors.TagError(
+                "ID3 tag has missing required items, aborted. Missing:  " + tags_missing)
 
         # Get the base name of the song
         f_song = os.path.basename(self.MP3ToolOptions.song).replace(
@@ -117,199 +158,356 @@ class MP3Tool:
             self.output_file = self.song_base_name.replace(" ", "_").replace(
                 "/", "-").replace("\"", "").replace("\"", "").replace("'", "")
 
-        print("Output Folder:\t\t" + color.BOLD +
-              f"{self.MP3ToolOptions.output_folder}" + color.END)
-        print("Output File Base Name:\t" + color.BOLD +
-              f"{self.output_file}" + color.END)
-
-    def setMediaInfo(self, song, clip_type, clip_method):
-        # Create Tags object
-        tags = EasyID3(self.MP3ToolOptions.mp3tool_folder+"\\"+song)
-
-        # Set the title & save it
-        tags['title'] = self.tag_title+" by " + \
-            self.tag_artist+": "+clip_method+" - "+clip_type
-        tags['artist'] = self.tag_artist
-        tags.save()
-
+        self.report("Output Folder:\t\t" + color.BOLD +
+                    f"{self.MP3ToolOptions.output_folder}" + color.END)
+        self.report("Output File Base Name:\t" + color.BOLD +
+                    f"{self.output_file}" + color.END)
+
+    @Trace.traced
+    def cutLossless(self, file, start, end, fade_in, fade_out, tags):
+        # Copy the clip's frames from the song, re-encoding only the fades.
+        # Returns False when not enabled or not possible, to encode as usual.
+        # Other renditions than the usual MP3 are encoded from the decoded clip
+        if not self.MP3ToolOptions.lossless_cut:
+            return False
+        if [rendition.path(file) for rendition in self.renditions] != [file]:
+            self.report("Lossless cut not used with renditions, re-encoding.")
+            return False
+        try:
+            return LosslessCut.cutClip(self.MP3ToolOptions.song, file, start, end,
+                                       fade_in, fade_out, self.MP3ToolOptions.cache_folder,
+                                       tags)
+        except Exception as e:
+            self.report(f"Lossless cut not possible, re-encoding:  {e}")
+            return False
+
+    def chooseWindow(self, start, end, song=None):
+        # Fit a window to the song and move it off silence, using the song's
+        # energy envelope from the catalog, if --smart_windows is set
+        if not self.MP3ToolOptions.smart_windows:
+            return start, end
+        song = song or self.MP3ToolOptions.song
+        try:
+            window = Loudness.chooseWindow(self.catalog.getLoudness(song, True), start, end)
+        except Exception as e:
+            self.report(f"Smart window not possible, using the default:  {e}")
+            return start, end
+        if window != (start, end):
+            self.report("Window Moved:\t\t" + color.BOLD +
+                        f"{start / 1000:.1f}-{end / 1000:.1f}s to "
+                        f"{window[0] / 1000:.1f}-{window[1] / 1000:.1f}s" + color.END)
+        return window
+
+    def songWindows(self, method):
+        # Clip and reveal windows of the song for a tool method, in ms. Also
+        # used to plan the part of a song to decode for several clips at once
+        duration_clip = Utils.durationInMs(self.MP3ToolOptions.duration)
+        if method == "songSpeedChange" and self.MP3ToolOptions.song_speed < 1:
+            duration_clip = duration_clip/2
+        return (self.chooseWindow(0, duration_clip),
+                self.chooseWindow(Utils.getMsTime("0:00:15"), Utils.getMsTime("0:00:45")))
+
+    def mediaTags(self, clip_type, clip_method):
+        # Tags of an output file, written with its audio
+        return {
+            'title': self.tag_title+" by " +
+            self.tag_artist+": "+clip_method+" - "+clip_type,
+            'artist': self.tag_artist,
+        }
+
+    def findOutputs(self, method, songs, name):
+        # Clips made before from the same songs with the same options, as
+        # recorded in the output folder, unless --force is set. None when
+        # the clips need making, storeOutputs recording them once made.
+        # From here the clips of this name are made by this thread only
+        if self.held_outputs is not None:
+            self.held_outputs.enter_context(
+                OutputCache.outputLock(self.MP3ToolOptions.output_folder, name))
+        try:
+            self.output_key = OutputCache.jobKey(method, songs, self.MP3ToolOptions,
+                                                 self.encoder.name)
+        except OSError:
+            # Left to decoding to report
+            self.output_key = None
+            return None
+        if self.MP3ToolOptions.force:
+            return None
+        outputs = OutputCache.findOutputs(self.MP3ToolOptions.output_folder, self.output_key)
+        if outputs is not None:
+            self.report("Unchanged:\t\t" + color.BOLD + ", ".join(outputs) + color.END)
+        return outputs
+
+    def storeOutputs(self, method, outputs):
+        # Record the clips made, for findOutputs to find next time
+        if self.output_key is None:
+            return
+        try:
+            OutputCache.storeOutputs(self.MP3ToolOptions.output_folder, self.output_key,
+                                     method, outputs)
+        except OSError as e:
+            self.report(f"Clips not recorded, they will be made again next time:  {e}")
+
+    @Trace.traced
+    def exportFiles(self, exports, bitrate=None):
+        # Encode and tag the files concurrently, each in every rendition
+        # (--renditions), from the one processed sound. The work is done in
+        # ffmpeg child processes or in LAME without the GIL. Files already
+        # written and tagged by a lossless cut (sound of None) are skipped.
+        # Returns the list of files written for each export
+        files = []
+        jobs = []
+        for sound, file, clip_type, clip_method in exports:
+            if sound is None:
+                files.append([file])
+                continue
+            tags = self.mediaTags(clip_type, clip_method) if clip_type is not None else None
+            files.append([rendition.path(file) for rendition in self.renditions])
+            for rendition, path in zip(self.renditions, files[-1]):
+                jobs.append((rendition.encode, self.encoder, sound, path, bitrate, tags))
+        workers = self.MP3ToolOptions.encode_workers or max(len(jobs), 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(*job) for job in jobs]
+            for future in as_completed(futures):
+                future.result()
+        return files
+
+    @Trace.traced
+    def decodeMix(self, songs, volumes, windows):
+        # Decode the songs' segments concurrently, working out the gain
+        # bringing each to its volume. Every song is measured the same way:
+        # when all were analysed by the analyse tool and are decoded as
+        # analysed, at their own frame rate and channels, their levels come
+        # from the catalog, otherwise each is measured once decoded
+        workers = self.MP3ToolOptions.decode_workers or len(songs)
+        sounds = [None] * len(songs)
+        levels = [None] * len(songs)
+        if self.MP3ToolOptions.decode_rate is None and self.MP3ToolOptions.decode_channels is None:
+            blocks = [self.catalog.getLoudness(song) for song in songs]
+            if all(song_blocks is not None for song_blocks in blocks):
+                levels = [Loudness.level(song_blocks, *window)
+                          for song_blocks, window in zip(blocks, windows)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for i, song in enumerate(songs):
+                futures[executor.submit(
+                    AudioIO.decodeWindow, song, *windows[i],
+                    self.MP3ToolOptions.decode_rate, self.MP3ToolOptions.decode_channels)] = i
+            for future in as_completed(futures):
+                i = futures[future]
+                sounds[i] = DSP.Sound.fromSegment(future.result())
+                if levels[i] is None:
+                    levels[i] = sounds[i].dBFS()
+        # Silence is left unchanged
+        gains = [-volume - level if level != -math.inf else 0
+                 for volume, level in zip(volumes, levels)]
+        return sounds, gains
+
+    @Trace.traced
+    @holdsOutputs
     def songReverse(self):
         # Determine the song, if not specified in the command line (--song) a random song will be selected
-        print(color.BOLD + color.GREEN +
-              "Create reverse intro/clip from selected song." + color.END + "\n")
-        self.MP3ToolOptions.output_folder = "output\\backwards\\"
+        self.report(color.BOLD + color.GREEN +
+                    "Create reverse intro/clip from selected song." + color.END + "\n")
+        self.MP3ToolOptions.output_folder = self.output_root + "backwards\\"
         self.determineSong()
         self.determineMediaInfo()
 
+        # Keep the clips made before from this song with these options
+        outputs = self.findOutputs("songReverse", [self.MP3ToolOptions.song],
+                                   self.output_file)
+        if outputs is not None:
+            return outputs
+
         # Specify the output file fadeout and duration
         fade_time = 3000
-        duration_clip = Utils.durationInMs(self.MP3ToolOptions.duration)
-        reveal_start = Utils.getMsTime("0:00:15")
-        reveal_end = Utils.getMsTime("0:00:45")
-        print("Duration:\t\t" + color.BOLD +
-              f"{self.MP3ToolOptions.duration} seconds" + color.END)
-
-        # Read song file
+        (clip_start, clip_end), (reveal_start, reveal_end) = self.songWindows("songReverse")
+        self.report("Duration:\t\t" + color.BOLD +
+                    f"{self.MP3ToolOptions.duration} seconds" + color.END)
+
+        # Copy the reveal's frames, if --lossless_cut is set
+        file_clip = self.MP3ToolOptions.output_folder + self.output_file + "_Clip.mp3"
+        file_reveal = self.MP3ToolOptions.output_folder + self.output_file + "_Reveal.mp3"
+        reveal_done = self.cutLossless(
+            file_reveal, reveal_start, reveal_end, fade_time, fade_time,
+            self.mediaTags('REVEAL', 'Backwards'))
+
+        # Read only the clip and reveal windows of the song file
         try:
-            song = AudioSegment.from_mp3(self.MP3ToolOptions.song)
+            song_extract, song_extract_reveal = AudioIO.decodeWindows(
+                self.MP3ToolOptions.song,
+                [(clip_start, clip_end),
+                 None if reveal_done else (reveal_start, reveal_end)],
+                frame_rate=self.MP3ToolOptions.decode_rate,
+                channels=self.MP3ToolOptions.decode_channels)
         except Exception as e:
-            print("Problem with input file, aborted.")
-            print(e)
-            exit(1)
+            raise Errors.InputError("Problem with input file, aborted.", str(e)) from e
 
-        # Extract segment and reverse it
-        song_extract = song[0:duration_clip]
-        song_reversed = song_extract.reverse()
-        song_extract_reveal = song[reveal_start:reveal_end]
+        # Reverse the clip segment and add fade in/out to clips
+        song_reversed_with_fade = DSP.Sound.fromSegment(song_extract).reverse(
+        ).fadeIn(fade_time).fadeOut(fade_time).toSegment()
+        if not reveal_done:
+            song_reveal = DSP.Sound.fromSegment(song_extract_reveal).fadeIn(
+                fade_time).fadeOut(fade_time).toSegment()
 
-        # Add fade in/out to clips
-        song_reversed_with_fade = song_reversed.fade_in(fade_time)
-        song_reversed_with_fade = song_reversed_with_fade.fade_out(fade_time)
-        song_reveal = song_extract_reveal.fade_in(fade_time)
-        song_reveal = song_reveal.fade_out(fade_time)
-
-        # Saving
+        # Save and tag Clip and Reveal
         try:
-            file_clip = self.MP3ToolOptions.output_folder + self.output_file + "_Clip.mp3"
-            file_reveal = self.MP3ToolOptions.output_folder + self.output_file + "_Reveal.mp3"
-            song_reversed_with_fade.export(
-                file_clip,
-                format="mp3")
-            song_reveal.export(
-                file_reveal,
-                format="mp3")
-            print("Clip:\t\t\t" + color.BOLD + f"{file_clip}" + color.END)
-            print("Reveal:\t\t\t" + color.BOLD + f"{file_reveal}" + color.END)
+            files_clip, files_reveal = self.exportFiles([
+                (song_reversed_with_fade, file_clip, 'CLIP', 'Backwards'),
+                (None if reveal_done else song_reveal, file_reveal, 'REVEAL', 'Backwards')])
+            self.report("Clip:\t\t\t" + color.BOLD + ", ".join(files_clip) + color.END)
+            self.report("Reveal:\t\t\t" + color.BOLD + ", ".join(files_reveal) + color.END)
         except Exception as e:
-            print("Problem with output file(s), aborted.")
-            print(e)
-            exit(1)
+            raise Errors.OutputError("Problem with output file(s), aborted.", str(e)) from e
 
-        self.setMediaInfo(file_clip, 'CLIP', 'Backwards')
-        self.setMediaInfo(file_reveal, 'REVEAL', 'Backwards')
+        self.storeOutputs("songReverse", files_clip + files_reveal)
+        return files_clip + files_reveal
 
+    @Trace.traced
+    @holdsOutputs
     def songIntro(self):
         # Determine the song, if not specified in the command line (--song) a random song will be selected
-        print(color.BOLD + color.GREEN +
-              "Create intro/clip from selected song." + color.END + "\n")
-        self.MP3ToolOptions.output_folder = "output\\intro\\"
+        self.report(color.BOLD + color.GREEN +
+                    "Create intro/clip from selected song." + color.END + "\n")
+        self.MP3ToolOptions.output_folder = self.output_root + "intro\\"
         self.determineSong()
         self.determineMediaInfo()
 
+        # Keep the clips made before from this song with these options
+        outputs = self.findOutputs("songIntro", [self.MP3ToolOptions.song], self.output_file)
+        if outputs is not None:
+            return outputs
+
         # Specify the output file fadeout, duration and reveal timings
         fade_time = 2000
-        duration_clip = Utils.durationInMs(self.MP3ToolOptions.duration)
-        reveal_start = Utils.getMsTime("0:00:15")
-        reveal_end = Utils.getMsTime("0:00:45")
-        print("Duration:\t\t" + color.BOLD +
-              f"{self.MP3ToolOptions.duration} seconds" + color.END)
-
-        # Read song file
+        (clip_start, clip_end), (reveal_start, reveal_end) = self.songWindows("songIntro")
+        self.report("Duration:\t\t" + color.BOLD +
+                    f"{self.MP3ToolOptions.duration} seconds" + color.END)
+
+        # Copy the clip and reveal frames, if --lossless_cut is set
+        file_clip = self.MP3ToolOptions.output_folder + self.output_file + "_Clip.mp3"
+        file_reveal = self.MP3ToolOptions.output_folder + self.output_file + "_Reveal.mp3"
+        clip_done = self.cutLossless(file_clip, clip_start, clip_end, 0, fade_time,
+                                     self.mediaTags('CLIP', 'Intro'))
+        reveal_done = self.cutLossless(
+            file_reveal, reveal_start, reveal_end, fade_time, fade_time,
+            self.mediaTags('REVEAL', 'Intro'))
+
+        # Read only the clip and reveal windows of the song file
         try:
-            song = AudioSegment.from_mp3(self.MP3ToolOptions.song)
+            song_extract, song_extract_reveal = AudioIO.decodeWindows(
+                self.MP3ToolOptions.song,
+                [None if clip_done else (clip_start, clip_end),
+                 None if reveal_done else (reveal_start, reveal_end)],
+                frame_rate=self.MP3ToolOptions.decode_rate,
+                channels=self.MP3ToolOptions.decode_channels)
         except Exception as e:
-            print("Problem with input file, aborted.")
-            print(e)
-            exit(1)
-
-        # Extract segments
-        song_extract = song[0:duration_clip]
-        song_extract_reveal = song[reveal_start:reveal_end]
+            raise Errors.InputError("Problem with input file, aborted.", str(e)) from e
 
         # Add fade in/out to clips
-        song_intro = song_extract.fade_out(fade_time)
-        song_reveal = song_extract_reveal.fade_in(fade_time)
-        song_reveal = song_reveal.fade_out(fade_time)
-
-        # Save Clip and Reveal
+        if not clip_done:
+            song_intro = DSP.Sound.fromSegment(song_extract).fadeOut(
+                fade_time).toSegment()
+        if not reveal_done:
+            song_reveal = DSP.Sound.fromSegment(song_extract_reveal).fadeIn(
+                fade_time).fadeOut(fade_time).toSegment()
+
+        # Save and tag Clip and Reveal
         try:
-            file_clip = self.MP3ToolOptions.output_folder + self.output_file + "_Clip.mp3"
-            file_reveal = self.MP3ToolOptions.output_folder + self.output_file + "_Reveal.mp3"
-            song_intro.export(
-                file_clip,
-                format="mp3")
-            song_reveal.export(
-                file_reveal,
-                format="mp3")
-            print("Clip:\t\t\t" + color.BOLD + f"{file_clip}" + color.END)
-            print("Reveal:\t\t\t" + color.BOLD + f"{file_reveal}" + color.END)
+            files_clip, files_reveal = self.exportFiles([
+                (None if clip_done else song_intro, file_clip, 'CLIP', 'Intro'),
+                (None if reveal_done else song_reveal, file_reveal, 'REVEAL', 'Intro')])
+            self.report("Clip:\t\t\t" + color.BOLD + ", ".join(files_clip) + color.END)
+            self.report("Reveal:\t\t\t" + color.BOLD + ", ".join(files_reveal) + color.END)
         except Exception as e:
-            print("Problem with output file(s), aborted.")
-            print(e)
-            exit(1)
+            raise Errors.OutputError("Problem with output file(s), aborted.", str(e)) from e
 
-        self.setMediaInfo(file_clip, 'CLIP', 'Intro')
-        self.setMediaInfo(file_reveal, 'REVEAL', 'Intro')
+        self.storeOutputs("songIntro", files_clip + files_reveal)
+        return files_clip + files_reveal
 
+    @Trace.traced
+    @holdsOutputs
     def songSpeedChange(self):
         # Determine the song, if not specified in the command line (--song) a random song will be selected
-        print(color.BOLD + color.GREEN +
-              "Create fast or slow clip from selected song." + color.END + "\n")
-        self.MP3ToolOptions.output_folder = "output\\speedchange\\"
+        self.report(color.BOLD + color.GREEN +
+                    "Create fast or slow clip from selected song." + color.END + "\n")
+        self.MP3ToolOptions.output_folder = self.output_root + "speedchange\\"
         self.determineSong()
         self.determineMediaInfo()
 
+        # Keep the clips made before from this song with these options
+        outputs = self.findOutputs("songSpeedChange", [self.MP3ToolOptions.song],
+                                   self.output_file)
+        if outputs is not None:
+            return outputs
+
         # Specify the output file fadeout, duration and reveal timings
         fade_time = 2000
-        if self.MP3ToolOptions.song_speed < 1:
-            duration_clip = Utils.durationInMs(self.MP3ToolOptions.duration)/2
-        else:
-            duration_clip = Utils.durationInMs(self.MP3ToolOptions.duration)
-        reveal_start = Utils.getMsTime("0:00:15")
-        reveal_end = Utils.getMsTime("0:00:45")
-        print("Song Speed:\t\t" + color.BOLD +
-              f"{self.MP3ToolOptions.song_speed}" + color.END)
-        print("Duration:\t\t" + color.BOLD +
-              f"{self.MP3ToolOptions.duration} seconds" + color.END)
-
-        # Opening file
+        (clip_start, clip_end), (reveal_start, reveal_end) = self.songWindows("songSpeedChange")
+        self.report("Song Speed:\t\t" + color.BOLD +
+                    f"{self.MP3ToolOptions.song_speed}" + color.END)
+        self.report("Preserve Pitch:\t\t" + color.BOLD +
+                    f"{self.MP3ToolOptions.preserve_pitch}" + color.END)
+        self.report("Duration:\t\t" + color.BOLD +
+                    f"{self.MP3ToolOptions.duration} seconds" + color.END)
+
+        # Copy the reveal's frames, if --lossless_cut is set
+        file_clip = self.MP3ToolOptions.output_folder + self.output_file + "_Clip.mp3"
+        file_reveal = self.MP3ToolOptions.output_folder + self.output_file + "_Reveal.mp3"
+        reveal_done = self.cutLossless(
+            file_reveal, reveal_start, reveal_end, fade_time, fade_time,
+            self.mediaTags('REVEAL', 'Speed Change'))
+
+        # Read only the clip and reveal windows of the song file
         try:
-            song = AudioSegment.from_mp3(self.MP3ToolOptions.song)
+            song_extract, song_extract_longer = AudioIO.decodeWindows(
+                self.MP3ToolOptions.song,
+                [(clip_start, clip_end),
+                 None if reveal_done else (reveal_start, reveal_end)],
+                frame_rate=self.MP3ToolOptions.decode_rate,
+                channels=self.MP3ToolOptions.decode_channels)
         except Exception as e:
-            print("Problem with input file, aborted.")
-            print(e)
-            exit(1)
-
-        # Extract segments
-        song_extract = song[0:duration_clip]
-        song_extract_longer = song[reveal_start:reveal_end]
+            raise Errors.InputError("Problem with input file, aborted.", str(e)) from e
 
         # Add fade in/out to clips
-        song_clip = song_extract.fade_out(fade_time)
-        song_reveal = song_extract_longer.fade_in(fade_time)
-        song_reveal = song_reveal.fade_out(fade_time)
-
-        # Change speed of song
-        speed_change_song = Utils.changeSongSpeed(
-            song_clip, self.MP3ToolOptions.song_speed)
+        song_clip = DSP.Sound.fromSegment(song_extract).fadeOut(fade_time)
+        if not reveal_done:
+            song_reveal = DSP.Sound.fromSegment(song_extract_longer).fadeIn(
+                fade_time).fadeOut(fade_time).toSegment()
+
+        # Change speed of song, keeping its pitch if --preserve_pitch is set
+        if self.MP3ToolOptions.preserve_pitch:
+            speed_change_song = song_clip.timeStretch(
+                self.MP3ToolOptions.song_speed).toSegment()
+        else:
+            speed_change_song = song_clip.changeSpeed(
+                self.MP3ToolOptions.song_speed).toSegment()
 
-        # Save Clip and Reveal
+        # Save and tag Clip and Reveal
         try:
-            file_clip = self.MP3ToolOptions.output_folder + self.output_file + "_Clip.mp3"
-            file_reveal = self.MP3ToolOptions.output_folder + self.output_file + "_Reveal.mp3"
-            speed_change_song.export(
-                file_clip,
-                format="mp3")
-            song_reveal.export(
-                file_reveal,
-                format="mp3")
-            print("Clip:\t\t\t" + color.BOLD + f"{file_clip}" + color.END)
-            print("Reveal:\t\t\t" + color.BOLD + f"{file_reveal}" + color.END)
+            files_clip, files_reveal = self.exportFiles([
+                (speed_change_song, file_clip, 'CLIP', 'Speed Change'),
+                (None if reveal_done else song_reveal, file_reveal, 'REVEAL', 'Speed Change')])
+            self.report("Clip:\t\t\t" + color.BOLD + ", ".join(files_clip) + color.END)
+            self.report("Reveal:\t\t\t" + color.BOLD + ", ".join(files_reveal) + color.END)
         except Exception as e:
-            print("Problem with output file(s), aborted.")
-            print(e)
-            exit(1)
+            raise Errors.OutputError("Problem with output file(s), aborted.", str(e)) from e
 
-        self.setMediaInfo(file_clip, 'CLIP', 'Speed Change')
-        self.setMediaInfo(file_reveal, 'REVEAL', 'Speed Change')
+        self.storeOutputs("songSpeedChange", files_clip + files_reveal)
+        return files_clip + files_reveal
 
+    @Trace.traced
+    @holdsOutputs
     def songMix(self):
-        print(color.BOLD + color.GREEN +
-              f"Create mix from {self.MP3ToolOptions.mixes} random MP3s!" + color.END + "\n")
+        self.report(color.BOLD + color.GREEN +
+                    f"Create mix from {self.MP3ToolOptions.mixes} random MP3s!" + color.END + "\n")
 
         # Get 3 random MP3s
-        self.MP3ToolOptions.output_folder = "output\\mix\\"
-        allMp3s = Utils.findFiles('*.mp3', self.MP3ToolOptions.source_folder)
-        allMp3s_sample = random.sample(allMp3s, 3)
+        self.MP3ToolOptions.output_folder = self.output_root + "mix\\"
+        allMp3s_sample = self.catalog.randomTracks(
+            self.MP3ToolOptions.source_folder, 3, self.MP3ToolOptions.rescan,
+            self.MP3ToolOptions.pick_max_files, self.MP3ToolOptions.pick_max_seconds)
+        if len(allMp3s_sample) < self.MP3ToolOptions.mixes:
+            raise Errors.SongError("Not enough MP3s found in source folder, aborted.")
 
         # How many songs are we mixing?
         if self.MP3ToolOptions.mixes == 2:
@@ -326,10 +524,10 @@ class MP3Tool:
             if self.MP3ToolOptions.custom_output_file != None:
                 self.MP3ToolOptions.outputFile = self.MP3ToolOptions.custom_output_file
 
-            print("Song 1:\t\t" + color.BOLD +
-                  f"{self.MP3ToolOptions.song1}" + color.END)
-            print("Song 2:\t\t" + color.BOLD +
-                  f"{self.MP3ToolOptions.song2}" + color.END)
+            self.report("Song 1:\t\t" + color.BOLD +
+                        f"{self.MP3ToolOptions.song1}" + color.END)
+            self.report("Song 2:\t\t" + color.BOLD +
+                        f"{self.MP3ToolOptions.song2}" + color.END)
 
         else:
             # Mix 3 songs...
@@ -349,23 +547,12 @@ class MP3Tool:
             if self.MP3ToolOptions.custom_output_file != None:
                 self.MP3ToolOptions.outputFile = self.MP3ToolOptions.custom_output_file
 
-            print("Song 1:\t\t" + color.BOLD +
-                  f"{self.MP3ToolOptions.song1}" + color.END)
-            print("Song 2:\t\t" + color.BOLD +
-                  f"{self.MP3ToolOptions.song2}" + color.END)
-            print("Song 3:\t\t" + color.BOLD +
-                  f"{self.MP3ToolOptions.song3}" + color.END)
-
-        # Opening file
-        try:
-            song1 = AudioSegment.from_mp3(self.MP3ToolOptions.song1)
-            song2 = AudioSegment.from_mp3(self.MP3ToolOptions.song2)
-            if self.MP3ToolOptions.mixes != 2:
-                song3 = AudioSegment.from_mp3(self.MP3ToolOptions.song3)
-        except Exception as e:
-            print("Problem with input file, aborted.")
-            print(e)
-            exit(1)
+            self.report("Song 1:\t\t" + color.BOLD +
+                        f"{self.MP3ToolOptions.song1}" + color.END)
+            self.report("Song 2:\t\t" + color.BOLD +
+                        f"{self.MP3ToolOptions.song2}" + color.END)
+            self.report("Song 3:\t\t" + color.BOLD +
+                        f"{self.MP3ToolOptions.song3}" + color.END)
 
         # Specify the output file fadeout, duration and reveal timings
         hms_start = "0:01:00"
@@ -373,66 +560,60 @@ class MP3Tool:
         start_time = Utils.getMsTime(hms_start)
         end_time = Utils.getMsTime(hms_end)
 
-        # Extract segments
-        song_extract1 = song1[start_time:end_time]
-        song_extract2 = song2[start_time:end_time]
+        # Read only the mixed segment of each song file, and normalize volume
+        songs = [self.MP3ToolOptions.song1, self.MP3ToolOptions.song2]
+        volumes = [self.MP3ToolOptions.song1_vol, self.MP3ToolOptions.song2_vol]
         if self.MP3ToolOptions.mixes != 2:
-            song_extract3 = song3[start_time:end_time]
-
-        # Normalize volume
-        song1_vol = -self.MP3ToolOptions.song1_vol
-        song2_vol = -self.MP3ToolOptions.song2_vol
-        song1_adjusted = Utils.soundSetToTargetLevel(
-            song_extract1, song1_vol)
-        song2_adjusted = Utils.soundSetToTargetLevel(
-            song_extract2, song2_vol)
-        if self.MP3ToolOptions.mixes != 2:
-            song3_vol = -self.MP3ToolOptions.song3_vol
-            song3_adjusted = Utils.soundSetToTargetLevel(
-                song_extract3, song3_vol)
+            songs.append(self.MP3ToolOptions.song3)
+            volumes.append(self.MP3ToolOptions.song3_vol)
+        # Keep the mix made before from these songs with these options
+        outputs = self.findOutputs("songMix", songs, self.MP3ToolOptions.outputFile)
+        if outputs is not None:
+            return outputs
+        windows = [self.chooseWindow(start_time, end_time, song) for song in songs]
+        try:
+            sounds, gains = self.decodeMix(songs, volumes, windows)
+        except Exception as e:
+            raise Errors.InputError("Problem with input file, aborted.", str(e)) from e
 
-        # Create the mix by combining the extracted segments
-        played_together = song1_adjusted.overlay(song2_adjusted)
-        if self.MP3ToolOptions.mixes != 2:
-            played_together2 = played_together.overlay(song3_adjusted)
+        # Create the mix by combining the extracted segments, applying each
+        # one's gain as it is added
+        played_together = DSP.Sound.mix(sounds, gains)
 
         # Get bitrate
-        mp3Info = mediainfo(self.MP3ToolOptions.song1)
-        if "bit_rate" in mp3Info:
-            original_bitrate = mp3Info['bit_rate']
+        mp3Info = self.catalog.getInfo(self.MP3ToolOptions.song1)
+        if mp3Info['bit_rate'] is not None:
+            original_bitrate = str(mp3Info['bit_rate'])
         else:
-            original_bitrate = 128000
+            original_bitrate = "128000"
 
         # Save Mix
         try:
             file_mix = self.MP3ToolOptions.output_folder + self.MP3ToolOptions.outputFile
-            if self.MP3ToolOptions.mixes == 2:
-                played_together.export(
-                    file_mix, format="mp3", bitrate=original_bitrate)
-            else:
-                played_together2.export(
-                    file_mix, format="mp3", bitrate=original_bitrate)
-            print("Mix File:\t" + color.BOLD + f"{file_mix}" + color.END)
+            files_mix, = self.exportFiles(
+                [(played_together.toSegment(), file_mix, None, None)], original_bitrate)
+            self.report("Mix File:\t" + color.BOLD + ", ".join(files_mix) + color.END)
         except Exception as e:
-            print("Problem creating output file, aborted.")
-            print(e)
-            exit(1)
+            raise Errors.OutputError("Problem creating output file, aborted.", str(e)) from e
 
+        self.storeOutputs("songMix", files_mix)
+        return files_mix
+
+    @Trace.traced
+    @holdsOutputs
     def songMixSelected(self):
-        print(color.BOLD + color.GREEN +
-              f"Create mix from {self.MP3ToolOptions.mixes} MP3s!" + color.END + "\n")
-        self.MP3ToolOptions.output_folder = "output\\mix\\"
+        self.report(color.BOLD + color.GREEN +
+                    f"Create mix from {self.MP3ToolOptions.mixes} MP3s!" + color.END + "\n")
+        self.MP3ToolOptions.output_folder = self.output_root + "mix\\"
 
         # How many songs are we mixing?
         if self.MP3ToolOptions.mixes == 2:
             # Mix 2 songs...
             if self.MP3ToolOptions.song1 is None:
-                print("Must Specify Song 1!")
-                exit(1)
+                raise Errors.OptionError("Must Specify Song 1!")
 
             if self.MP3ToolOptions.song2 is None:
-                print("Must Specify Song 2!")
-                exit(1)
+                raise Errors.OptionError("Must Specify Song 2!")
 
             f_song1 = os.path.basename(self.MP3ToolOptions.song1).replace(
                 " ", "_").replace(".mp3", "")
@@ -440,10 +621,10 @@ class MP3Tool:
                 " ", "_").replace(".mp3", "")
             self.MP3ToolOptions.outputFile = f_song1 + "--" + f_song2 + ".mp3"
 
-            print("Song 1:\t\t" + color.BOLD +
-                  f"{self.MP3ToolOptions.song1}" + color.END)
-            print("Song 2:\t\t" + color.BOLD +
-                  f"{self.MP3ToolOptions.song2}" + color.END)
+            self.report("Song 1:\t\t" + color.BOLD +
+                        f"{self.MP3ToolOptions.song1}" + color.END)
+            self.report("Song 2:\t\t" + color.BOLD +
+                        f"{self.MP3ToolOptions.song2}" + color.END)
 
         else:
             # Mix 3 songs...
@@ -456,23 +637,12 @@ class MP3Tool:
             self.MP3ToolOptions.outputFile = f_song1 + \
                 "--" + f_song2 + "--" + f_song3 + ".mp3"
 
-            print("Song 1:\t\t" + color.BOLD +
-                  f"{self.MP3ToolOptions.song1}" + color.END)
-            print("Song 2:\t\t" + color.BOLD +
-                  f"{self.MP3ToolOptions.song2}" + color.END)
-            print("Song 3:\t\t" + color.BOLD +
-                  f"{self.MP3ToolOptions.song3}" + color.END)
-
-        # Opening file
-        try:
-            song1 = AudioSegment.from_mp3(self.MP3ToolOptions.song1)
-            song2 = AudioSegment.from_mp3(self.MP3ToolOptions.song2)
-            if self.MP3ToolOptions.mixes != 2:
-                song3 = AudioSegment.from_mp3(self.MP3ToolOptions.song3)
-        except Exception as e:
-            print("Problem with input file, aborted.")
-            print(e)
-            exit(1)
+            self.report("Song 1:\t\t" + color.BOLD +
+                        f"{self.MP3ToolOptions.song1}" + color.END)
+            self.report("Song 2:\t\t" + color.BOLD +
+                        f"{self.MP3ToolOptions.song2}" + color.END)
+            self.report("Song 3:\t\t" + color.BOLD +
+                        f"{self.MP3ToolOptions.song3}" + color.END)
 
         # Specify the output file fadeout, duration and reveal timings
         hms_start = "0:00:30"
@@ -480,48 +650,41 @@ class MP3Tool:
         start_time = Utils.getMsTime(hms_start)
         end_time = Utils.getMsTime(hms_end)
 
-        # Extract segments
-        song_extract1 = song1[start_time:end_time]
-        song_extract2 = song2[start_time:end_time]
-        if self.MP3ToolOptions.mixes != 2:
-            song_extract3 = song3[start_time:end_time]
-
-        # Normalize volume
-        song1_vol = -self.MP3ToolOptions.song1_vol
-        song2_vol = -self.MP3ToolOptions.song2_vol
+        # Read only the mixed segment of each song file, and normalize volume
+        songs = [self.MP3ToolOptions.song1, self.MP3ToolOptions.song2]
+        volumes = [self.MP3ToolOptions.song1_vol, self.MP3ToolOptions.song2_vol]
         if self.MP3ToolOptions.mixes != 2:
-            song3_vol = -self.MP3ToolOptions.song3_vol
-        song1_adjusted = Utils.soundSetToTargetLevel(
-            song_extract1, song1_vol)
-        song2_adjusted = Utils.soundSetToTargetLevel(
-            song_extract2, song2_vol)
-        if self.MP3ToolOptions.mixes != 2:
-            song3_adjusted = Utils.soundSetToTargetLevel(
-                song_extract3, song3_vol)
+            songs.append(self.MP3ToolOptions.song3)
+            volumes.append(self.MP3ToolOptions.song3_vol)
+        # Keep the mix made before from these songs with these options
+        outputs = self.findOutputs("songMixSelected", songs, self.MP3ToolOptions.outputFile)
+        if outputs is not None:
+            return outputs
+        windows = [self.chooseWindow(start_time, end_time, song) for song in songs]
+        try:
+            sounds, gains = self.decodeMix(songs, volumes, windows)
+        except Exception as e:
+            raise Errors.InputError("Problem with input file, aborted.", str(e)) from e
 
-        # Create the mix by combining the extracted segments
-        played_together = song1_adjusted.overlay(song2_adjusted)
-        if self.MP3ToolOptions.mixes != 2:
-            played_together2 = played_together.overlay(song3_adjusted)
+        # Create the mix by combining the extracted segments, applying each
+        # one's gain as it is added
+        played_together = DSP.Sound.mix(sounds, gains)
 
         # Get bitrate
-        mp3Info = mediainfo(self.MP3ToolOptions.song1)
-        if "bit_rate" in mp3Info:
-            original_bitrate = mp3Info['bit_rate']
+        mp3Info = self.catalog.getInfo(self.MP3ToolOptions.song1)
+        if mp3Info['bit_rate'] is not None:
+            original_bitrate = str(mp3Info['bit_rate'])
         else:
-            original_bitrate = 128000
+            original_bitrate = "128000"
 
         # Opening file
         try:
             file_mix = self.MP3ToolOptions.output_folder + self.MP3ToolOptions.outputFile
-            if self.MP3ToolOptions.mixes == 2:
-                played_together.export(self.MP3ToolOptions.output_folder +
-                                       self.MP3ToolOptions.outputFile, format="mp3", bitrate=original_bitrate)
-            else:
-                played_together2.export(self.MP3ToolOptions.output_folder +
-                                        self.MP3ToolOptions.outputFile, format="mp3", bitrate=original_bitrate)
-            print("Mix File:\t" + color.BOLD + f"{file_mix}" + color.END)
+            files_mix, = self.exportFiles(
+                [(played_together.toSegment(), file_mix, None, None)], original_bitrate)
+            self.report("Mix File:\t" + color.BOLD + ", ".join(files_mix) + color.END)
         except Exception as e:
-            print("Problem creating output file, aborted.")
-            print(e)
-            exit(1)
+            raise Errors.OutputError("Problem creating output file, aborted.", str(e)) from e
+
+        self.storeOutputs("songMixSelected", files_mix)
+        return files_mix
@@ -19,6 +19,9 @@
 """
 
 
+import os
+
+
 class MP3ToolOptions:
     tool = None
     source_folder = None
@@ -37,6 +40,36 @@ class MP3ToolOptions:
     supersonic = 2.0
     custom_output_file = None
     duration = 30
+    cache_folder = os.path.join("output", "cache")
+    catalog_max_age = 86400
+    pcm_cache_folder = os.path.join("output", "cache", "pcm")
+    pcm_cache_mb = 1024
+    decode_rate = None
+    decode_channels = None
+    memory_cache_mb = None
+    serve_host = "127.0.0.1"
+    serve_port = 8765
+    rescan = False
+    scan_workers = 8
+    pick_max_files = None
+    pick_max_seconds = None
+    lossless_cut = False
+    batch_tools = "intro"
+    batch_count = 10
+    batch_songs = None
+    manifest = None
+    workers = None
+    decode_workers = None
+    encoder = None
+    encode_quality = None
+    encode_vbr = None
+    encode_workers = None
+    renditions = None
+    force = False
+    preserve_pitch = False
+    smart_windows = False
+    trace_json = None
+    profile = False
 
 
 class color:
@@ -0,0 +1,268 @@
+"""
+    MP3Tool
+
+    Manifest.py: Clips listed in a JSON or YAML manifest, grouped by song
+    so each song is decoded once for all of its clips
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from common import AudioIO
+from common import Batch
+from common import Errors
+from common import Library
+from common import Trace
+from common.MP3Tool import MP3Tool
+from common.MP3ToolOptions import MP3ToolOptions
+from common.MP3ToolOptions import color
+
+# PyYAML is optional, without it manifests are JSON only
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+# Tools a manifest can list, those taking their clips from a single song
+TOOLS = {
+    "intro": "songIntro",
+    "reverse": "songReverse",
+    "speed_change": "songSpeedChange",
+}
+
+# Keys of a manifest entry that are not options
+ENTRY_KEYS = ("tool", "tools")
+
+
+def loadManifest(path):
+    """
+    Read and check a manifest
+
+    A manifest holds a list of clips, each naming its tools, its song (a
+    random song when left out) and any options to change, and defaults
+    for the options of every clip:
+
+        defaults:
+          source_folder: 'C:\\music\\'
+          duration: 25
+        clips:
+          - song: song.mp3
+            tools: [intro, reverse, speed_change]
+            song_speed: 1.5
+          - tool: intro
+
+    Arguments:
+    path - path of the .json, .yaml or .yml file
+
+    Return:
+    (defaults, clips) tuple, clips a list of (tools, options) tuples
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ValueError("YAML manifests need PyYAML, pip install pyyaml")
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('clips'), list):
+        raise ValueError("Manifest must have a list of clips")
+    if len(manifest['clips']) == 0:
+        raise ValueError("Manifest has no clips")
+    defaults = manifest.get('defaults') or {}
+    if not isinstance(defaults, dict):
+        raise ValueError("Manifest defaults must be a mapping of option to value")
+    checkOptions(defaults, "defaults")
+
+    clips = []
+    for number, entry in enumerate(manifest['clips'], 1):
+        where = f"clip {number}"
+        if not isinstance(entry, dict):
+            raise ValueError(f"Manifest {where} must be a mapping")
+        tools = entry.get('tools', entry.get('tool'))
+        if isinstance(tools, str):
+            tools = [tool.strip() for tool in tools.split(",") if tool.strip()]
+        if not tools:
+            raise ValueError(f"Manifest {where} has no tool")
+        for tool in tools:
+            if tool not in TOOLS:
+                raise ValueError(f"Manifest {where}: unknown tool {tool}, must be one of: " +
+                                 ", ".join(TOOLS))
+        options = dict((name, value) for name, value in entry.items()
+                       if name not in ENTRY_KEYS)
+        checkOptions(options, where)
+        clips.append((tools, options))
+    return defaults, clips
+
+
+def checkOptions(options, where):
+    """
+    Check the option names of a manifest entry, named as the attributes
+    of MP3ToolOptions or the long command line arguments
+
+    Arguments:
+    options - dictionary of option name to value
+    where - part of the manifest, for the error message
+    """
+    for name in options:
+        if name.startswith("_") or name in ("tool", "manifest") or \
+                not (hasattr(MP3ToolOptions, name) or name in Library.ARGUMENT_DEFAULTS):
+            raise ValueError(f"Manifest {where}: unknown option {name}")
+
+
+def planJobs(mp3Tool, options, defaults, clips):
+    """
+    Work out the jobs of a manifest, grouped by song
+
+    Clips without a song are given distinct random songs from their
+    source folder.
+
+    Arguments:
+    mp3Tool - MP3Tool object, for its catalog
+    options - MP3ToolOptions class
+    defaults - option values of every clip, from the manifest
+    clips - list of (tools, options) tuples, from the manifest
+
+    Return:
+    Dictionary of song path to list of (tool, option values) tuples, in
+    manifest order
+    """
+    values = Batch.optionValues(options)
+    values.update(defaults)
+    # Each job names its output after its own song, unless the clip says
+    values['custom_output_file'] = defaults.get('custom_output_file')
+
+    entries = []
+    random_counts = {}
+    for tools, clip_options in clips:
+        clip_values = dict(values, **clip_options)
+        entries.append((tools, clip_values))
+        if clip_values['song'] is None:
+            folder = clip_values['source_folder']
+            random_counts[folder] = random_counts.get(folder, 0) + 1
+
+    random_songs = {}
+    for folder, count in random_counts.items():
+        songs = mp3Tool.catalog.randomTracks(
+            folder, count, values['rescan'],
+            values['pick_max_files'], values['pick_max_seconds'])
+        if len(songs) == 0:
+            raise Errors.SongError(f"No MP3s found in source folder {folder}, aborted.")
+        if len(songs) < count:
+            print(f"Only {len(songs)} MP3s found in source folder {folder}, songs are reused.")
+        random_songs[folder] = [songs[i % len(songs)] for i in range(count)]
+
+    groups = {}
+    for tools, clip_values in entries:
+        if clip_values['song'] is None:
+            song = random_songs[clip_values['source_folder']].pop(0)
+        else:
+            song = (clip_values['source_folder'] or "") + clip_values['song']
+        clip_values['song'] = song
+        clip_values['source_folder'] = ""
+        for tool in tools:
+            groups.setdefault(song, []).append((tool, dict(clip_values)))
+    return groups
+
+
+def runGroup(song, jobs):
+    """
+    Run the jobs taking clips from one song, in a worker process
+
+    The part of the song covering the windows of all the jobs is decoded
+    once and held, then each job slices its clip and reveal from it.
+
+    Arguments:
+    song - path of the song
+    jobs - list of (tool, option values) tuples
+
+    Return:
+    List of job results, as returned by Batch.runJob
+    """
+    first = jobs[0][1]
+    if first.get('trace_json'):
+        Trace.enable()
+    try:
+        windows = []
+        for tool, values in jobs:
+            options = type("MP3ToolOptions", (MP3ToolOptions,), dict(values))
+            # What the jobs report about their windows is reported again as they run
+            windows += MP3Tool(options, aReport=lambda line: None).songWindows(TOOLS[tool])
+        AudioIO.holdSpan(song, min(start for start, end in windows),
+                         max(end for start, end in windows),
+                         first['decode_rate'], first['decode_channels'])
+    except Exception:
+        # Left to the jobs themselves to report
+        pass
+    try:
+        return [Batch.runJob(tool, values) for tool, values in jobs]
+    finally:
+        AudioIO.releaseSpan(song)
+
+
+def runManifest(mp3Tool, options):
+    """
+    Create the clips listed in a manifest, songs in parallel
+
+    Arguments:
+    mp3Tool - MP3Tool object
+    options - MP3ToolOptions class
+
+    Return:
+    List of job results, as returned by Batch.runJob
+    """
+    print(color.BOLD + color.GREEN +
+          "Create the clips listed in a manifest." + color.END + "\n")
+    if options.manifest is None:
+        raise Errors.OptionError("No manifest given (--manifest), aborted.")
+    try:
+        defaults, clips = loadManifest(options.manifest)
+    except (OSError, ValueError) as e:
+        raise Errors.OptionError("Problem with manifest, aborted.", str(e)) from e
+    groups = planJobs(mp3Tool, options, defaults, clips)
+    workers = min(options.workers or os.cpu_count(), len(groups))
+    print("Songs:\t\t" + color.BOLD + f"{len(groups)}" + color.END)
+    print("Jobs:\t\t" + color.BOLD + f"{sum(len(jobs) for jobs in groups.values())}" + color.END)
+    print("Workers:\t" + color.BOLD + f"{workers}" + color.END + "\n")
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(runGroup, song, jobs) for song, jobs in groups.items()]
+        for future in as_completed(futures):
+            for result in future.result():
+                results.append(result)
+                Trace.extend(result['trace'])
+                song = os.path.basename(result['song'])
+                if result['error'] is None:
+                    print(color.GREEN + "[ OK ] " + color.END +
+                          f"{result['tool']}\t{song}\t({result['seconds']:.1f}s)")
+                    for output in result['outputs']:
+                        print("\t" + color.BOLD + output + color.END)
+                else:
+                    print(color.RED + "[FAIL] " + color.END +
+                          f"{result['tool']}\t{song}\t{result['error']}")
+    elapsed = time.perf_counter() - start
+
+    clips = sum(len(result['outputs']) for result in results)
+    failed = sum(1 for result in results if result['error'] is not None)
+    print("\nJobs:\t\t" + color.BOLD + f"{len(results) - failed} done, {failed} failed" + color.END)
+    print("Clips:\t\t" + color.BOLD + f"{clips} in {elapsed:.1f} seconds" + color.END)
+    return results
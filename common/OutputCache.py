@@ -0,0 +1,196 @@
+"""
+    MP3Tool
+
+    OutputCache.py: Record of the clips made in an output folder, so a
+    clip made before from the same songs and options is not made again
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import json
+import time
+import hashlib
+import threading
+import contextlib
+from common import Trace
+
+
+# File in each output folder recording the clips made there
+MANIFEST_NAME = "outputs.json"
+
+# Changed when the clips made from the same songs and options change, so
+# clips made by an earlier version are made again
+VERSION = 2
+
+# Options changing the clips a tool makes
+OUTPUT_OPTIONS = (
+    "duration",
+    "song_speed",
+    "preserve_pitch",
+    "smart_windows",
+    "lossless_cut",
+    "decode_rate",
+    "decode_channels",
+    "encode_quality",
+    "encode_vbr",
+    "renditions",
+    "mixes",
+    "song1_vol",
+    "song2_vol",
+    "song3_vol",
+    "custom_output_file",
+)
+
+_lock = threading.Lock()
+
+# Lock and number of threads using it, of each output name being made
+_output_locks = {}
+
+
+def jobKey(method, songs, options, encoder):
+    """
+    Key of the clips a tool makes, changing when a song file or an
+    option changing the clips does
+
+    Arguments:
+    method - MP3Tool method of the tool
+    songs - list of paths of the songs the clips are made from
+    options - MP3ToolOptions class
+    encoder - name of the MP3 encoder
+
+    Return:
+    Key as a hex string
+    """
+    sources = []
+    for song in songs:
+        stat = os.stat(song)
+        sources.append([os.path.abspath(song), stat.st_size, stat.st_mtime_ns])
+    job = {
+        'version': VERSION,
+        'tool': method,
+        'songs': sources,
+        'encoder': encoder,
+        'options': dict((name, getattr(options, name, None)) for name in OUTPUT_OPTIONS),
+    }
+    return hashlib.sha1(json.dumps(job, sort_keys=True).encode()).hexdigest()
+
+
+@contextlib.contextmanager
+def outputLock(folder, name):
+    """
+    Make the clips of an output name in a folder one thread at a time, so
+    threads making the same clips at once, e.g. two server requests for the
+    same song, don't write the same files together. The second then finds
+    the first's clips, when made with the same options
+
+    Arguments:
+    folder - output folder
+    name - base name of the clips
+    """
+    key = (os.path.abspath(folder), name)
+    with _lock:
+        entry = _output_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _output_locks[key]
+
+
+def fileState(path):
+    """Size and modification time of a file, None if missing"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def readManifest(folder):
+    """
+    Read the record of the clips made in an output folder
+
+    Arguments:
+    folder - output folder
+
+    Return:
+    Dictionary of job key to entry, empty when there is no record
+    """
+    try:
+        with open(folder + MANIFEST_NAME, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+@Trace.traced
+def findOutputs(folder, key):
+    """
+    Find the clips of a job made before
+
+    Clips changed or deleted since are not used, so the job is run again.
+
+    Arguments:
+    folder - output folder
+    key - job key, as returned by jobKey
+
+    Return:
+    List of paths of the clips, None when they need making
+    """
+    entry = readManifest(folder).get(key)
+    if not isinstance(entry, dict) or not entry.get('outputs'):
+        return None
+    for path, state in entry['outputs']:
+        if fileState(path) != state:
+            return None
+    return [path for path, state in entry['outputs']]
+
+
+@Trace.traced
+def storeOutputs(folder, key, method, outputs):
+    """
+    Record the clips of a job
+
+    Entries for other jobs writing the same files are dropped, as those
+    files are now this job's. Several processes may record clips in the
+    same folder at once, an entry lost that way only means the job is run
+    again next time.
+
+    Arguments:
+    folder - output folder
+    key - job key, as returned by jobKey
+    method - MP3Tool method of the tool, kept for reading the record
+    outputs - list of paths of the clips
+    """
+    states = [[path, fileState(path)] for path in outputs]
+    if any(state is None for path, state in states):
+        return
+    with _lock:
+        manifest = readManifest(folder)
+        manifest = dict((other, entry) for other, entry in manifest.items()
+                        if isinstance(entry, dict) and not (set(outputs) & set(
+                            path for path, state in entry.get('outputs', []))))
+        manifest[key] = {'tool': method, 'created': time.time(), 'outputs': states}
+        temp = folder + MANIFEST_NAME + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(temp, folder + MANIFEST_NAME)
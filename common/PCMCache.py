@@ -0,0 +1,276 @@
+"""
+    MP3Tool
+
+    PCMCache.py: On-disk cache of decoded audio
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import json
+import mmap
+import hashlib
+import threading
+from collections import OrderedDict
+from pydub import AudioSegment
+
+
+def windowKey(path, start_ms, end_ms, frame_rate=None, channels=None):
+    """
+    Identify a decoded window of a file
+
+    Arguments:
+    path - path to audio file
+    start_ms - start of the window in milliseconds
+    end_ms - end of the window in milliseconds, None = end of file
+    frame_rate - frame rate decoded to, None = the file's
+    channels - channels decoded to, None = the file's
+
+    Return:
+    List identifying the window
+    """
+    st = os.stat(path)
+    return [os.path.abspath(path), st.st_size, st.st_mtime_ns,
+            start_ms, end_ms, frame_rate, channels]
+
+
+class PCMCache:
+    """
+    Decoded windows of audio files, kept as raw PCM files
+
+    Each entry is keyed by the file's path, size and modification time,
+    the window decoded and the frame rate and channels it was decoded to.
+    Entries are read back memory mapped. When the cache grows past its
+    byte budget the least recently used entries are removed.
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        # The budget may have been lowered since the last run
+        self.evict()
+
+    def key(self, path, start_ms, end_ms, frame_rate=None, channels=None):
+        """Identify a decoded window of a file, see windowKey"""
+        return windowKey(path, start_ms, end_ms, frame_rate, channels)
+
+    def _path(self, key):
+        # Entry file path, without extension
+        return os.path.join(self.folder, hashlib.sha1(
+            json.dumps(key).encode()).hexdigest())
+
+    def get(self, key):
+        """
+        Look up a decoded window
+
+        Arguments:
+        key - as returned by windowKey
+
+        Return:
+        pydub sound object backed by a memory map of the entry, None if
+        not cached
+        """
+        path = self._path(key)
+        try:
+            with open(path + ".json") as f:
+                header = json.load(f)
+            if header['key'] != key:
+                raise KeyError("key")
+            with open(path + ".pcm", "rb") as f:
+                if os.fstat(f.fileno()).st_size != header['bytes']:
+                    raise ValueError("size")
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) \
+                    if header['bytes'] > 0 else b""
+            # Mark as recently used
+            os.utime(path + ".pcm")
+        except (OSError, ValueError, KeyError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return AudioSegment(data=data,
+                            sample_width=header['sample_width'],
+                            frame_rate=header['frame_rate'],
+                            channels=header['channels'])
+
+    def put(self, key, sound):
+        """
+        Add a decoded window, evicting old entries if over budget
+
+        Arguments:
+        key - as returned by windowKey
+        sound - pydub sound object
+        """
+        data = sound.raw_data
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        header = {
+            'key': key,
+            'sample_width': sound.sample_width,
+            'frame_rate': sound.frame_rate,
+            'channels': sound.channels,
+            'bytes': len(data),
+        }
+        # Written under temporary names then renamed, as other processes,
+        # and other threads of this one, may be using the cache at the same time
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(path + ".pcm" + suffix, "wb") as f:
+                f.write(data)
+            with open(path + ".json" + suffix, "w") as f:
+                json.dump(header, f)
+            os.replace(path + ".pcm" + suffix, path + ".pcm")
+            os.replace(path + ".json" + suffix, path + ".json")
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until within the byte budget"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith(".pcm"):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                total += st.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                os.remove(path[:-len(".pcm")] + ".json")
+            except OSError:
+                # In use (e.g. memory mapped on Windows) or already gone
+                continue
+            total -= size
+            with self.lock:
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Hit, miss and eviction counts of this process
+
+        Return:
+        Dictionary with hits, misses and evictions
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions}
+
+
+class MemoryCache:
+    """
+    Decoded windows of audio files kept in memory, for long running use
+
+    The least recently used windows are dropped once the byte budget is
+    reached. Windows not in memory are looked up in, and added to, an
+    optional backing PCMCache. Safe to use from several threads.
+    """
+
+    def __init__(self, max_bytes, backing=None):
+        self.max_bytes = max_bytes
+        self.backing = backing
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def key(self, path, start_ms, end_ms, frame_rate=None, channels=None):
+        """Identify a decoded window of a file, see windowKey"""
+        return windowKey(path, start_ms, end_ms, frame_rate, channels)
+
+    def _add(self, key, sound):
+        # Add to memory, dropping the least recently used over budget
+        size = len(sound.raw_data)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = sound
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                old_key, old_sound = self.entries.popitem(last=False)
+                self.bytes -= len(old_sound.raw_data)
+                self.evictions += 1
+
+    def get(self, key):
+        """
+        Look up a decoded window, in memory then in the backing cache
+
+        Arguments:
+        key - as returned by windowKey
+
+        Return:
+        pydub sound object, None if not cached
+        """
+        memory_key = tuple(key)
+        with self.lock:
+            sound = self.entries.get(memory_key)
+            if sound is not None:
+                self.entries.move_to_end(memory_key)
+                self.hits += 1
+                return sound
+        if self.backing is not None:
+            sound = self.backing.get(key)
+            if sound is not None:
+                self._add(memory_key, sound)
+                return sound
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, sound):
+        """
+        Add a decoded window, to memory and the backing cache
+
+        Arguments:
+        key - as returned by windowKey
+        sound - pydub sound object
+        """
+        self._add(tuple(key), sound)
+        if self.backing is not None:
+            self.backing.put(key, sound)
+
+    def stats(self):
+        """
+        Hit, miss and eviction counts, including the backing cache's
+
+        Return:
+        Dictionary with hits, misses and evictions, and memory_hits and
+        memory_bytes for the windows held in memory
+        """
+        backing = self.backing.stats() if self.backing is not None else {
+            'hits': 0, 'misses': 0, 'evictions': 0}
+        with self.lock:
+            return {'hits': self.hits + backing['hits'], 'misses': self.misses,
+                    'evictions': self.evictions + backing['evictions'],
+                    'memory_hits': self.hits, 'memory_bytes': self.bytes}
@@ -0,0 +1,86 @@
+"""
+    MP3Tool
+
+    Probe.py: Read audio properties and ID3 tags of a file
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+from mutagen import MutagenError
+from mutagen.easyid3 import EasyID3
+from mutagen.id3 import ID3NoHeaderError
+from mutagen.mp3 import MP3
+from pydub.utils import mediainfo
+from common import Trace
+
+
+@Trace.traced
+def probeFile(path):
+    """
+    Read the audio properties and ID3 tags of a file
+
+    The MPEG header and ID3 tag are read by mutagen from a single open of
+    the file. ffprobe is only run for files mutagen can't parse.
+
+    Arguments:
+    path - path to audio file
+
+    Return:
+    Dictionary with duration (seconds), bit_rate, sample_rate, channels,
+    tagged (whether the file has any ID3 tags), title and artist
+    """
+    try:
+        audio = MP3(path, ID3=EasyID3)
+    except MutagenError:
+        return probeFileFFprobe(path)
+
+    tags = audio.tags if audio.tags is not None else {}
+    return {
+        'duration': audio.info.length,
+        'bit_rate': audio.info.bitrate or None,
+        'sample_rate': audio.info.sample_rate or None,
+        'channels': audio.info.channels or None,
+        'tagged': len(tags) > 0,
+        'title': tags.get('title', [None])[0],
+        'artist': tags.get('artist', [None])[0],
+    }
+
+
+def probeFileFFprobe(path):
+    """
+    Read the audio properties of a file with ffprobe, and its ID3 tags
+
+    Arguments:
+    path - path to audio file
+
+    Return:
+    Dictionary as returned by probeFile
+    """
+    mp3Info = mediainfo(path)
+    try:
+        tags = EasyID3(path)
+    except ID3NoHeaderError:
+        tags = {}
+
+    return {
+        'duration': float(mp3Info['duration']) if 'duration' in mp3Info else None,
+        'bit_rate': int(mp3Info['bit_rate']) if 'bit_rate' in mp3Info else None,
+        'sample_rate': int(mp3Info['sample_rate']) if 'sample_rate' in mp3Info else None,
+        'channels': int(mp3Info['channels']) if 'channels' in mp3Info else None,
+        'tagged': len(tags) > 0,
+        'title': tags.get('title', [None])[0],
+        'artist': tags.get('artist', [None])[0],
+    }
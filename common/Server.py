@@ -0,0 +1,242 @@
+"""
+    MP3Tool
+
+    Server.py: Local HTTP server creating clips on request
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import re
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+from common import AudioIO
+from common import Batch
+from common import Library
+from common.MP3ToolOptions import color
+
+
+# Tools that can be requested
+TOOLS = Library.TOOLS
+
+# Options a request may set, and how to read each from the request
+PARAMETERS = {
+    'song': str,
+    'duration': int,
+    'song_speed': float,
+    'preserve_pitch': lambda value: str(value).lower() in ("1", "true", "yes"),
+    'lossless_cut': lambda value: str(value).lower() in ("1", "true", "yes"),
+    'smart_windows': lambda value: str(value).lower() in ("1", "true", "yes"),
+    'decode_rate': int,
+    'decode_channels': int,
+    'renditions': str,
+    'mixes': int,
+    'song1': str,
+    'song2': str,
+    'song3': str,
+    'song1_vol': int,
+    'song2_vol': int,
+    'song3_vol': int,
+    'custom_output_file': str,
+    'force': lambda value: str(value).lower() in ("1", "true", "yes"),
+}
+
+# Parameters naming a song, read from the server's source folder
+SONG_PARAMETERS = ('song', 'song1', 'song2', 'song3')
+
+# Terminal colour codes of the tools' output, left out of the JSON log
+COLOR_CODES = re.compile("\x1b\\[[0-9;]*m")
+
+# Size of the in-memory decoded audio cache when not set, in MB
+SERVE_MEMORY_CACHE_MB = 512
+
+
+def checkPaths(source_folder, values):
+    """
+    Keep the files a request names inside the server's folders: songs
+    must be in the source folder, and a custom output file is a name only,
+    written to the tool's output folder
+
+    Songs are given their full path, so the tools read them as checked.
+
+    Arguments:
+    source_folder - source folder of the server, None if not set
+    values - option values from the request, changed in place
+
+    Return:
+    Error message, None if the paths are allowed
+    """
+    for name in SONG_PARAMETERS:
+        if values.get(name) is None:
+            continue
+        if not source_folder:
+            return f"Parameter {name} needs the server to be started with a source folder"
+        root = os.path.realpath(source_folder)
+        path = os.path.realpath(os.path.join(root, values[name]))
+        if os.path.commonpath([root, path]) != root:
+            return f"Parameter {name} must name a song in the source folder"
+        values[name] = path
+    if values.get('song') is not None:
+        values['source_folder'] = ""
+
+    output_file = values.get('custom_output_file')
+    if output_file is not None and (output_file in ("", ".", "..") or
+                                    "/" in output_file or "\\" in output_file):
+        return "Parameter custom_output_file must be a file name, without a folder"
+    return None
+
+
+def runTool(server, tool, parameters):
+    """
+    Run a tool for a request
+
+    Arguments:
+    server - ClipServer object
+    tool - name of the tool
+    parameters - dictionary of option values from the request
+
+    Return:
+    (HTTP status, result dictionary) tuple
+    """
+    values = {}
+    try:
+        for name, value in parameters.items():
+            if name not in PARAMETERS:
+                return 400, {'error': "Unknown parameter: " + name}
+            values[name] = PARAMETERS[name](value)
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    error = checkPaths(server.maker.defaults.get('source_folder'), values)
+    if error is not None:
+        return 400, {'error': error}
+
+    result = {'tool': tool, 'outputs': [], 'error': None}
+    status = 200
+    start = time.perf_counter()
+    try:
+        clip = server.maker.create(tool, **values)
+        result.update(outputs=clip.outputs, song=clip.song, log=COLOR_CODES.sub("", clip.log))
+    except Library.ClipError as e:
+        result.update(error=e.message, details=e.details, log=COLOR_CODES.sub("", e.log))
+        status = 400
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        status = 500
+    result['seconds'] = time.perf_counter() - start
+    return status, result
+
+
+class ClipRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles GET /<tool>?option=value&... and POST /<tool> with a JSON object
+    of options, plus GET /status
+    """
+
+    def sendJSON(self, status, result):
+        body = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self, parameters):
+        tool = urlparse(self.path).path.strip("/")
+        if tool == "status":
+            self.sendJSON(200, self.server.status())
+        elif tool in TOOLS:
+            self.sendJSON(*runTool(self.server, tool, parameters))
+        else:
+            self.sendJSON(404, {'error': "Unknown tool: " + tool,
+                                'tools': list(TOOLS)})
+
+    def do_GET(self):
+        self.handle_request(dict(parse_qsl(urlparse(self.path).query)))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            parameters = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.sendJSON(400, {'error': "Request body is not JSON"})
+            return
+        if not isinstance(parameters, dict):
+            self.sendJSON(400, {'error': "Request body must be a JSON object"})
+            return
+        self.handle_request(parameters)
+
+
+class ClipServer(ThreadingHTTPServer):
+    """
+    HTTP server keeping the catalog, file details and decoded audio in
+    memory between requests
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, catalog, option_values):
+        super().__init__(address, ClipRequestHandler)
+        self.maker = Library.ClipMaker(catalog, **option_values)
+        self.started = time.time()
+        self.requests = 0
+
+    def process_request(self, request, client_address):
+        self.requests += 1
+        super().process_request(request, client_address)
+
+    def status(self):
+        return {
+            'uptime': time.time() - self.started,
+            'requests': self.requests,
+            'tools': list(TOOLS),
+            'cache': AudioIO.cacheStats(),
+        }
+
+
+def serve(mp3Tool, options):
+    """
+    Run the clip server until interrupted
+
+    Arguments:
+    mp3Tool - MP3Tool object, whose catalog is shared by all requests
+    options - MP3ToolOptions class, defaults for the requests' options
+    """
+    print(color.BOLD + color.GREEN +
+          "Serve clips over HTTP." + color.END + "\n")
+    if options.memory_cache_mb is None:
+        options.memory_cache_mb = SERVE_MEMORY_CACHE_MB
+    values = Batch.optionValues(options)
+
+    # Load the library listing up front, so the first request is quick
+    if options.source_folder:
+        tracks = mp3Tool.catalog.listTracks(options.source_folder, options.rescan)
+        print("Library:\t" + color.BOLD + f"{len(tracks)} MP3s" + color.END)
+    # Rescanning is for startup only, not every request
+    values['rescan'] = False
+
+    server = ClipServer((options.serve_host, options.serve_port),
+                        mp3Tool.catalog, values)
+    print("Listening:\t" + color.BOLD +
+          f"http://{options.serve_host}:{server.server_address[1]}/" + color.END)
+    print("Tools:\t\t" + color.BOLD + ", ".join(TOOLS) + color.END)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
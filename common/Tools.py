@@ -0,0 +1,179 @@
+"""
+    MP3Tool
+
+    Tools.py: The tools of the command line and their arguments
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+# Only the standard library is imported here, the modules doing the work
+# (and with them pydub, mutagen and NumPy) are imported once a tool runs,
+# so --help and argument errors don't wait for them
+import importlib
+
+
+class Tool:
+    """
+    A tool that can be invoked from the command line
+
+    Arguments:
+    description - shown in the help
+    method - MP3Tool method running the tool, or
+    function - "module.function" running the tool, called with the MP3Tool
+               object and the MP3ToolOptions class
+    arguments - list of (flags, argparse keyword arguments) tuples, the
+                tool's own arguments
+    """
+
+    def __init__(self, description, method=None, function=None, arguments=()):
+        self.description = description
+        self.method = method
+        self.function = function
+        self.arguments = list(arguments)
+
+    def run(self, options):
+        """
+        Run the tool, importing what it needs
+
+        Arguments:
+        options - MP3ToolOptions class
+
+        Return:
+        Whatever the tool returns
+        """
+        mp3Tool = importlib.import_module("common.MP3Tool").MP3Tool(options)
+        if self.method is not None:
+            return getattr(mp3Tool, self.method)()
+        module, function = self.function.rsplit(".", 1)
+        return getattr(importlib.import_module(module), function)(mp3Tool, options)
+
+
+WINDOW_ARGUMENTS = [
+    (("-sw", "--smart_windows"), dict(
+        action="store_true",
+        help="Fit clip windows to each song and move them off silence, analysing the song once")),
+]
+
+LOSSLESS_ARGUMENTS = [
+    (("-lc", "--lossless_cut"), dict(
+        action="store_true",
+        help="Copy MP3 frames for intro/reveal clips, re-encoding only the fades")),
+]
+
+ENCODE_ARGUMENTS = [
+    (("-enc", "--encoder"), dict(
+        type=str, choices=["ffmpeg", "lame"],
+        help="MP3 encoder, lame (in-process, needs lameenc) default when installed, else ffmpeg")),
+    (("-eq", "--encode_quality"), dict(
+        type=int, choices=range(10), metavar="{0-9}",
+        help="LAME quality, 0 = best to 9 = fastest, 3 default")),
+    (("-ev", "--encode_vbr"), dict(
+        type=int, choices=range(10), metavar="{0-9}",
+        help="Encode with a variable bitrate of this LAME VBR quality, 0 = best to 9 = smallest")),
+    (("-ew", "--encode_workers"), dict(
+        type=int, help="Number of clips encoded at once, all default")),
+    (("-rd", "--renditions"), dict(
+        type=str,
+        help="Write each clip in these renditions, format[:bitrate[:frame rate]] comma "
+             "separated, e.g. mp3:320k,mp3:64k:22050,opus:48k. Formats: mp3, opus, ogg, aac")),
+]
+
+OUTPUT_ARGUMENTS = [
+    (("-fo", "--force"), dict(
+        action="store_true",
+        help="Make the clips again, even if made before from the same songs with the same options")),
+]
+
+SPEED_ARGUMENTS = [
+    (("-ss", "--song_speed"), dict(
+        type=float, default=2.0,
+        help="Song Speed, 1.0 = unchanged, < 0 = slower, > 0 = faster")),
+    (("-pp", "--preserve_pitch"), dict(
+        action="store_true",
+        help="Speed Change: keep the pitch of the song when changing its speed")),
+]
+
+MIX_ARGUMENTS = [
+    (("-mx", "--mixes"), dict(type=int, default=2, help="Num of songs to mix 2 or 3")),
+    (("-sv1", "--song1_vol"), dict(type=int, default=20, help="1st Song Volume")),
+    (("-sv2", "--song2_vol"), dict(type=int, default=20, help="2nd Song Volume")),
+    (("-sv3", "--song3_vol"), dict(type=int, default=20, help="3rd Song Volume")),
+    (("-dw", "--decode_workers"), dict(
+        type=int, help="Mix: number of songs decoded at once, all default")),
+]
+
+MIX_SELECTED_ARGUMENTS = [
+    (("-s1", "--song1"), dict(type=str, help="1st Song")),
+    (("-s2", "--song2"), dict(type=str, help="2nd Song")),
+    (("-s3", "--song3"), dict(type=str, help="3rd Song")),
+]
+
+BATCH_ARGUMENTS = [
+    (("-bt", "--batch_tools"), dict(
+        type=str, help="Batch: comma separated tools to run on each song, intro default")),
+    (("-bc", "--batch_count"), dict(
+        type=int, help="Batch: number of random songs, 10 default")),
+    (("-bs", "--batch_songs"), dict(
+        type=str, nargs="+", help="Batch: songs to use instead of random songs")),
+    (("-wk", "--workers"), dict(
+        type=int, help="Batch, Manifest, Analyse: number of workers, one per CPU default")),
+]
+
+MANIFEST_ARGUMENTS = [
+    (("-mf", "--manifest"), dict(
+        type=str, help="Manifest: JSON or YAML file listing the clips to create")),
+]
+
+SERVE_ARGUMENTS = [
+    (("-mcm", "--memory_cache_mb"), dict(
+        type=int, help="Size of the in-memory decoded audio cache in MB, serve: 512 default")),
+    (("-sh", "--serve_host"), dict(
+        type=str, help="Serve: address to listen on, 127.0.0.1 default")),
+    (("-sp", "--serve_port"), dict(
+        type=int, help="Serve: port to listen on, 8765 default")),
+]
+
+# Batch and serve run the other tools, so also take their arguments
+TOOLS = {
+    "intro": Tool("Intro clip of a song and its reveal",
+                  method="songIntro",
+                  arguments=WINDOW_ARGUMENTS + LOSSLESS_ARGUMENTS + ENCODE_ARGUMENTS +
+                  OUTPUT_ARGUMENTS),
+    "reverse": Tool("Reversed clip of a song and its reveal",
+                    method="songReverse",
+                    arguments=WINDOW_ARGUMENTS + LOSSLESS_ARGUMENTS + ENCODE_ARGUMENTS +
+                    OUTPUT_ARGUMENTS),
+    "speed_change": Tool("Speed changed clip of a song and its reveal",
+                         method="songSpeedChange",
+                         arguments=SPEED_ARGUMENTS + WINDOW_ARGUMENTS + LOSSLESS_ARGUMENTS +
+                         ENCODE_ARGUMENTS + OUTPUT_ARGUMENTS),
+    "mix": Tool("Mix of 2 or 3 random songs",
+                method="songMix",
+                arguments=MIX_ARGUMENTS + WINDOW_ARGUMENTS + ENCODE_ARGUMENTS + OUTPUT_ARGUMENTS),
+    "mix_selected": Tool("Mix of 2 or 3 chosen songs",
+                         method="songMixSelected",
+                         arguments=MIX_SELECTED_ARGUMENTS + MIX_ARGUMENTS + WINDOW_ARGUMENTS +
+                         ENCODE_ARGUMENTS + OUTPUT_ARGUMENTS),
+    "analyse": Tool("Measure the loudness of every song, used to set mix levels",
+                    function="common.Loudness.analyseLibrary"),
+    "batch": Tool("Many clips in parallel",
+                  function="common.Batch.runBatch", arguments=BATCH_ARGUMENTS),
+    "manifest": Tool("Clips listed in a JSON or YAML manifest, each song decoded once",
+                     function="common.Manifest.runManifest",
+                     arguments=MANIFEST_ARGUMENTS + BATCH_ARGUMENTS[-1:]),
+    "serve": Tool("Local HTTP server creating clips on request",
+                  function="common.Server.serve", arguments=SERVE_ARGUMENTS),
+}
@@ -0,0 +1,155 @@
+"""
+    MP3Tool
+
+    Trace.py: Timing of each stage, written as a Chrome trace
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import json
+import time
+import functools
+import threading
+
+
+# Events recorded, None when tracing is off so that spans cost only a check
+_events = None
+# Threads already named in the events, as (pid, tid)
+_threads = set()
+
+
+def enable():
+    """Start recording spans, if not already"""
+    global _events
+    if _events is None:
+        _events = []
+
+
+def enabled():
+    return _events is not None
+
+
+def _record(name, category, start_ns, args=None):
+    # Add a complete event, naming the thread the first time it is seen
+    end_ns = time.perf_counter_ns()
+    pid, tid = os.getpid(), threading.get_ident()
+    if (pid, tid) not in _threads:
+        _threads.add((pid, tid))
+        _events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                        'args': {'name': threading.current_thread().name}})
+    event = {'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': tid,
+             'ts': start_ns / 1000, 'dur': (end_ns - start_ns) / 1000}
+    if args:
+        event['args'] = args
+    _events.append(event)
+
+
+class span:
+    """
+    Time a block of code, e.g. with Trace.span("decode", song=path):
+
+    Arguments:
+    name - name of the span
+    category - category of the span
+    args - details shown with the span
+    """
+
+    __slots__ = ('name', 'category', 'args', 'start_ns')
+
+    def __init__(self, name, category="mp3tool", **args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start_ns = None
+
+    def __enter__(self):
+        if _events is not None:
+            self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start_ns is not None and _events is not None:
+            _record(self.name, self.category, self.start_ns, self.args)
+        return False
+
+
+def traced(function):
+    """Decorator timing each call of a function as a span"""
+    name = function.__qualname__
+    category = function.__module__.rsplit(".", 1)[-1]
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _events is None:
+            return function(*args, **kwargs)
+        start_ns = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _record(name, category, start_ns)
+    return wrapper
+
+
+def take():
+    """
+    Remove the events recorded so far, e.g. to pass them to another process
+
+    Return:
+    List of events, None when tracing is off
+    """
+    global _events
+    if _events is None:
+        return None
+    events, _events = _events, []
+    _threads.clear()
+    return events
+
+
+def extend(events):
+    """Add events recorded elsewhere, e.g. by a worker process"""
+    if _events is not None and events:
+        _events.extend(events)
+
+
+def summary():
+    """
+    Total time of each span name
+
+    Return:
+    List of (name, calls, total milliseconds), slowest first
+    """
+    totals = {}
+    for event in _events or []:
+        if event['ph'] == 'X':
+            calls, total = totals.get(event['name'], (0, 0))
+            totals[event['name']] = (calls + 1, total + event['dur'] / 1000)
+    return sorted(((name, calls, total) for name, (calls, total) in totals.items()),
+                  key=lambda item: -item[2])
+
+
+def write(path):
+    """
+    Write the events as a Chrome trace, for chrome://tracing or Perfetto
+
+    Arguments:
+    path - path of the JSON file
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({'traceEvents': _events or [], 'displayTimeUnit': 'ms'}, f)
@@ -22,7 +22,18 @@
 
 
 import os
+import re
+import sys
+import time
+import random
 import fnmatch
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from common import DSP
+
+
+# Folders listed at once when scanning, as listing a folder on a network
+# share mostly waits on the server
+SCAN_WORKERS = 8
 
 
 def getMsTime(t_hms):
@@ -83,15 +94,11 @@ def changeSongSpeed(sound, speed=1.0):
     Return:
     Modified dydub sound object
     """
-    # Manually override the frame_rate. This tells the computer how many
-    # samples to play per second
-    sound_with_altered_frame_rate = sound._spawn(sound.raw_data, overrides={
-        "frame_rate": int(sound.frame_rate * speed)
-    })
-    # convert the sound with altered frame rate to a standard frame rate
-    # so that regular playback programs will work right. They often only
-    # know how to play audio at standard frame rate (like 44.1k)
-    return sound_with_altered_frame_rate.set_frame_rate(sound.frame_rate)
+    # Play the samples at speed times the frame rate, then resample back to
+    # the original frame rate so that regular playback programs will work
+    # right. They often only know how to play audio at standard frame rate
+    # (like 44.1k)
+    return DSP.Sound.fromSegment(sound).changeSpeed(speed).toSegment()
 
 
 def findFiles(pattern, path):
@@ -105,12 +112,149 @@ def findFiles(pattern, path):
     Return:
     List of files matching pattern in path
     """
-    result = []
-    for root, dirs, files in os.walk(path):
-        for name in files:
-            if fnmatch.fnmatch(name, pattern):
-                result.append(os.path.join(root, name))
-    return result
+    return [file_path for file_path, size, mtime in scanFiles(pattern, path)]
+
+
+def listFolder(folder, match):
+    """
+    List a folder's matching files and its subfolders
+
+    Arguments:
+    folder - folder to list
+    match - function telling whether a (normcased) file name matches
+
+    Return:
+    (list of (path, size, mtime) tuples, list of subfolder paths) tuple,
+    both empty if the folder can't be read
+    """
+    files = []
+    folders = []
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        folders.append(entry.path)
+                    elif entry.is_file() and match(os.path.normcase(entry.name)):
+                        st = entry.stat()
+                        files.append((entry.path, st.st_size, st.st_mtime_ns))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return files, folders
+
+
+def scanFiles(pattern, path, workers=SCAN_WORKERS):
+    """
+    Find files matching pattern in path, with their size and modification time
+
+    Subfolders are listed concurrently by a pool of threads, and files are
+    yielded as each folder is listed, so the caller can stop early.
+
+    Arguments:
+    pattern - file pattern
+    path - path to search
+    workers - number of folders listed at once
+
+    Return:
+    Generator of (path, size, mtime) tuples for files matching pattern
+    """
+    match = re.compile(fnmatch.translate(os.path.normcase(pattern))).match
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        pending = {executor.submit(listFolder, path, match)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, folders = future.result()
+                # Keep the pool busy while the caller works on the files
+                for folder in folders:
+                    pending.add(executor.submit(listFolder, folder, match))
+                yield from files
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def sampleFiles(pattern, path, count, max_files=None, max_seconds=None,
+                workers=SCAN_WORKERS):
+    """
+    Pick random files matching pattern in path, by reservoir sampling the
+    scan, so the files found are never all held in memory
+
+    With a budget the scan stops once it is used up, and files are picked
+    from those found so far.
+
+    Arguments:
+    pattern - file pattern
+    path - path to search
+    count - number of files to pick
+    max_files - stop after finding this many files, None = no limit
+    max_seconds - stop after scanning for this long, None = no limit
+    workers - number of folders listed at once
+
+    Return:
+    List of file paths, in random order, fewer than count if too few found
+    """
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    picked = []
+    seen = 0
+    files = scanFiles(pattern, path, workers)
+    try:
+        for file_path, size, mtime in files:
+            seen += 1
+            if len(picked) < count:
+                picked.append(file_path)
+            else:
+                i = random.randrange(seen)
+                if i < count:
+                    picked[i] = file_path
+            if (max_files and seen >= max_files) or \
+                    (deadline is not None and time.monotonic() >= deadline):
+                break
+    finally:
+        files.close()
+    random.shuffle(picked)
+    return picked
+
+
+def peakMemoryMB():
+    """
+    Peak resident memory (RSS) of this process, and of the largest of its
+    child processes (ffmpeg, batch workers) that have finished
+
+    Return:
+    (process, children) tuple in MB, children None where not known
+    """
+    try:
+        import resource
+    except ImportError:
+        # Windows, the peak working set of this process
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + \
+                [(name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage",
+                    "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage",
+                    "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess
+        process.restype = wintypes.HANDLE
+        memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+        memory_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS),
+                                wintypes.DWORD]
+        if not memory_info(process(), ctypes.byref(counters), counters.cb):
+            return None, None
+        return counters.PeakWorkingSetSize / 2 ** 20, None
+
+    # ru_maxrss is in bytes on macOS, KB elsewhere
+    unit = 1 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2 ** 20,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 2 ** 20)
 
 
 def cls():
@@ -24,93 +24,128 @@
 import sys
 import os
 import argparse
-from common.MP3Tool import MP3Tool
+from common import Tools
+from common import Trace
+from common.Errors import ClipError
 from common.MP3ToolOptions import MP3ToolOptions
 from common.MP3ToolOptions import color
 
 
+# Lines of the profile and trace summaries shown
+PROFILE_LINES = 30
+TRACE_LINES = 15
+
+
 def parse_args():
     parser = argparse.ArgumentParser(description="MP3 Tool")
     if len(sys.argv) == 1:
         parser.format_help()
         parser.print_usage = parser.print_help
-    parser.add_argument("-tl", "--tool", type=str,
-                        required=True, help="Tool to invoke.")
+    parser.add_argument("-tl", "--tool", type=str, required=True,
+                        choices=list(Tools.TOOLS), metavar="TOOL",
+                        help="Tool to invoke: " + ", ".join(Tools.TOOLS))
     parser.add_argument("-sf", "--source_folder", type=str,
                         help="Folder to read from")
-    parser.add_argument("-dr", "--duration", type=str,
+    parser.add_argument("-dr", "--duration", type=int,
                         help="Duration of clip, 30 seconds default")
-    parser.add_argument("-mx", "--mixes", type=int,
-                        default=2, help="Num of songs to mix 2 or 3")
     parser.add_argument("-s", "--song", type=str, help="1st Song")
-    parser.add_argument("-s1", "--song1", type=str, help="1st Song")
-    parser.add_argument("-s2", "--song2", type=str, help="2nd Song")
-    parser.add_argument("-s3", "--song3", type=str, help="3rd Song")
-    parser.add_argument("-sv1", "--song1_vol", type=int,
-                        default=20, help="1st Song Volume")
-    parser.add_argument("-sv2", "--song2_vol", type=int,
-                        default=20, help="2nd Song Volume")
-    parser.add_argument("-sv3", "--song3_vol", type=int,
-                        default=20, help="3rd Song Volume")
-    parser.add_argument("-ss", "--song_speed", type=float,
-                        default=2.0, help="Song Speed, 1.0 = unchanged, < 0 = slower, > 0 = faster")
     parser.add_argument("-cof", "--custom_output_file",
                         type=str, default=None, help="Output Filename")
+    parser.add_argument("-rs", "--rescan", action="store_true",
+                        help="Rescan the source folder instead of using the library catalog")
+    parser.add_argument("-swk", "--scan_workers", type=int,
+                        help="Number of folders listed at once when scanning, 8 default")
+    parser.add_argument("-pmf", "--pick_max_files", type=int,
+                        help="Random picks from a folder due a scan: pick from the first N files found")
+    parser.add_argument("-pms", "--pick_max_seconds", type=float,
+                        help="Random picks from a folder due a scan: pick from the files found in N seconds")
+    parser.add_argument("-pcm", "--pcm_cache_mb", type=int,
+                        help="Size of the decoded audio cache in MB, 0 = no cache, 1024 default")
+    parser.add_argument("-pcf", "--pcm_cache_folder", type=str,
+                        help="Folder of the decoded audio cache")
+    parser.add_argument("-dra", "--decode_rate", type=int,
+                        help="Decode songs at this frame rate, e.g. 22050 for previews using less memory")
+    parser.add_argument("-dch", "--decode_channels", type=int, choices=[1, 2],
+                        help="Decode songs to this number of channels, 1 = mono")
+    parser.add_argument("-tj", "--trace_json", type=str,
+                        help="Write the time taken by each stage to a Chrome trace JSON file")
+    parser.add_argument("-pf", "--profile", action="store_true",
+                        help="Profile the run with cProfile and show the slowest functions")
+
+    # Each tool's own arguments, listed under the first tool using them.
+    # All are accepted whatever the tool, as batch, manifest and serve pass them on
+    added = set()
+    for name, tool in Tools.TOOLS.items():
+        group = parser.add_argument_group(f"{name}: {tool.description}")
+        for flags, kwargs in tool.arguments:
+            if flags[-1] not in added:
+                group.add_argument(*flags, **kwargs)
+                added.add(flags[-1])
     args = parser.parse_args()
 
-    # Required
-    MP3ToolOptions.tool = args.tool
+    # Arguments not given leave the option's default
+    for name, value in vars(args).items():
+        if value is not None:
+            setattr(MP3ToolOptions, name, value)
     if MP3ToolOptions.tool == "mix_selected":
         MP3ToolOptions.source_folder = None
-    else:
-        MP3ToolOptions.source_folder = args.source_folder
-
-    # Optional
-    if args.mixes is not None:
-        MP3ToolOptions.mixes = int(args.mixes)
-    if args.song is not None:
-        MP3ToolOptions.song = args.song
-    if args.song1 is not None:
-        MP3ToolOptions.song1 = args.song1
-    if args.song2 is not None:
-        MP3ToolOptions.song2 = args.song2
-    if args.song3 is not None:
-        MP3ToolOptions.song3 = args.song3
-    if args.song1_vol is not None:
-        MP3ToolOptions.song_vol = int(args.song1_vol)
-    if args.song2_vol is not None:
-        MP3ToolOptions.song2_vol = int(args.song2_vol)
-    if args.song3_vol is not None:
-        MP3ToolOptions.song3_vol = int(args.song3_vol)
-    if args.song_speed is not None:
-        MP3ToolOptions.song_speed = args.song_speed
-    if args.custom_output_file is not None:
-        MP3ToolOptions.custom_output_file = args.custom_output_file
-    if args.duration is not None:
-        MP3ToolOptions.duration = int(args.duration)
 
     return parser.parse_known_args()
 
 
+def run(tool):
+    # Run the tool, printing why it gave up and exiting if it did
+    try:
+        tool.run(MP3ToolOptions)
+    except ClipError as e:
+        print(e.message)
+        if e.details is not None:
+            print(e.details)
+        exit(1)
+
+
 def main():
-    # Parse args & initialise MP3Tool
+    # Parse args, then run the tool, which imports what it needs
     args, unknown = parse_args()
-    mp3Tool = MP3Tool(MP3ToolOptions)
     MP3ToolOptions.mp3tool_folder = os.path.dirname(os.path.realpath(__file__))
-
-    # What tool are we running?
-    if MP3ToolOptions.tool == "reverse":
-        mp3Tool.songReverse()
-    elif MP3ToolOptions.tool == "intro":
-        mp3Tool.songIntro()
-    elif MP3ToolOptions.tool == "speed_change":
-        mp3Tool.songSpeedChange()
-    elif MP3ToolOptions.tool == "mix":
-        mp3Tool.songMix()
-    elif MP3ToolOptions.tool == "mix_selected":
-        mp3Tool.songMixSelected()
-    else:
-        print("Unknown tool.")
+    tool = Tools.TOOLS[MP3ToolOptions.tool]
+    if MP3ToolOptions.trace_json:
+        Trace.enable()
+    try:
+        if MP3ToolOptions.profile:
+            import cProfile
+            import pstats
+            profiler = cProfile.Profile()
+            try:
+                profiler.runcall(run, tool)
+            finally:
+                print("\n" + color.BOLD + "Profile:" + color.END)
+                pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        else:
+            run(tool)
+    finally:
+        # Also written when the tool aborts, to see how far it got
+        if MP3ToolOptions.trace_json:
+            Trace.write(MP3ToolOptions.trace_json)
+            print("\n" + color.BOLD + "Stages:" + color.END)
+            for name, calls, total in Trace.summary()[:TRACE_LINES]:
+                print(f"{total:10.1f} ms  {calls:4d} x  {name}")
+            print("Trace:\t\t\t" + color.BOLD + MP3ToolOptions.trace_json + color.END)
+
+    if MP3ToolOptions.tool not in ("batch", "manifest", "serve", "analyse"):
+        from common import AudioIO
+        stats = AudioIO.cacheStats()
+        if stats is not None:
+            print("Decode Cache:\t\t" + color.BOLD +
+                  f"{stats['hits']} hits, {stats['misses']} misses" + color.END)
+
+    from common import Utils
+    process, children = Utils.peakMemoryMB()
+    if process is not None:
+        peak = f"{process:.0f} MB"
+        if children:
+            peak += f", child processes {children:.0f} MB"
+        print("Peak Memory:\t\t" + color.BOLD + peak + color.END)
 
 
 if __name__ == "__main__":
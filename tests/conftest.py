@@ -0,0 +1,66 @@
+"""
+    MP3Tool
+
+    conftest.py: Shared setup of the tests
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import sys
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+import corpus
+
+
+def makeSound(seconds=2, frame_rate=44100, channels=2, frequency=None, seed=0):
+    """
+    Sound to test with, as a pydub sound object
+
+    Arguments:
+    seconds - length
+    frame_rate - frame rate
+    channels - number of channels
+    frequency - frequency of a sine tone, None = seeded noise
+
+    Return:
+    pydub sound object of 16 bit samples
+    """
+    count = int(seconds * frame_rate)
+    if frequency is None:
+        samples = np.random.default_rng(seed).normal(0, 4000, (count, channels))
+    else:
+        tone = 10000 * np.sin(2 * np.pi * frequency * np.arange(count) / frame_rate)
+        samples = np.repeat(tone[:, None], channels, axis=1)
+    return AudioSegment(data=np.clip(samples, -32768, 32767).astype(np.int16).tobytes(),
+                        sample_width=2, frame_rate=frame_rate, channels=channels)
+
+
+@pytest.fixture
+def sound():
+    """Two seconds of stereo noise at 44.1 kHz"""
+    return makeSound()
+
+
+@pytest.fixture(scope="session")
+def corpus_paths(request):
+    """Paths to the benchmark corpus, kept in pytest's cache between runs"""
+    return corpus.makeCorpus(str(request.config.cache.mkdir("corpus")))
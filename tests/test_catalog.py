@@ -0,0 +1,90 @@
+"""
+    MP3Tool
+
+    test_catalog.py: Tests of the catalog of source folders on the benchmark corpus
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import shutil
+import pytest
+import corpus
+from common import Catalog
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    """Empty catalog, closed after the test"""
+    catalog = Catalog.Catalog(str(tmp_path / "catalog.db"), workers=4)
+    yield catalog
+    catalog.close()
+
+
+@pytest.fixture
+def corpus_folder(corpus_paths, tmp_path):
+    """Copy of the corpus the test may change"""
+    folder = tmp_path / "corpus"
+    for path in corpus_paths:
+        (folder / os.path.basename(os.path.dirname(path))).mkdir(parents=True, exist_ok=True)
+        shutil.copy(path, folder / os.path.basename(os.path.dirname(path)))
+    return str(folder)
+
+
+def test_list_tracks(catalog, corpus_paths):
+    folder = os.path.dirname(os.path.dirname(corpus_paths[0]))
+    assert sorted(catalog.listTracks(folder)) == sorted(os.path.abspath(path) for path in corpus_paths)
+    cbr = [path for path in corpus_paths if os.sep + "cbr" + os.sep in path]
+    assert sorted(catalog.listTracks(os.path.join(folder, "cbr"))) == sorted(cbr)
+    assert not catalog.needsScan(folder)
+
+
+def test_random_tracks(catalog, corpus_paths):
+    folder = os.path.dirname(os.path.dirname(corpus_paths[0]))
+    for count in range(1, len(corpus_paths) + 2):
+        picked = catalog.randomTracks(folder, count)
+        assert len(picked) == min(count, len(corpus_paths))
+        assert len(set(picked)) == len(picked)
+        assert set(picked) <= set(corpus_paths)
+
+
+def test_random_tracks_within_budget(catalog, corpus_paths):
+    folder = os.path.dirname(os.path.dirname(corpus_paths[0]))
+    picked = catalog.randomTracks(folder, 2, max_files=3)
+    assert len(picked) == 2
+    assert set(picked) <= set(corpus_paths)
+    # Picking within a budget leaves the folder unscanned
+    assert catalog.needsScan(folder)
+
+
+def test_gone_and_new_tracks(catalog, corpus_folder):
+    paths = catalog.listTracks(corpus_folder)
+    os.remove(paths[0])
+    assert paths[0] not in catalog.randomTracks(corpus_folder, len(paths))
+    assert paths[0] not in catalog.listTracks(corpus_folder)
+    shutil.copy(paths[1], os.path.join(corpus_folder, "new.mp3"))
+    assert len(catalog.listTracks(corpus_folder)) == len(paths) - 1
+    assert len(catalog.listTracks(corpus_folder, rescan=True)) == len(paths)
+
+
+def test_get_info(catalog, corpus_paths):
+    for spec, path in zip(corpus.CORPUS, corpus_paths):
+        name, source, seconds, frame_rate, channels, encoding = spec
+        info = catalog.getInfo(path)
+        assert (info['sample_rate'], info['channels']) == (frame_rate, channels)
+        assert abs(info['duration'] - seconds) < 0.1
+        assert info['tagged'] and info['artist'] == "MP3Tool Benchmark"
+        assert catalog.getInfo(path) is info
@@ -0,0 +1,99 @@
+"""
+    MP3Tool
+
+    test_dsp.py: Tests of the NumPy sound processing against pydub's
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import numpy as np
+import pytest
+from conftest import makeSound
+from common import DSP
+
+# Largest sample difference from pydub's fades, which step once a
+# millisecond where DSP's ramp every sample
+FADE_TOLERANCE = 64
+
+
+def samples(sound):
+    """Samples of a pydub sound object, as ints"""
+    return np.frombuffer(sound.raw_data, np.int16).astype(np.int32)
+
+
+def test_fade_in(sound):
+    expected = samples(sound.fade_in(500))
+    result = samples(DSP.Sound.fromSegment(sound).fadeIn(500).toSegment())
+    assert len(result) == len(expected)
+    assert np.abs(result - expected).max() <= FADE_TOLERANCE
+
+
+def test_fade_out(sound):
+    expected = samples(sound.fade_out(500))
+    result = samples(DSP.Sound.fromSegment(sound).fadeOut(500).toSegment())
+    assert len(result) == len(expected)
+    assert np.abs(result - expected).max() <= FADE_TOLERANCE
+
+
+def test_reverse_mono():
+    sound = makeSound(channels=1)
+    result = DSP.Sound.fromSegment(sound).reverse().toSegment()
+    assert np.array_equal(samples(result), samples(sound.reverse()))
+
+
+def test_reverse_stereo_keeps_channels(sound):
+    # pydub reverses the bytes of stereo sound, swapping its channels
+    result = samples(DSP.Sound.fromSegment(sound).reverse().toSegment()).reshape(-1, 2)
+    assert np.array_equal(result, samples(sound).reshape(-1, 2)[::-1])
+
+
+def test_overlay(sound):
+    other = makeSound(seed=1)
+    result = DSP.Sound.fromSegment(sound).overlay(DSP.Sound.fromSegment(other)).toSegment()
+    assert np.array_equal(samples(result), samples(sound.overlay(other)))
+
+
+def test_apply_gain(sound):
+    result = DSP.Sound.fromSegment(sound).applyGain(-6).toSegment()
+    assert np.abs(samples(result) - samples(sound.apply_gain(-6))).max() <= 1
+    assert abs(DSP.Sound.fromSegment(sound).dBFS() - sound.dBFS) < 0.01
+
+
+def peakFrequency(sound):
+    """Strongest frequency of a DSP.Sound object, in Hz"""
+    mono = sound.samples.mean(axis=1)
+    spectrum = np.abs(np.fft.rfft(mono * np.hanning(len(mono))))
+    return np.argmax(spectrum) * sound.frame_rate / len(mono)
+
+
+@pytest.mark.parametrize("speed", [0.5, 1.5, 2])
+def test_change_speed(speed):
+    sound = DSP.Sound.fromSegment(makeSound(frequency=1000))
+    length = len(sound.samples)
+    result = sound.changeSpeed(speed)
+    assert result.frame_rate == 44100
+    assert abs(len(result.samples) - length / speed) <= 1
+    assert abs(peakFrequency(result) - 1000 * speed) < 5
+
+
+@pytest.mark.parametrize("speed", [0.5, 1.5, 2])
+def test_time_stretch(speed):
+    sound = DSP.Sound.fromSegment(makeSound(frequency=1000))
+    length = len(sound.samples)
+    result = sound.timeStretch(speed)
+    assert result.frame_rate == 44100
+    assert abs(len(result.samples) - length / speed) <= 1
+    assert abs(peakFrequency(result) - 1000) < 5
@@ -0,0 +1,80 @@
+"""
+    MP3Tool
+
+    test_encoders.py: Tests of the MP3 encoders and renditions
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import pytest
+import mutagen
+from mutagen.mp3 import MP3
+from common import Encoders
+
+
+@pytest.mark.parametrize("name", Encoders.ENCODERS)
+def test_encode_keeps_frame_rate(tmp_path, sound, name):
+    # LAME left to itself writes 64k at 24 kHz
+    if name == "lame" and Encoders.lameenc is None:
+        pytest.skip("lameenc not installed")
+    path = str(tmp_path / "clip.mp3")
+    Encoders.getEncoder(name).encode(sound, path, "64k")
+    assert MP3(path).info.sample_rate == 44100
+
+
+@pytest.mark.parametrize("name", Encoders.ENCODERS)
+def test_encode_frame_rate(tmp_path, sound, name):
+    if name == "lame" and Encoders.lameenc is None:
+        pytest.skip("lameenc not installed")
+    path = str(tmp_path / "clip.mp3")
+    Encoders.getEncoder(name).encode(sound, path, "64k", frame_rate=22050)
+    assert MP3(path).info.sample_rate == 22050
+
+
+def test_parse_renditions():
+    renditions = Encoders.parseRenditions("mp3:320k, MP3:64k:22050,opus:48k,ogg::32000")
+    assert [(rendition.format, rendition.bitrate, rendition.frame_rate)
+            for rendition in renditions] == \
+        [("mp3", "320k", None), ("mp3", "64k", 22050), ("opus", "48k", None), ("ogg", None, 32000)]
+    assert [rendition.path("song_Clip.mp3") for rendition in renditions] == \
+        ["song_Clip_320k.mp3", "song_Clip_64k_22050.mp3", "song_Clip_48k.opus", "song_Clip_32000.ogg"]
+
+
+@pytest.mark.parametrize("text", [None, ""])
+def test_parse_no_renditions(text):
+    renditions = Encoders.parseRenditions(text)
+    assert [(rendition.format, rendition.bitrate, rendition.frame_rate)
+            for rendition in renditions] == [("mp3", None, None)]
+    assert renditions[0].path("song_Clip.mp3") == "song_Clip.mp3"
+
+
+@pytest.mark.parametrize("text", ["wav", "mp3:64k:22050:1", "mp3:0k", "mp3:-64k", "mp3:fast",
+                                  "mp3:64k:0", "mp3:64k:22.05k", "mp3:64k,mp3:64000"])
+def test_parse_invalid_renditions(text):
+    with pytest.raises(ValueError):
+        Encoders.parseRenditions(text)
+
+
+@pytest.mark.parametrize("name", Encoders.ENCODERS)
+def test_encode_renditions(tmp_path, sound, name):
+    if name == "lame" and Encoders.lameenc is None:
+        pytest.skip("lameenc not installed")
+    encoder = Encoders.getEncoder(name)
+    for rendition, frame_rate in zip(Encoders.parseRenditions("mp3:64k,mp3:64k:22050,ogg:96k:32000,aac:96k"),
+                                     (44100, 22050, 32000, 44100)):
+        path = rendition.path(str(tmp_path / "song_Clip.mp3"))
+        rendition.encode(encoder, sound, path)
+        assert mutagen.File(path).info.sample_rate == frame_rate
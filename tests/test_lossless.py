@@ -0,0 +1,71 @@
+"""
+    MP3Tool
+
+    test_lossless.py: Tests of frame indexes and lossless cuts on the benchmark corpus
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import subprocess
+import numpy as np
+import pytest
+from mutagen.mp3 import MP3
+import corpus
+from common import FrameIndex, LosslessCut
+
+# Clips cut: start and end, fade in and fade out, in milliseconds
+CUTS = [(2000, 6000, 0, 0), (1234, 4321, 500, 500)]
+
+
+def decode(path, channels):
+    """Samples of an MP3 file decoded by ffmpeg, one row per frame"""
+    process = subprocess.run(["ffmpeg", "-nostdin", "-v", "error", "-i", path, "-f", "s16le", "-"],
+                             stdout=subprocess.PIPE, check=True)
+    return np.frombuffer(process.stdout, np.int16).reshape(-1, channels).astype(np.int32)
+
+
+@pytest.fixture(scope="module", params=range(len(corpus.CORPUS)), ids=[spec[0] for spec in corpus.CORPUS])
+def source(request, corpus_paths):
+    """Path, frame index and decoded samples of a corpus file"""
+    path = corpus_paths[request.param]
+    with open(path, "rb") as f:
+        index = FrameIndex.FrameIndex.build(f.read())
+    return path, index, decode(path, index.channels)
+
+
+def test_build(source):
+    path, index, samples = source
+    info = MP3(path).info
+    assert index.sample_rate == info.sample_rate
+    assert index.channels == info.channels
+    assert index.delay == FrameIndex.LAME_ENCODER_DELAY + FrameIndex.DECODER_DELAY
+    # The last frame's padding is all that's decoded past the end
+    end = index.frameSample(len(index))
+    assert end - index.samples_per_frame < len(samples) <= end
+
+
+@pytest.mark.parametrize("start_ms, end_ms, fade_in, fade_out", CUTS)
+def test_cut_clip(source, tmp_path, start_ms, end_ms, fade_in, fade_out):
+    path, index, samples = source
+    out_path = str(tmp_path / "clip.mp3")
+    assert LosslessCut.cutClip(path, out_path, start_ms, end_ms, fade_in, fade_out)
+    clip = decode(out_path, index.channels)
+    start = start_ms * index.sample_rate // 1000
+    assert len(clip) == end_ms * index.sample_rate // 1000 - start
+    # Copied frames decode to the source's samples, unshifted
+    middle = len(clip) // 2
+    assert np.array_equal(clip[middle - 1000:middle + 1000],
+                          samples[start + middle - 1000:start + middle + 1000])
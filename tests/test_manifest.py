@@ -0,0 +1,107 @@
+"""
+    MP3Tool
+
+    test_manifest.py: Tests of reading and checking manifests
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import json
+import pytest
+from common import Manifest
+
+MANIFEST = {
+    'defaults': {'source_folder': "C:\\music\\", 'duration': 25},
+    'clips': [
+        {'song': "song1.mp3", 'tools': ["intro", "reverse", "speed_change"], 'song_speed': 1.5},
+        {'tools': "intro, reverse"},
+        {'song': "song2.mp3", 'tool': "speed_change", 'song_speed': 0.8, 'preserve_pitch': True},
+    ],
+}
+
+YAML_MANIFEST = """\
+defaults:
+  source_folder: 'C:\\music\\'
+  duration: 25
+clips:
+  - song: song1.mp3
+    tools: [intro, reverse, speed_change]
+    song_speed: 1.5
+  - tools: intro, reverse
+  - song: song2.mp3
+    tool: speed_change
+    song_speed: 0.8
+    preserve_pitch: true
+"""
+
+CLIPS = [
+    (["intro", "reverse", "speed_change"], {'song': "song1.mp3", 'song_speed': 1.5}),
+    (["intro", "reverse"], {}),
+    (["speed_change"], {'song': "song2.mp3", 'song_speed': 0.8, 'preserve_pitch': True}),
+]
+
+
+def writeManifest(tmp_path, manifest, name="manifest.json"):
+    """Write a manifest as JSON, returning its path"""
+    path = tmp_path / name
+    path.write_text(json.dumps(manifest), encoding="utf-8")
+    return str(path)
+
+
+def test_load_json(tmp_path):
+    defaults, clips = Manifest.loadManifest(writeManifest(tmp_path, MANIFEST))
+    assert defaults == MANIFEST['defaults']
+    assert clips == CLIPS
+
+
+@pytest.mark.skipif(Manifest.yaml is None, reason="needs PyYAML")
+@pytest.mark.parametrize("name", ["manifest.yaml", "MANIFEST.YML"])
+def test_load_yaml(tmp_path, name):
+    path = tmp_path / name
+    path.write_text(YAML_MANIFEST, encoding="utf-8")
+    defaults, clips = Manifest.loadManifest(str(path))
+    assert defaults == MANIFEST['defaults']
+    assert clips == CLIPS
+
+
+def test_no_defaults(tmp_path):
+    defaults, clips = Manifest.loadManifest(writeManifest(tmp_path, {'clips': [{'tool': "intro"}]}))
+    assert defaults == {}
+    assert clips == [(["intro"], {})]
+
+
+@pytest.mark.parametrize("manifest, message", [
+    ([], "Manifest must have a list of clips"),
+    ({'clips': []}, "Manifest has no clips"),
+    ({'defaults': ["duration"], 'clips': [{'tool': "intro"}]}, "Manifest defaults must be a mapping"),
+    ({'defaults': {'durration': 25}, 'clips': [{'tool': "intro"}]},
+     "Manifest defaults: unknown option durration"),
+    ({'clips': ["intro"]}, "Manifest clip 1 must be a mapping"),
+    ({'clips': [{'tool': "intro"}, {'song': "song.mp3"}]}, "Manifest clip 2 has no tool"),
+    ({'clips': [{'tool': "mix"}]}, "Manifest clip 1: unknown tool mix"),
+    ({'clips': [{'tool': "intro", 'manifest': "other.json"}]}, "Manifest clip 1: unknown option manifest"),
+    ({'clips': [{'tool': "intro", '_trace': True}]}, "Manifest clip 1: unknown option _trace"),
+])
+def test_invalid(tmp_path, manifest, message):
+    with pytest.raises(ValueError, match=message):
+        Manifest.loadManifest(writeManifest(tmp_path, manifest))
+
+
+def test_invalid_json(tmp_path):
+    path = tmp_path / "manifest.json"
+    path.write_text("{'clips': ", encoding="utf-8")
+    with pytest.raises(ValueError):
+        Manifest.loadManifest(str(path))
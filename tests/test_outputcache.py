@@ -0,0 +1,140 @@
+"""
+    MP3Tool
+
+    test_outputcache.py: Tests of finding clips made before
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import time
+import threading
+import pytest
+from common import Library
+from common import OutputCache
+
+# A value of each output option other than its default
+CHANGED = {
+    'duration': 20,
+    'song_speed': 1.5,
+    'preserve_pitch': True,
+    'smart_windows': True,
+    'lossless_cut': True,
+    'decode_rate': 22050,
+    'decode_channels': 1,
+    'encode_quality': 0,
+    'encode_vbr': 4,
+    'renditions': "mp3:64k",
+    'mixes': 3,
+    'song1_vol': 5,
+    'song2_vol': 5,
+    'song3_vol': 5,
+    'custom_output_file': "clip",
+}
+
+
+@pytest.fixture
+def song(tmp_path):
+    """Path of a song file"""
+    path = tmp_path / "song.mp3"
+    path.write_bytes(b"song")
+    return str(path)
+
+
+def makeKey(song, method="songIntro", encoder="ffmpeg", **values):
+    """Job key of a tool run on a song, with options changed from the defaults"""
+    return OutputCache.jobKey(method, [song], Library.makeOptions(**values), encoder)
+
+
+def test_output_options_changed():
+    assert sorted(CHANGED) == sorted(OutputCache.OUTPUT_OPTIONS)
+
+
+def test_job_key_stable(song):
+    assert makeKey(song) == makeKey(song)
+
+
+@pytest.mark.parametrize("name", OutputCache.OUTPUT_OPTIONS)
+def test_job_key_output_option(song, name):
+    assert makeKey(song, **{name: CHANGED[name]}) != makeKey(song)
+
+
+@pytest.mark.parametrize("name, value", [("source_folder", "/tmp/"), ("workers", 4),
+                                         ("force", True), ("trace_json", "trace.json")])
+def test_job_key_other_option(song, name, value):
+    assert makeKey(song, **{name: value}) == makeKey(song)
+
+
+def test_job_key_job(song, tmp_path):
+    key = makeKey(song)
+    assert makeKey(song, method="songReverse") != key
+    assert makeKey(song, encoder="lame") != key
+    other = tmp_path / "other.mp3"
+    other.write_bytes(b"song")
+    assert makeKey(str(other)) != key
+    os.utime(song, ns=(1_000_000_000, 1_000_000_000))
+    assert makeKey(song) != key
+
+
+def test_store_find(song, tmp_path):
+    folder = str(tmp_path / "intro") + os.sep
+    os.makedirs(folder)
+    clips = [folder + "song_Clip.mp3", folder + "song_Reveal.mp3"]
+    for clip in clips:
+        with open(clip, "wb") as f:
+            f.write(b"clip")
+    key = makeKey(song)
+    assert OutputCache.findOutputs(folder, key) is None
+    OutputCache.storeOutputs(folder, key, "songIntro", clips)
+    assert OutputCache.findOutputs(folder, key) == clips
+
+    # Another job writing the same clips replaces the first's entry
+    other_key = makeKey(song, duration=20)
+    OutputCache.storeOutputs(folder, other_key, "songIntro", clips)
+    assert OutputCache.findOutputs(folder, key) is None
+    assert OutputCache.findOutputs(folder, other_key) == clips
+
+    # Clips changed since are made again
+    os.remove(clips[1])
+    assert OutputCache.findOutputs(folder, other_key) is None
+
+
+def test_output_lock(tmp_path):
+    order = []
+
+    def make(name):
+        with OutputCache.outputLock(str(tmp_path), "song"):
+            order.append(name + " start")
+            started.set()
+            release.wait(5)
+            order.append(name + " end")
+
+    started = threading.Event()
+    release = threading.Event()
+    first = threading.Thread(target=make, args=("first",))
+    second = threading.Thread(target=make, args=("second",))
+    first.start()
+    started.wait(5)
+    second.start()
+    time.sleep(0.1)
+    # A different name isn't held up
+    with OutputCache.outputLock(str(tmp_path), "other"):
+        pass
+    release.set()
+    first.join()
+    second.join()
+    assert order == ["first start", "first end", "second start", "second end"]
+    assert OutputCache._output_locks == {}
@@ -0,0 +1,79 @@
+"""
+    MP3Tool
+
+    test_pcmcache.py: Tests of the cache of decoded audio
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import threading
+from conftest import makeSound
+from common import PCMCache
+
+
+def makeKey(tmp_path, start_ms):
+    """Key of a window of a song file made in tmp_path"""
+    path = tmp_path / "song.mp3"
+    path.write_bytes(b"song")
+    return PCMCache.windowKey(str(path), start_ms, start_ms + 1000)
+
+
+def setUsed(cache, key, mtime_ns):
+    """Set when an entry was last used"""
+    os.utime(cache._path(key) + ".pcm", ns=(mtime_ns, mtime_ns))
+
+
+def test_put_get(tmp_path, sound):
+    cache = PCMCache.PCMCache(str(tmp_path / "cache"), 1 << 24)
+    key = makeKey(tmp_path, 0)
+    assert cache.get(key) is None
+    cache.put(key, sound)
+    result = cache.get(key)
+    assert (result.frame_rate, result.channels, result.sample_width) == (44100, 2, 2)
+    assert bytes(result.raw_data) == sound.raw_data
+    assert cache.get(makeKey(tmp_path, 1000)) is None
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'evictions': 0}
+
+
+def test_evict_least_recently_used(tmp_path):
+    sound = makeSound(seconds=1)
+    cache = PCMCache.PCMCache(str(tmp_path / "cache"), len(sound.raw_data) * 5 // 2)
+    keys = [makeKey(tmp_path, start_ms) for start_ms in (0, 1000, 2000)]
+    cache.put(keys[0], sound)
+    cache.put(keys[1], sound)
+    setUsed(cache, keys[0], 1_000_000_000)
+    setUsed(cache, keys[1], 2_000_000_000)
+    # Using the first makes the second the least recently used
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[2], sound)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+    assert cache.stats()['evictions'] == 1
+    assert sorted(name.split(".")[-1] for name in os.listdir(cache.folder)) == ["json", "json", "pcm", "pcm"]
+
+
+def test_put_from_threads(tmp_path, sound):
+    cache = PCMCache.PCMCache(str(tmp_path / "cache"), 1 << 24)
+    key = makeKey(tmp_path, 0)
+    threads = [threading.Thread(target=cache.put, args=(key, sound)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert bytes(cache.get(key).raw_data) == sound.raw_data
+    assert not [name for name in os.listdir(cache.folder) if name.endswith(".tmp")]
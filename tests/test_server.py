@@ -0,0 +1,66 @@
+"""
+    MP3Tool
+
+    test_server.py: Tests of the checks on the paths clip requests name
+
+    Copyright 2022 by Brian M McGarvie (brian@mcgarvie.net)
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    https://choosealicense.com/licenses/apache-2.0/
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+
+import os
+import pytest
+from common import Server
+
+
+@pytest.fixture
+def source_folder(tmp_path):
+    """Source folder holding sub/song.mp3"""
+    (tmp_path / "music" / "sub").mkdir(parents=True)
+    (tmp_path / "music" / "sub" / "song.mp3").write_bytes(b"song")
+    return str(tmp_path / "music")
+
+
+def test_song_in_source_folder(source_folder):
+    values = {'song': "sub/song.mp3", 'source_folder': source_folder}
+    assert Server.checkPaths(source_folder, values) is None
+    assert values['song'] == os.path.join(os.path.realpath(source_folder), "sub", "song.mp3")
+    assert values['source_folder'] == ""
+
+
+@pytest.mark.parametrize("song", ["../song.mp3", "sub/../../song.mp3", "/etc/passwd"])
+def test_song_outside_source_folder(source_folder, song):
+    for name in Server.SONG_PARAMETERS:
+        values = {name: song}
+        assert Server.checkPaths(source_folder, values) ==             f"Parameter {name} must name a song in the source folder"
+        assert values[name] == song
+
+
+def test_song_linked_outside_source_folder(source_folder, tmp_path):
+    (tmp_path / "secret.mp3").write_bytes(b"secret")
+    os.symlink(tmp_path / "secret.mp3", os.path.join(source_folder, "link.mp3"))
+    assert Server.checkPaths(source_folder, {'song': "link.mp3"}) is not None
+
+
+def test_song_without_source_folder():
+    assert Server.checkPaths(None, {'song': "song.mp3"}) is not None
+
+
+@pytest.mark.parametrize("output_file", ["", ".", "..", "../clip", "/tmp/clip", "sub\\clip"])
+def test_output_file_with_folder(source_folder, output_file):
+    assert Server.checkPaths(source_folder, {'custom_output_file': output_file}) ==         "Parameter custom_output_file must be a file name, without a folder"
+
+
+def test_output_file_name(source_folder):
+    assert Server.checkPaths(source_folder, {'custom_output_file': "clip"}) is None